@@ -0,0 +1,130 @@
+import argparse
+import json
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any
+from unittest.mock import MagicMock
+
+import requests
+
+from enums import Region
+from traininfo.sources.baseclient import BaseTrainInfoClient
+from traininfo.sources.decoder import JSONDecoder, available_backends
+from traininfo.sources.nhk import NHKClient
+from traininfo.sources.yahoo import YahooClient
+
+from .payloads import PayloadGenerator, parse_weights
+from .pipeline import format_report, git_commit, percentiles, save_result
+
+
+def _variants(client: BaseTrainInfoClient) -> dict[str, Any]:
+    # r.json()による従来の方法と、インストールされている実装ごとのデコード
+    variants: dict[str, Any] = {}
+    for backend in available_backends():
+        variants[backend] = JSONDecoder(backend=backend).decode
+        if backend == "msgspec" and client.SCHEMA is not None:
+            variants["msgspec_schema"] = JSONDecoder(client.SCHEMA, backend).decode
+    return variants
+
+
+def _response_json(content: bytes) -> Any:
+    response = requests.Response()
+    response._content = content
+    return response.json()
+
+
+def run_decoding(
+    source: str = "nhk",
+    lines: int = 20_000,
+    weights: dict[str, float] | None = None,
+    detail_length: int = 120,
+    cycles: int = 20,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    生成した大きな応答を、r.json()と各実装でデコードして解析するまでの時間を計測する。
+
+    Returns
+    -------
+    dict[str, Any]
+        pipelineの結果と同じ形式の計測結果。ステージ名は"<実装>_decode_ms"と"<実装>_parse_ms"
+    """
+    generator = PayloadGenerator(
+        lines=lines, weights=weights, detail_length=detail_length, seed=seed
+    )
+    client: BaseTrainInfoClient = (
+        YahooClient(MagicMock(), Region.KANTO, yahoo_app_id="benchmark")
+        if source == "yahoo"
+        else NHKClient(MagicMock(), Region.KANTO)
+    )
+    payload = getattr(generator, source)()
+    content = json.dumps(payload, ensure_ascii=False).encode()
+    variants = {"response_json": _response_json, **_variants(client)}
+    expected = client._parse(payload)
+
+    samples: dict[str, list[float]] = {}
+    for _ in range(cycles):
+        for name, decode in variants.items():
+            started_at = perf_counter()
+            raw = decode(content)
+            decoded_at = perf_counter()
+            parsed = client._parse(raw)
+            parsed_at = perf_counter()
+            assert parsed == expected, name
+            samples.setdefault(f"{name}_decode_ms", []).append(
+                (decoded_at - started_at) * 1000
+            )
+            samples.setdefault(f"{name}_parse_ms", []).append(
+                (parsed_at - decoded_at) * 1000
+            )
+
+    elapsed = sum(sum(values) for values in samples.values()) / 1000
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            "source": source,
+            "lines": lines,
+            "weights": weights,
+            "detail_length": detail_length,
+            "seed": seed,
+        },
+        "cycles": cycles,
+        "elapsed": round(elapsed, 3),
+        "cycles_per_sec": round(cycles / elapsed, 3) if elapsed else 0.0,
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "counters": {"bytes": len(content), "items": len(expected)},
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="decode and parse benchmark of large source payloads"
+    )
+    parser.add_argument("-n", "--cycles", type=int, default=20)
+    parser.add_argument("--source", choices=("nhk", "yahoo"), default="nhk")
+    parser.add_argument("--lines", type=int, default=20_000)
+    parser.add_argument(
+        "--weights",
+        type=parse_weights,
+        help="status.yaml keys and weights, e.g. normal=80,delay=6,suspended=3",
+    )
+    parser.add_argument("--detail-length", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="path of the JSON result")
+    args = parser.parse_args(argv)
+
+    data = run_decoding(
+        source=args.source,
+        lines=args.lines,
+        weights=args.weights,
+        detail_length=args.detail_length,
+        cycles=args.cycles,
+        seed=args.seed,
+    )
+    print(format_report(data))
+    print(f"Saved to {save_result(data, args.output, prefix='decoding-')}")
+
+
+if __name__ == "__main__":
+    main()
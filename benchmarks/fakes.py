@@ -0,0 +1,365 @@
+import base64
+import json
+import random
+import socketserver
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any
+from urllib.parse import urlsplit
+
+from enums import Region
+
+from .payloads import PayloadGenerator
+
+Route = Callable[[dict[str, Any]], tuple[int, dict[str, Any]]]
+
+
+@dataclass
+class FaultInjection:
+    """
+    スタンドインに注入する遅延とエラー
+
+    Attributes
+    ----------
+    latency : float
+        応答ごとに加える遅延（秒）
+    jitter : float
+        遅延に加える0からjitter秒までのランダムな揺らぎ
+    error_rate : float
+        500を返す確率
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+    def delay(self, rng: random.Random) -> None:
+        wait = self.latency + (rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def fails(self, rng: random.Random) -> bool:
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeHTTPServer"
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を分けて送るため、遅延ACKで応答が40ms待たされないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self._dispatch({})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self._dispatch(json.loads(body) if body else {})
+
+    def _dispatch(self, payload: dict[str, Any]) -> None:
+        path = "/" + urlsplit(self.path).path.lstrip("/")
+        status, body = self.server.handle(path, payload)
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    """
+    パスごとに応答を返すローカルのHTTPサーバー
+
+    Attributes
+    ----------
+    faults : FaultInjection
+        注入する遅延とエラー
+    requests : int
+        受け付けたリクエスト数
+    errors : int
+        注入したエラーの数
+    """
+
+    daemon_threads = True
+
+    def __init__(self, faults: FaultInjection | None = None, seed: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.faults = faults or FaultInjection()
+        self.routes: dict[str, Route] = {}
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle(self, path: str, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        with self._lock:
+            self.requests += 1
+            failed = self.faults.fails(self._rng)
+            if failed:
+                self.errors += 1
+        self.faults.delay(self._rng)
+        route = self.routes.get(path)
+        if route is None:
+            return 404, {"error": f"unknown path {path}"}
+        if failed:
+            return 500, {"error": {"code": "INTERNAL_ERROR", "message": "injected"}}
+        return route(payload)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSourceServer(FakeHTTPServer):
+    """
+    NHKとYahooの運行情報APIのスタンドイン
+
+    応答はPayloadGeneratorで生成し、advanceを呼ぶたびに路線の状態が変化する。
+
+    Attributes
+    ----------
+    generator : PayloadGenerator
+        応答の生成元
+    """
+
+    def __init__(
+        self,
+        generator: PayloadGenerator | None = None,
+        faults: FaultInjection | None = None,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(faults, seed)
+        self.generator = generator or PayloadGenerator(seed=seed)
+        for region in Region:
+            self.routes[f"/n-data/traffic/train/traininfo_area_0{region.id}.json"] = (
+                self._nhk
+            )
+        self.routes["/v4/diainfo/train"] = self._yahoo
+
+    def advance(self) -> int:
+        """
+        1サイクル分、路線の状態を変化させる。
+
+        Returns
+        -------
+        int
+            状態が変化した路線数
+        """
+        with self._lock:
+            return self.generator.advance()
+
+    def _nhk(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        with self._lock:
+            return 200, self.generator.nhk()
+
+    def _yahoo(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        with self._lock:
+            return 200, self.generator.yahoo()
+
+
+def _fake_jwt(lifetime: float = 3600) -> str:
+    payload = json.dumps({"exp": int(time.time() + lifetime)}).encode()
+    return ".".join(
+        base64.urlsafe_b64encode(part).decode().rstrip("=")
+        for part in (b'{"alg":"none"}', payload, b"signature")
+    )
+
+
+class FakeSocialServer(FakeHTTPServer):
+    """
+    BlueskyとMisskey.ioのAPIのスタンドイン
+
+    Attributes
+    ----------
+    posts : int
+        受け付けた投稿数
+    """
+
+    def __init__(self, faults: FaultInjection | None = None, seed: int = 0) -> None:
+        super().__init__(faults, seed)
+        self.posts = 0
+        self._records: dict[str, dict[str, Any]] = {}
+        self.routes.update(
+            {
+                "/xrpc/com.atproto.server.createSession": self._session,
+                "/xrpc/com.atproto.server.refreshSession": self._session,
+                "/xrpc/com.atproto.repo.createRecord": self._create_record,
+                "/xrpc/com.atproto.repo.getRecord": self._get_record,
+                "/api/i": lambda payload: (200, {"id": "benchmark"}),
+                "/api/notes/create": self._create_note,
+            }
+        )
+
+    def _next_post(self) -> int:
+        with self._lock:
+            self.posts += 1
+            return self.posts
+
+    def _session(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        return 200, {
+            "accessJwt": _fake_jwt(),
+            "refreshJwt": _fake_jwt(86400),
+            "handle": "benchmark.bsky.social",
+            "did": "did:plc:benchmark",
+        }
+
+    def _create_record(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        n = self._next_post()
+        uri = f"at://did:plc:benchmark/app.bsky.feed.post/{n}"
+        record = {"uri": uri, "cid": f"cid{n}", "value": payload.get("record", {})}
+        with self._lock:
+            self._records[uri] = record
+        return 200, {"uri": uri, "cid": record["cid"]}
+
+    def _get_record(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        # getRecordはクエリで参照するが、スタンドインでは直近の投稿を返す
+        with self._lock:
+            if not self._records:
+                return 404, {"error": "RecordNotFound"}
+            return 200, next(reversed(self._records.values()))
+
+    def _create_note(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        return 200, {"createdNote": {"id": f"note{self._next_post()}"}}
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    server: "FakeRedisServer"
+
+    def handle(self) -> None:
+        resp3 = False
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.server.faults.delay(self.server.rng)
+            if command[0].upper() == "HELLO":
+                # redis-pyは接続時にHELLOでRESP3を要求する
+                resp3 = len(command) > 1 and command[1] == "3"
+                self.wfile.write(
+                    _map(["server", "redis", "proto", 3 if resp3 else 2], resp3)
+                )
+                continue
+            self.wfile.write(self.server.execute(command, resp3))
+
+    def _read_command(self) -> list[str] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+
+def _bulk(value: str | int | None, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _map(values: list[str | int], resp3: bool) -> bytes:
+    # RESP3では連想配列、RESP2ではキーと値を交互に並べた配列で返す
+    header = b"%%%d\r\n" % (len(values) // 2) if resp3 else b"*%d\r\n" % len(values)
+    return header + b"".join(_bulk(v) for v in values)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    ボットが使うコマンドのみに対応したRedisのスタンドイン
+
+    HELLO, GET, SET, DEL, HGETALL, HSET, HDEL, EXPIREなどに応答する。有効期限は保持しない。
+
+    Attributes
+    ----------
+    faults : FaultInjection
+        コマンドごとに注入する遅延。エラーは注入しない
+    commands : int
+        受け付けたコマンド数
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, faults: FaultInjection | None = None, seed: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), _RedisHandler)
+        self.faults = faults or FaultInjection()
+        self.rng = random.Random(seed)
+        self.commands = 0
+        self._strings: dict[str, str] = {}
+        self._hashes: dict[str, dict[str, str]] = {}
+        self._lock = Lock()
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def execute(self, command: list[str], resp3: bool = False) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        with self._lock:
+            self.commands += 1
+            match name:
+                case "PING":
+                    return b"+PONG\r\n"
+                case "AUTH" | "SELECT" | "CLIENT":
+                    return b"+OK\r\n"
+                case "GET":
+                    return _bulk(self._strings.get(args[0]), resp3)
+                case "SET":
+                    self._strings[args[0]] = args[1]
+                    return b"+OK\r\n"
+                case "DEL":
+                    removed = sum(
+                        self._strings.pop(k, None) is not None
+                        or self._hashes.pop(k, None) is not None
+                        for k in args
+                    )
+                    return b":%d\r\n" % removed
+                case "EXPIRE":
+                    return b":1\r\n"
+                case "HGETALL":
+                    fields = self._hashes.get(args[0], {})
+                    return _map([x for item in fields.items() for x in item], resp3)
+                case "HSET":
+                    fields = self._hashes.setdefault(args[0], {})
+                    pairs = list(zip(args[1::2], args[2::2]))
+                    added = sum(field not in fields for field, _ in pairs)
+                    fields.update(pairs)
+                    return b":%d\r\n" % added
+                case "HDEL":
+                    fields = self._hashes.get(args[0], {})
+                    removed = sum(fields.pop(f, None) is not None for f in args[1:])
+                    return b":%d\r\n" % removed
+                case _:
+                    return f"-ERR unknown command '{name}'\r\n".encode()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,212 @@
+import random
+from collections.abc import Mapping
+from itertools import accumulate
+from typing import Any
+
+from traininfo.statuses import load_statuses
+
+# 平常運転が大半を占め、遅延や見合わせが続く、実際の配信に近い分布
+DEFAULT_WEIGHTS: dict[str, float] = {
+    "normal": 80.0,
+    "delay": 6.0,
+    "service_disruption": 4.0,
+    "suspended": 3.0,
+    "info": 2.0,
+    "operation_status": 1.0,
+    "plan": 1.0,
+    "traffic_disruption": 1.0,
+    "resumed": 1.0,
+    "other": 1.0,
+}
+
+_CAUSES = (
+    "人身事故",
+    "車両点検",
+    "信号確認",
+    "線路内立ち入り",
+    "強風",
+    "大雨",
+    "架線支障",
+)
+_FILLER = "詳しくは駅係員にお尋ねください。振替輸送を実施しています。"
+
+
+def incident_weights(incident_rate: float) -> dict[str, float]:
+    """
+    平常運転以外の割合から、平常運転以外を等しい重みとした分布を作る。
+
+    Parameters
+    ----------
+    incident_rate : float
+        平常運転以外の路線の割合
+
+    Returns
+    -------
+    dict[str, float]
+        status.yamlのキーごとの重み
+    """
+    others = [key for key in load_statuses() if key != "normal"]
+    weights = {key: incident_rate / len(others) for key in others}
+    weights["normal"] = 1.0 - incident_rate
+    return weights
+
+
+def parse_weights(value: str) -> dict[str, float]:
+    """
+    "normal=80,delay=6"の形式の文字列を重みに変換する。コマンドライン引数に使う。
+    """
+    weights = {}
+    for pair in value.split(","):
+        key, sep, weight = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid weight: {pair}")
+        weights[key.strip()] = float(weight)
+    return weights
+
+
+class PayloadGenerator:
+    """
+    NHKとYahooの運行情報APIと同じ構造の応答を生成する
+
+    各路線の状態はstatus.yamlのキーごとの重みで選ぶ。平常運転の路線は実際のAPIと同じく
+    応答に含めない。advanceを呼ぶたびに、churnの割合の路線の状態が別の状態に、
+    detail_churnの割合の路線の詳細文の時刻が変化する。同じseedでは同じ応答を生成する。
+
+    Attributes
+    ----------
+    lines : int
+        路線数
+    weights : dict[str, float]
+        status.yamlのキーごとの重み
+    detail_length : int
+        詳細文の文字数
+    churn : float
+        advanceごとに状態が変化する路線の割合
+    detail_churn : float
+        advanceごとに詳細文のみが変化する路線の割合
+    cycle : int
+        advanceを呼んだ回数
+    """
+
+    def __init__(
+        self,
+        lines: int = 50,
+        weights: Mapping[str, float] | None = None,
+        detail_length: int = 80,
+        churn: float = 0.1,
+        detail_churn: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        statuses = load_statuses()
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        unknown = set(self.weights) - set(statuses)
+        if unknown:
+            raise ValueError(f"Unknown statuses: {', '.join(sorted(unknown))}")
+        if not any(w > 0 for w in self.weights.values()):
+            raise ValueError("At least one status must have a positive weight")
+
+        self.lines = lines
+        self.detail_length = detail_length
+        self.churn = churn
+        self.detail_churn = detail_churn
+        self.cycle = 0
+        self._rng = random.Random(seed)
+        self._keys = list(self.weights)
+        self._cum_weights = list(accumulate(self.weights.values()))
+        self._drawable = sum(w > 0 for w in self.weights.values())
+        self._labels = {key: statuses[key]["label"] for key in self._keys}
+        self._nhk_codes = {
+            key: (statuses[key].get("NHK_code") or [""])[0] for key in self._keys
+        }
+        self._trains = [f"路線{i:05d}" for i in range(lines)]
+        self._causes = {train: self._rng.choice(_CAUSES) for train in self._trains}
+        # 路線ごとの状態のキーと、詳細文を更新したサイクル
+        self._state: dict[str, tuple[str, int]] = {
+            train: (self._draw(), 0) for train in self._trains
+        }
+
+    def _draw(self, exclude: str | None = None) -> str:
+        while True:
+            key = self._rng.choices(self._keys, cum_weights=self._cum_weights)[0]
+            if key != exclude or self._drawable < 2:
+                return key
+
+    def advance(self) -> int:
+        """
+        1サイクル分、路線の状態と詳細文を変化させる。
+
+        Returns
+        -------
+        int
+            状態が変化した路線数
+        """
+        self.cycle += 1
+        changed = self._rng.sample(self._trains, round(self.lines * self.churn))
+        for train in changed:
+            self._state[train] = (self._draw(exclude=self._state[train][0]), self.cycle)
+        updated = self._rng.sample(self._trains, round(self.lines * self.detail_churn))
+        for train in updated:
+            self._state[train] = (self._state[train][0], self.cycle)
+        return len(changed)
+
+    def _detail(self, train: str, key: str, updated: int) -> str:
+        minutes = (6 * 60 + updated * 5) % (24 * 60)
+        text = (
+            f"{minutes // 60}時{minutes % 60:02d}分現在、{self._causes[train]}の影響で、"
+            f"{train}は{self._labels[key]}となっています。"
+        )
+        while len(text) < self.detail_length:
+            text += _FILLER
+        return text[: self.detail_length]
+
+    def incidents(self) -> list[tuple[str, str, str]]:
+        """
+        応答に含める路線の一覧を返す。
+
+        Returns
+        -------
+        list[tuple[str, str, str]]
+            路線名、status.yamlのキー、詳細文
+        """
+        return [
+            (train, key, self._detail(train, key, updated))
+            for train, (key, updated) in self._state.items()
+            if key != "normal"
+        ]
+
+    def nhk(self) -> dict[str, Any]:
+        """
+        NHKの運行情報APIと同じ構造の応答を返す。運転計画はitemLongに含める。
+        """
+        items: list[dict[str, Any]] = []
+        long_items: list[dict[str, Any]] = []
+        for train, key, detail in self.incidents():
+            item = {
+                "trainLine": train,
+                "detailStatusCode": self._nhk_codes[key],
+                "detailStatusName": self._labels[key],
+                "textShort": detail[:20],
+                "textLong": detail,
+            }
+            (long_items if key == "plan" else items).append(item)
+        return {"channel": {"item": items, "itemLong": long_items}}
+
+    def yahoo(self) -> dict[str, Any]:
+        """
+        Yahooの運行情報APIと同じ構造の応答を返す。
+        """
+        return {
+            "feature": [
+                {
+                    "routeInfo": {
+                        "property": {
+                            "displayName": train,
+                            "diainfo": [
+                                {"status": self._labels[key], "message": detail}
+                            ],
+                        }
+                    }
+                }
+                for train, key, detail in self.incidents()
+            ]
+        }
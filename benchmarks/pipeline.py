@@ -0,0 +1,514 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from itertools import count
+from logging import WARNING, Handler, Logger, LogRecord
+from pathlib import Path
+from statistics import fmean, quantiles
+from time import perf_counter
+from typing import Any
+
+from clients.baseclient import RateLimiter
+from clients.bluesky import BlueskyClient
+from clients.misskeyio import MisskeyIOClient
+from enums import Region
+from runner.manager import RegionalManager
+from traininfo import database
+from traininfo.request import ClientsInfo
+from traininfo.sources.replay import ReplayClient, find_captures
+from utils.log_context import TIMING_FIELDS
+from utils.make_logger import PROJECT_ROOT
+
+from .fakes import FakeRedisServer, FakeSocialServer, FakeSourceServer, FaultInjection
+from .payloads import PayloadGenerator, incident_weights, parse_weights
+
+RESULTS_DIR = Path(PROJECT_ROOT) / "benchmarks" / "results"
+STAGES = ("cycle_ms", *TIMING_FIELDS)
+
+
+@dataclass
+class BenchmarkConfig:
+    """
+    ベンチマークの条件
+
+    Attributes
+    ----------
+    cycles : int
+        計測するサイクル数。replayを指定した場合、0にすると記録を最後まで再生する
+    warmup : int
+        計測前に実行するサイクル数。初回は前回の状態がないため比較と投稿が行われない
+    regions : tuple[str, ...]
+        並行して実行する地域
+    source : str
+        運行情報の取得元。"nhk"または"yahoo"
+    lines : int
+        路線数
+    incident_rate : float
+        平常運転以外の路線の割合。平常運転以外の状態は等しい割合で選ぶ
+    weights : dict[str, float] | None
+        status.yamlのキーごとの重み。指定した場合はincident_rateより優先する
+    change_rate : float
+        サイクルごとに状態が変化する路線の割合
+    detail_churn : float
+        サイクルごとに詳細文のみが変化する路線の割合
+    detail_length : int
+        詳細文の文字数
+    source_retry_sleep : float
+        取得に失敗したときの再試行までの待機時間（秒）
+    source, social, redis : FaultInjection
+        各スタンドインに注入する遅延とエラー
+    seed : int
+        乱数のシード
+    replay : str | None
+        SOURCE_CAPTURE_DIRで記録したディレクトリ。指定した場合は運行情報の取得元の
+        スタンドインの代わりに、記録した応答を待たずに再生する
+    """
+
+    cycles: int = 50
+    warmup: int = 1
+    regions: tuple[str, ...] = ("kanto",)
+    source: str = "nhk"
+    lines: int = 50
+    incident_rate: float = 0.2
+    weights: dict[str, float] | None = None
+    change_rate: float = 0.1
+    detail_churn: float = 0.0
+    detail_length: int = 80
+    source_retry_sleep: float = 0.1
+    source_faults: FaultInjection = field(default_factory=FaultInjection)
+    social_faults: FaultInjection = field(default_factory=FaultInjection)
+    redis_faults: FaultInjection = field(default_factory=FaultInjection)
+    seed: int = 0
+    replay: str | None = None
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """
+    計測時間の件数、平均、p50、p90、p99、最大値を求める。
+    """
+    if not values:
+        return {}
+    if len(values) < 2:
+        cuts = [values[0]] * 99
+    else:
+        cuts = quantiles(values, n=100, method="inclusive")
+    return {
+        "count": len(values),
+        "mean": round(fmean(values), 3),
+        "p50": round(cuts[49], 3),
+        "p90": round(cuts[89], 3),
+        "p99": round(cuts[98], 3),
+        "max": round(max(values), 3),
+    }
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    ベンチマークの結果
+
+    Attributes
+    ----------
+    config : BenchmarkConfig
+        実行した条件
+    elapsed : float
+        計測したサイクルの合計時間（秒）
+    samples : dict[str, list[float]]
+        ステージごとの計測時間（ミリ秒）。cycle_msは全地域の投稿が終わるまでの時間
+    counters : dict[str, int]
+        スタンドインへのリクエスト数や投稿数など
+    """
+
+    config: BenchmarkConfig
+    elapsed: float
+    samples: dict[str, list[float]]
+    counters: dict[str, int]
+
+    @property
+    def cycles(self) -> int:
+        return len(self.samples["cycle_ms"])
+
+    @property
+    def cycles_per_sec(self) -> float:
+        return self.cycles / self.elapsed if self.elapsed else 0.0
+
+    def stages(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: stats
+            for stage in STAGES
+            if (stats := percentiles(self.samples.get(stage, [])))
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "config": asdict(self.config),
+            "cycles": self.cycles,
+            "elapsed": round(self.elapsed, 3),
+            "cycles_per_sec": round(self.cycles_per_sec, 3),
+            "stages": self.stages(),
+            "counters": self.counters,
+        }
+
+    def save(self, path: str | Path | None = None) -> Path:
+        return save_result(self.to_dict(), path)
+
+    def summary(self) -> str:
+        return format_report(self.to_dict())
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_result(
+    data: dict[str, Any], path: str | Path | None = None, prefix: str = ""
+) -> Path:
+    """
+    結果をJSONで保存する。pathを省略した場合はbenchmarks/results/に日時とコミットの名前で保存する。
+    """
+    if path is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = RESULTS_DIR / f"{prefix}{stamp}-{data['commit'] or 'unknown'}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+    return path
+
+
+def format_report(data: dict[str, Any]) -> str:
+    width = max(map(len, ["stage", *data["stages"]])) + 2
+    lines = [
+        f"{data['cycles']} cycles in {data['elapsed']:.2f}s "
+        f"({data['cycles_per_sec']:.1f} cycles/s)",
+        f"{'stage':<{width}}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}",
+    ]
+    for stage, stats in data["stages"].items():
+        lines.append(
+            f"{stage:<{width}}{stats['count']:>7}{stats['p50']:>10.2f}"
+            f"{stats['p90']:>10.2f}{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+        )
+    lines.append(", ".join(f"{k}={v}" for k, v in data["counters"].items()))
+    return "\n".join(lines)
+
+
+def compare(before: dict[str, Any], after: dict[str, Any]) -> str:
+    """
+    保存した2つの結果のp50とp99、cycles/sの変化を表にする。
+    """
+
+    def _change(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    width = max(map(len, ["cycles/s", *after["stages"]])) + 6
+    lines = [
+        f"{before.get('commit')} -> {after.get('commit')}",
+        f"{'cycles/s':<{width}}{before['cycles_per_sec']:>10.2f}"
+        f"{after['cycles_per_sec']:>10.2f}"
+        f"{_change(before['cycles_per_sec'], after['cycles_per_sec']):>10}",
+    ]
+    for stage in after["stages"]:
+        old, new = before["stages"].get(stage), after["stages"][stage]
+        if not old or not new:
+            continue
+        for p in ("p50", "p99"):
+            lines.append(
+                f"{stage + ' ' + p:<{width}}{old[p]:>10.2f}{new[p]:>10.2f}"
+                f"{_change(old[p], new[p]):>10}"
+            )
+    return "\n".join(lines)
+
+
+class _TimingsCollector(Handler):
+    # diff/postステージがサイクルの最後に出力するログから計測時間を集める
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[dict[str, float]] = []
+
+    def emit(self, record: LogRecord) -> None:
+        timings = getattr(record, "timings", None)
+        if timings:
+            self.records.append(dict(timings))
+
+
+@contextmanager
+def _environ(values: dict[str, str]) -> Iterator[None]:
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextmanager
+def _quiet_logs(level: int) -> Iterator[None]:
+    # コンソールへの出力が計測を乱さないよう、既存のハンドラのレベルを一時的に上げる
+    handlers = {
+        handler
+        for logger in Logger.manager.loggerDict.values()
+        if isinstance(logger, Logger)
+        for handler in logger.handlers
+    }
+    saved = {handler: handler.level for handler in handlers}
+    for handler in handlers:
+        handler.setLevel(max(handler.level, level))
+    try:
+        yield
+    finally:
+        for handler, handler_level in saved.items():
+            handler.setLevel(handler_level)
+
+
+def _environment(
+    config: BenchmarkConfig, redis: FakeRedisServer, regions: list[Region]
+) -> dict[str, str]:
+    env = {
+        "UPSTASH_HOST": "127.0.0.1",
+        "UPSTASH_PORT": str(redis.port),
+        "UPSTASH_PASS": "benchmark",
+        "UPSTASH_SSL": "False",
+        "YAHOO_APP_ID": "benchmark" if config.source == "yahoo" else "",
+    }
+    for region in regions:
+        name = region.label.upper()
+        env[f"{name}_DB"] = f"benchmark:{region.label}"
+        env[f"BLUESKY_{name}_NAME"] = "benchmark"
+        env[f"BLUESKY_{name}_PASS"] = "benchmark"
+        env[f"MISSKEYIO_{name}_TOKEN"] = "benchmark"
+    return env
+
+
+def _create_manager(
+    region: Region,
+    config: BenchmarkConfig,
+    source: FakeSourceServer,
+    social: FakeSocialServer,
+) -> RegionalManager:
+    manager = RegionalManager(region)
+    traininfo_client = manager.traininfo_client
+    if config.replay:
+        paths = find_captures(config.replay, region=region.label)
+        if not paths:
+            raise FileNotFoundError(f"No capture for {region.label} in {config.replay}")
+        replay = ReplayClient(traininfo_client.session, region, paths)
+        traininfo_client.clients = [ClientsInfo(client=replay, priority=0)]
+    for info in traininfo_client.clients:
+        info.client.ROOT = source.url
+        info.client.retry_sleep = config.source_retry_sleep
+    for client in manager.clients.values():
+        if isinstance(client, BlueskyClient):
+            client.HOST = f"{social.url}/xrpc/"
+        elif isinstance(client, MisskeyIOClient):
+            client.HOST = social.url
+    manager.login_all()
+    # 投稿数の上限で待たされないよう、ログイン後に割り当てられた制限を外す
+    for client in manager.clients.values():
+        client.rate_limiter = RateLimiter(rate=1e6, burst=1_000_000, max_in_flight=64)
+    return manager
+
+
+def _replay_exhausted(managers: list[RegionalManager]) -> bool:
+    return all(
+        isinstance(info.client, ReplayClient) and info.client.exhausted
+        for manager in managers
+        for info in manager.traininfo_client.clients
+    )
+
+
+def _run_cycle(executor: ThreadPoolExecutor, managers: list[RegionalManager]) -> float:
+    # mainのスケジューラと同じく地域ごとに並行して実行し、投稿が終わるまでを計測する
+    started_at = perf_counter()
+    list(executor.map(RegionalManager.execute, managers))
+    for manager in managers:
+        manager.join()
+    return (perf_counter() - started_at) * 1000
+
+
+def run_benchmark(
+    config: BenchmarkConfig, log_level: int | None = WARNING
+) -> BenchmarkResult:
+    """
+    ローカルのスタンドインに対してRegionalManager.executeを繰り返し実行し、
+    ステージごとの計測時間とスループットを測る。
+
+    Parameters
+    ----------
+    config : BenchmarkConfig
+        ベンチマークの条件
+    log_level : int | None, optional
+        実行中のログの出力レベル。Noneの場合は変更しない, by default WARNING
+
+    Returns
+    -------
+    BenchmarkResult
+        計測結果
+    """
+    regions = [Region[name.upper()] for name in config.regions]
+    generator = PayloadGenerator(
+        lines=config.lines,
+        weights=config.weights or incident_weights(config.incident_rate),
+        detail_length=config.detail_length,
+        churn=config.change_rate,
+        detail_churn=config.detail_churn,
+        seed=config.seed,
+    )
+    source = FakeSourceServer(generator, config.source_faults, seed=config.seed)
+    social = FakeSocialServer(config.social_faults, seed=config.seed)
+    redis = FakeRedisServer(config.redis_faults, seed=config.seed)
+    servers = (source, social, redis)
+    for server in servers:
+        server.start()
+
+    collector = _TimingsCollector()
+    managers: list[RegionalManager] = []
+    samples: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    elapsed = 0.0
+    try:
+        with (
+            _environ(_environment(config, redis, regions)),
+            ThreadPoolExecutor(len(regions)) as executor,
+        ):
+            database._create_redis_client.cache_clear()
+            managers = [_create_manager(r, config, source, social) for r in regions]
+            # ロガーはクライアントの作成時に用意されるため、その後で出力を抑える
+            with _quiet_logs(log_level) if log_level is not None else nullcontext():
+                for _ in range(config.warmup):
+                    source.advance()
+                    _run_cycle(executor, managers)
+
+                posts_before = social.posts
+                for manager in managers:
+                    manager.logger.addHandler(collector)
+                for _ in range(config.cycles) if config.cycles else count():
+                    if _replay_exhausted(managers):
+                        break
+                    source.advance()
+                    cycle_ms = _run_cycle(executor, managers)
+                    samples["cycle_ms"].append(cycle_ms)
+                    elapsed += cycle_ms / 1000
+    finally:
+        for manager in managers:
+            manager.logger.removeHandler(collector)
+            manager.diff_stage.stop()
+            manager.post_stage.stop()
+        for server in servers:
+            server.stop()
+        database._create_redis_client.cache_clear()
+
+    for record in collector.records:
+        for stage, ms in record.items():
+            samples.setdefault(stage, []).append(ms)
+
+    return BenchmarkResult(
+        config=config,
+        elapsed=elapsed,
+        samples=samples,
+        counters={
+            "source_requests": source.requests,
+            "source_errors": source.errors,
+            "social_requests": social.requests,
+            "social_errors": social.errors,
+            "posts": social.posts - posts_before,
+            "redis_commands": redis.commands,
+        },
+    )
+
+
+def _faults(args: argparse.Namespace, name: str) -> FaultInjection:
+    return FaultInjection(
+        latency=getattr(args, f"{name}_latency") / 1000,
+        jitter=getattr(args, f"{name}_jitter") / 1000,
+        error_rate=getattr(args, f"{name}_error_rate", 0.0),
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="end-to-end pipeline benchmark")
+    parser.add_argument("-n", "--cycles", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument(
+        "--regions", default="kanto", help="comma separated, e.g. kanto,kansai"
+    )
+    parser.add_argument("--source", choices=("nhk", "yahoo"), default="nhk")
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--incident-rate", type=float, default=0.2)
+    parser.add_argument(
+        "--weights",
+        type=parse_weights,
+        help="status.yaml keys and weights, e.g. normal=80,delay=6,suspended=3",
+    )
+    parser.add_argument("--change-rate", type=float, default=0.1)
+    parser.add_argument("--detail-churn", type=float, default=0.0)
+    parser.add_argument("--detail-length", type=int, default=80)
+    for name in ("source", "social", "redis"):
+        parser.add_argument(f"--{name}-latency", type=float, default=0.0, help="ms")
+        parser.add_argument(f"--{name}-jitter", type=float, default=0.0, help="ms")
+        if name != "redis":
+            parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="replay responses captured with SOURCE_CAPTURE_DIR instead of fakes",
+    )
+    parser.add_argument("-o", "--output", help="path of the JSON result")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="compare two saved results instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        before, after = (json.loads(Path(p).read_text()) for p in args.compare)
+        print(compare(before, after))
+        return
+
+    config = BenchmarkConfig(
+        cycles=args.cycles,
+        warmup=args.warmup,
+        regions=tuple(r.strip() for r in args.regions.split(",") if r.strip()),
+        source=args.source,
+        lines=args.lines,
+        incident_rate=args.incident_rate,
+        weights=args.weights,
+        change_rate=args.change_rate,
+        detail_churn=args.detail_churn,
+        detail_length=args.detail_length,
+        source_faults=_faults(args, "source"),
+        social_faults=_faults(args, "social"),
+        redis_faults=_faults(args, "redis"),
+        seed=args.seed,
+        replay=args.replay,
+    )
+    result = run_benchmark(config)
+    print(result.summary())
+    print(f"Saved to {result.save(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+from unittest.mock import MagicMock
+
+from enums import Region
+from traininfo.message import diff_status, render_messages, sort_status
+from traininfo.normalizer import status_normalizer
+from traininfo.sources.baseclient import BaseTrainInfoClient
+from traininfo.sources.nhk import NHKClient
+from traininfo.sources.yahoo import YahooClient
+
+from .payloads import PayloadGenerator, parse_weights
+from .pipeline import compare, format_report, git_commit, percentiles, save_result
+
+# Bluesky（300文字）とMisskey.io（3000文字）の投稿の上限
+WIDTHS = (300, 3000)
+
+
+@dataclass
+class StageConfig:
+    """
+    ステージごとのベンチマークの条件
+
+    Attributes
+    ----------
+    cycles : int
+        計測するサイクル数
+    source : str
+        応答の形式。"nhk"または"yahoo"
+    lines : int
+        路線数
+    weights : dict[str, float] | None
+        status.yamlのキーごとの重み。Noneの場合はPayloadGeneratorの既定値
+    churn : float
+        サイクルごとに状態が変化する路線の割合
+    detail_churn : float
+        サイクルごとに詳細文のみが変化する路線の割合
+    detail_length : int
+        詳細文の文字数
+    seed : int
+        乱数のシード
+    """
+
+    cycles: int = 20
+    source: str = "nhk"
+    lines: int = 10_000
+    weights: dict[str, float] | None = None
+    churn: float = 0.05
+    detail_churn: float = 0.05
+    detail_length: int = 120
+    seed: int = 0
+
+
+def _client(source: str) -> BaseTrainInfoClient:
+    if source == "yahoo":
+        return YahooClient(MagicMock(), Region.KANTO, yahoo_app_id="benchmark")
+    return NHKClient(MagicMock(), Region.KANTO)
+
+
+def _normalize_inputs(source: str, payload: dict[str, Any]) -> list[tuple[str, str]]:
+    # 正規化のみを計測するため、解析と同じ引数を先に取り出しておく
+    if source == "yahoo":
+        return [
+            ("", diainfo.get("status", ""))
+            for feature in payload["feature"]
+            for diainfo in feature["routeInfo"]["property"]["diainfo"]
+        ]
+    channel = payload["channel"]
+    return [
+        (item["detailStatusCode"], item["detailStatusName"])
+        for item in channel["item"] + channel["itemLong"]
+    ]
+
+
+def run_stages(config: StageConfig) -> dict[str, Any]:
+    """
+    生成した応答に対して、解析、正規化、並べ替え、比較、メッセージの作成をそれぞれ計測する。
+
+    Parameters
+    ----------
+    config : StageConfig
+        ベンチマークの条件
+
+    Returns
+    -------
+    dict[str, Any]
+        pipelineの結果と同じ形式の計測結果
+    """
+    generator = PayloadGenerator(
+        lines=config.lines,
+        weights=config.weights,
+        detail_length=config.detail_length,
+        churn=config.churn,
+        detail_churn=config.detail_churn,
+        seed=config.seed,
+    )
+    client = _client(config.source)
+    render = getattr(generator, config.source)
+    samples: dict[str, list[float]] = {
+        stage: []
+        for stage in (
+            "cycle_ms",
+            "parse_ms",
+            "normalize_ms",
+            "sort_ms",
+            "diff_ms",
+            *(f"render{width}_ms" for width in WIDTHS),
+        )
+    }
+
+    def _timed(stage: str, func: Any, *args: Any) -> Any:
+        started_at = perf_counter()
+        result = func(*args)
+        samples[stage].append((perf_counter() - started_at) * 1000)
+        return result
+
+    previous = client._parse(render())
+    items = messages = 0
+    for _ in range(config.cycles):
+        generator.advance()
+        payload = render()
+        inputs = _normalize_inputs(config.source, payload)
+        started_at = perf_counter()
+        latest = _timed("parse_ms", client._parse, payload)
+        _timed(
+            "normalize_ms",
+            lambda: [status_normalizer(status, code) for code, status in inputs],
+        )
+        _timed("sort_ms", sort_status, latest)
+        diff = _timed("diff_ms", diff_status, latest, previous)
+        for width in WIDTHS:
+            messages += len(_timed(f"render{width}_ms", render_messages, diff, width))
+        samples["cycle_ms"].append((perf_counter() - started_at) * 1000)
+        items += len(latest)
+        previous = latest
+
+    elapsed = sum(samples["cycle_ms"]) / 1000
+    parse_seconds = sum(samples["parse_ms"]) / 1000
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": asdict(config),
+        "cycles": config.cycles,
+        "elapsed": round(elapsed, 3),
+        "cycles_per_sec": round(config.cycles / elapsed, 3) if elapsed else 0.0,
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "counters": {
+            "items": items,
+            "items_per_sec": round(items / parse_seconds) if parse_seconds else 0,
+            "messages": messages,
+        },
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="parse/normalize/diff/render benchmark on generated payloads"
+    )
+    parser.add_argument("-n", "--cycles", type=int, default=20)
+    parser.add_argument("--source", choices=("nhk", "yahoo"), default="nhk")
+    parser.add_argument("--lines", type=int, default=10_000)
+    parser.add_argument(
+        "--weights",
+        type=parse_weights,
+        help="status.yaml keys and weights, e.g. normal=80,delay=6,suspended=3",
+    )
+    parser.add_argument("--churn", type=float, default=0.05)
+    parser.add_argument("--detail-churn", type=float, default=0.05)
+    parser.add_argument("--detail-length", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="path of the JSON result")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="compare two saved results instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        before, after = (json.loads(Path(p).read_text()) for p in args.compare)
+        print(compare(before, after))
+        return
+
+    data = run_stages(
+        StageConfig(
+            cycles=args.cycles,
+            source=args.source,
+            lines=args.lines,
+            weights=args.weights,
+            churn=args.churn,
+            detail_churn=args.detail_churn,
+            detail_length=args.detail_length,
+            seed=args.seed,
+        )
+    )
+    print(format_report(data))
+    print(f"Saved to {save_result(data, args.output, prefix='stages-')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,27 @@
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
+from logging import Logger
+from threading import BoundedSemaphore, Lock
 from typing import Any
 
 from enums import AuthType, Service
+from utils.metrics import REGISTRY
+
+from .dedup import PostDeduplicator, get_deduplicator
+
+POSTS = REGISTRY.counter(
+    "traininfo_posts_total", "Posts to social services by result", ("service", "result")
+)
+POST_SECONDS = REGISTRY.histogram(
+    "traininfo_post_seconds", "Latency of a single post including retries", ("service",)
+)
 
 
 @dataclass
@@ -11,16 +30,244 @@ class PostResponse:
     ref: str | None = None  # これを直接渡せばリプライできるよう設計する
     raw: dict[str, Any] | None = None
     error: str | None = None
+    deduplicated: bool = False  # 配信済みのため投稿を省略した場合にTrue
+
+
+@dataclass
+class ThreadResponse:
+    results: list[PostResponse]
+    elapsed: float = 0.0  # seconds
+
+    @property
+    def success(self) -> bool:
+        return bool(self.results) and all(r.success for r in self.results)
+
+    @property
+    def last_ref(self) -> str | None:
+        return next((r.ref for r in reversed(self.results) if r.success), None)
+
+
+class RateLimiter:
+    """
+    トークンバケットと同時実行数の上限によるレート制限
+
+    Retry-Afterやレート制限ヘッダを受け取った場合は、その値に従って待機する。
+
+    Attributes
+    ----------
+    rate : float
+        1秒あたりに補充されるトークン数
+    burst : int
+        バケットの容量
+    max_in_flight : int
+        同時に実行できるリクエスト数
+    waits : int
+        待機が発生した回数
+    total_wait : float
+        待機時間の合計（秒）
+    max_wait : float
+        待機時間の最大値（秒）
+
+    Methods
+    -------
+    acquire() -> Iterator[None]
+        トークンを取得し、リクエストの実行中は同時実行枠を確保する
+    block_for(seconds: float) -> None
+        指定した秒数の間、トークンの払い出しを止める
+    update_from_headers(headers: Mapping[str, str]) -> None
+        レスポンスヘッダからレート制限の状態を反映する
+    """
+
+    def __init__(self, rate: float, burst: int, max_in_flight: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = Lock()
+        self._in_flight = BoundedSemaphore(max_in_flight)
+
+    @contextmanager
+    def acquire(self) -> Iterator[None]:
+        start = time.monotonic()
+        with self._in_flight:
+            self._take_token()
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                with self._lock:
+                    self.waits += 1
+                    self.total_wait += waited
+                    self.max_wait = max(self.max_wait, waited)
+            yield
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(
+                self._blocked_until, time.monotonic() + max(seconds, 0.0)
+            )
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        retry_after = _parse_retry_after(headers.get("Retry-After"))
+        if retry_after is not None:
+            self.block_for(retry_after)
+
+        remaining = headers.get("RateLimit-Remaining")
+        if remaining is None or not remaining.isdigit():
+            return
+
+        with self._lock:
+            self._tokens = min(self._tokens, float(remaining))
+
+        if int(remaining) == 0:
+            reset = _parse_reset(headers.get("RateLimit-Reset"))
+            if reset is not None:
+                self.block_for(reset)
+
+    def _take_token(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.burst), self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return (
+            parsedate_to_datetime(value) - datetime.now(timezone.utc)
+        ).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_reset(value: str | None) -> float | None:
+    # UNIX時間(Bluesky)と残り秒数(IETFドラフト)の両方の形式に対応する
+    if not value or not value.isdigit():
+        return None
+    reset = float(value)
+    if reset > 1_000_000_000:
+        return reset - time.time()
+    return reset
+
+
+_RATE_LIMITERS: dict[tuple[str, str], RateLimiter] = {}
+_RATE_LIMITERS_LOCK = Lock()
+
+
+def get_rate_limiter(
+    service: str, account: str, rate: float, burst: int, max_in_flight: int
+) -> RateLimiter:
+    """
+    サービス・アカウントごとのレート制限を取得する。一度作成したら共有する。
+
+    Parameters
+    ----------
+    service : str
+        サービス名
+    account : str
+        アカウントの識別子
+    rate : float
+        1秒あたりに補充されるトークン数
+    burst : int
+        バケットの容量
+    max_in_flight : int
+        同時に実行できるリクエスト数
+
+    Returns
+    -------
+    RateLimiter
+        レート制限のインスタンス
+    """
+    with _RATE_LIMITERS_LOCK:
+        key = (service, account)
+        if key not in _RATE_LIMITERS:
+            _RATE_LIMITERS[key] = RateLimiter(rate, burst, max_in_flight)
+        return _RATE_LIMITERS[key]
+
+
+def _rate_limiter_samples(attribute: str) -> list[tuple[dict[str, str], float]]:
+    with _RATE_LIMITERS_LOCK:
+        limiters = list(_RATE_LIMITERS.items())
+    return [
+        ({"service": service, "account": account}, getattr(limiter, attribute))
+        for (service, account), limiter in limiters
+    ]
+
+
+REGISTRY.register_callback(
+    "traininfo_rate_limit_waits_total",
+    "Requests that waited for the rate limiter",
+    "counter",
+    lambda: _rate_limiter_samples("waits"),
+)
+REGISTRY.register_callback(
+    "traininfo_rate_limit_wait_seconds_total",
+    "Total time spent waiting for the rate limiter",
+    "counter",
+    lambda: _rate_limiter_samples("total_wait"),
+)
 
 
 class BaseSocialClient(ABC):
+    logger: Logger
+
     def __init__(
-        self, service_name: Service, auth_type: AuthType, post_string_limit: int
+        self,
+        service_name: Service,
+        auth_type: AuthType,
+        post_string_limit: int,
+        rate: float = 1.0,
+        burst: int = 10,
+        max_in_flight: int = 2,
     ) -> None:
         self.service_name: str = service_name.label
         self.auth_type: AuthType = auth_type
         self.post_string_limit: int = post_string_limit
 
+        self.account: str = ""
+        self._rate_limit = (rate, burst, max_in_flight)
+        self.rate_limiter: RateLimiter = get_rate_limiter(
+            self.service_name, self.account, *self._rate_limit
+        )
+        self.deduplicator: PostDeduplicator = get_deduplicator()
+
+        # 投稿refとスレッドのrootの対応
+        self._thread_roots: OrderedDict[str, str] = OrderedDict()
+        self._thread_roots_lock = Lock()
+
+    def bind_account(self, account: str) -> None:
+        """
+        アカウントを確定し、アカウントごとのレート制限に切り替える。ログインに成功した時点で呼ぶ。
+
+        Parameters
+        ----------
+        account : str
+            アカウントの識別子
+        """
+        self.account = account
+        self.rate_limiter = get_rate_limiter(
+            self.service_name, account, *self._rate_limit
+        )
+
     @abstractmethod
     def login(self, *args: Any, **kwargs: Any) -> bool:
         """
@@ -33,18 +280,88 @@ class BaseSocialClient(ABC):
         """
         pass
 
-    @abstractmethod
+    def make_post_key(self) -> str | None:
+        """
+        投稿に割り当てるキーを作成する。
+        同じキーで再試行すると、サーバーで作成済みの投稿は二重に作成されない。
+
+        Returns
+        -------
+        str | None
+            投稿のキー。サーバーがキーの指定に対応していない場合はNone
+        """
+        return None
+
     def post(
         self, text: str, reply_to: str | None = None, max_retries: int = 3
     ) -> PostResponse:
         """
-        投稿を行う
+        投稿を行う。同じスレッドへの同じ内容の投稿が配信済みの場合は投稿せず、その投稿のrefを返す。
 
         Parameters
         ----------
         text : str
             投稿内容
-        reply_to : str | dict | None, optional
+        reply_to : str | None, optional
+            返信先の投稿情報
+        max_retries : int, optional
+            投稿失敗時のリトライ回数, by default 3
+
+        Returns
+        -------
+        PostResponse
+            投稿結果
+        """
+        return self._send(
+            text, reply_to, partial(self._post, text, reply_to, max_retries)
+        )
+
+    def _send(
+        self, text: str, reply_to: str | None, send: Callable[[], PostResponse]
+    ) -> PostResponse:
+        """
+        重複を確認し、配信済みでなければsendで投稿する。
+        投稿数と所要時間の計測、配信済みの記録もここで行うため、投稿はすべてこのメソッドを通す。
+
+        Parameters
+        ----------
+        text : str
+            投稿内容
+        reply_to : str | None
+            重複の確認に使う返信先の投稿情報
+        send : Callable[[], PostResponse]
+            実際の投稿処理
+
+        Returns
+        -------
+        PostResponse
+            投稿結果
+        """
+        duplicate = self._find_duplicate(text, reply_to)
+        if duplicate is not None:
+            POSTS.labels(self.service_name, "deduplicated").inc()
+            return duplicate
+
+        with POST_SECONDS.labels(self.service_name).time():
+            result = send()
+        POSTS.labels(
+            self.service_name, "success" if result.success else "failure"
+        ).inc()
+        self._remember_delivery(text, reply_to, result)
+        return result
+
+    @abstractmethod
+    def _post(
+        self, text: str, reply_to: str | None = None, max_retries: int = 3
+    ) -> PostResponse:
+        """
+        実際の投稿処理を行う。重複の確認はpostで行うため不要。
+
+        Parameters
+        ----------
+        text : str
+            投稿内容
+        reply_to : str | None, optional
             返信先の投稿情報
         max_retries : int, optional
             投稿失敗時のリトライ回数, by default 3
@@ -55,3 +372,76 @@ class BaseSocialClient(ABC):
             投稿結果
         """
         pass
+
+    def _thread_root(self, reply_to: str | None) -> str | None:
+        if reply_to is None:
+            return None
+        with self._thread_roots_lock:
+            return self._thread_roots.get(reply_to, reply_to)
+
+    def _find_duplicate(self, text: str, reply_to: str | None) -> PostResponse | None:
+        ref = self.deduplicator.lookup(
+            self.service_name, self.account, text, self._thread_root(reply_to)
+        )
+        if ref is None:
+            return None
+        self.logger.info(f"Skipped duplicate post: {ref}")
+        return PostResponse(success=True, ref=ref, deduplicated=True)
+
+    def _remember_delivery(
+        self, text: str, reply_to: str | None, result: PostResponse
+    ) -> None:
+        if not result.success or not result.ref:
+            return
+
+        root = self._thread_root(reply_to)
+        with self._thread_roots_lock:
+            self._thread_roots[result.ref] = root or result.ref
+            while len(self._thread_roots) > 1024:
+                self._thread_roots.popitem(last=False)
+        self.deduplicator.record(
+            self.service_name, self.account, text, root, result.ref
+        )
+
+    def post_thread(
+        self,
+        messages: list[str],
+        reply_to: str | None = None,
+        max_retries: int = 3,
+        on_posted: Callable[[int, PostResponse], None] | None = None,
+        post_keys: list[str | None] | None = None,
+    ) -> ThreadResponse:
+        """
+        メッセージを順に返信としてつなげ、スレッドとして投稿する。
+        投稿に失敗した時点で打ち切る。効率的な方法がある場合はサブクラスでオーバーライド。
+
+        Parameters
+        ----------
+        messages : list[str]
+            スレッドを構成するメッセージ
+        reply_to : str | None, optional
+            最初のメッセージの返信先
+        max_retries : int, optional
+            各投稿の失敗時のリトライ回数, by default 3
+        on_posted : Callable[[int, PostResponse], None] | None, optional
+            各メッセージの投稿に成功するたびに呼ばれる関数。引数はメッセージの位置と投稿結果
+        post_keys : list[str | None] | None, optional
+            make_post_keyで作成した各メッセージのキー。キーを使わないサービスでは無視する
+
+        Returns
+        -------
+        ThreadResponse
+            各メッセージの投稿結果と、スレッド全体の所要時間
+        """
+        start = time.monotonic()
+        results: list[PostResponse] = []
+        for i, text in enumerate(messages):
+            result = self.post(text, reply_to, max_retries=max_retries)
+            results.append(result)
+            if not result.success:
+                break
+            reply_to = result.ref
+            if on_posted is not None:
+                on_posted(i, result)
+
+        return ThreadResponse(results=results, elapsed=time.monotonic() - start)
@@ -1,4 +1,12 @@
-from datetime import datetime, timezone
+import base64
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from threading import Lock
 from typing import Any
 from urllib.parse import urlparse
 
@@ -7,7 +15,34 @@ import requests
 from enums import AuthType, Service
 from utils.make_logger import make_logger
 
-from .baseclient import BaseSocialClient, PostResponse
+from .baseclient import BaseSocialClient, PostResponse, ThreadResponse
+from .session_store import SessionStore
+
+POST_COLLECTION = "app.bsky.feed.post"
+# TIDの表記に使うbase32の文字
+_TID_ALPHABET = "234567abcdefghijklmnopqrstuvwxyz"
+# 同じ時刻に作成した他のプロセスのTIDと衝突しないよう、プロセスごとに決める
+_TID_CLOCK_ID = int.from_bytes(os.urandom(2), "big") & 0x3FF
+_tid_lock = Lock()
+_last_tid_micros = 0
+
+
+def make_tid() -> str:
+    """
+    現在時刻から、投稿のrkeyに使うTIDを作成する。
+    同じプロセスで作成したTIDは単調に増加する。
+
+    Returns
+    -------
+    str
+        13文字のTID
+    """
+    global _last_tid_micros
+    with _tid_lock:
+        micros = max(time.time_ns() // 1000, _last_tid_micros + 1)
+        _last_tid_micros = micros
+    value = (micros << 10) | _TID_CLOCK_ID
+    return "".join(_TID_ALPHABET[(value >> (60 - 5 * i)) & 31] for i in range(13))
 
 
 class BlueskyClient(BaseSocialClient):
@@ -16,6 +51,10 @@ class BlueskyClient(BaseSocialClient):
             service_name=Service.BLUESKY,
             auth_type=AuthType.USERNAME_PASSWORD,
             post_string_limit=300,
+            # createRecordは1時間あたり5000ポイント(1件3ポイント)まで
+            rate=0.4,
+            burst=10,
+            max_in_flight=2,
         )
         self.logger = make_logger(type(self).__name__, context=context)
         self.session = requests.Session()
@@ -26,8 +65,19 @@ class BlueskyClient(BaseSocialClient):
         self.accessjwt: str | None = None
         self.refreshjwt: str | None = None
 
+        # 投稿URIからスレッドのroot/parentの参照を引くためのLRUキャッシュ
+        self._thread_refs: OrderedDict[str, dict[str, dict]] = OrderedDict()
+        self._thread_refs_lock = Lock()
+        self.thread_refs_maxsize: int = 512
+
         self.last_refresh: datetime | None = None
-        self.refresh_interval: int = 3600  # seconds
+        self.refresh_interval: int = 3600  # seconds, JWTの有効期限が読めない場合に使う
+        self.refresh_margin: int = 300  # seconds, 有効期限のこの秒数前に更新する
+        self.access_expires_at: datetime | None = None
+
+        self._session_lock = Lock()
+        self._session_store = SessionStore(Service.BLUESKY.label)
+        self._identifier: str | None = None
 
         self.HOST = "https://bsky.social/xrpc/"
         self.LOGIN_ENDPOINT = "com.atproto.server.createSession"
@@ -36,10 +86,19 @@ class BlueskyClient(BaseSocialClient):
         self.CREATE_RECORD_ENDPOINT = "com.atproto.repo.createRecord"
 
     def login(self, identifier: str | None, password: str | None) -> bool:
+        """
+        Blueskyにログインする。
+        保存されたセッションがあればリフレッシュトークンで再開し、createSessionを呼ばない。
+        """
         if not identifier or not password:
             self.logger.error("Missing credentials")
             return False
 
+        self._identifier = identifier
+        if self._resume_session():
+            self.logger.info("Resumed saved session")
+            return True
+
         try:
             url = self.HOST + self.LOGIN_ENDPOINT
 
@@ -52,21 +111,72 @@ class BlueskyClient(BaseSocialClient):
             response.raise_for_status()
             session_data = response.json()
 
-            self.handle = session_data.get("handle")
-            self.did = session_data.get("did")
-            self.accessjwt = session_data.get("accessJwt")
-            self.refreshjwt = session_data.get("refreshJwt")
-
-            success = all([self.handle, self.did, self.accessjwt, self.refreshjwt])
+            with self._session_lock:
+                success = self._apply_session(session_data)
             if success:
-                self.last_refresh = datetime.now(timezone.utc)
                 self.logger.info("Login successful")
             return success
         except Exception:
             self.logger.error("An error occurred", exc_info=True)
             return False
 
-    def post(
+    def _resume_session(self) -> bool:
+        if self._identifier is None:
+            return False
+        saved = self._session_store.load(self._identifier)
+        if not saved or not saved.get("refreshJwt"):
+            return False
+
+        with self._session_lock:
+            self.refreshjwt = saved["refreshJwt"]
+            self.handle = saved.get("handle")
+            self.did = saved.get("did")
+            if self._request_refresh_jwt():
+                return True
+
+            self.refreshjwt = None
+        self._session_store.delete(self._identifier)
+        return False
+
+    def _apply_session(self, session_data: dict[str, Any]) -> bool:
+        """
+        createSession/refreshSessionのレスポンスを反映する。_session_lockを保持して呼ぶ。
+        """
+        access = session_data.get("accessJwt")
+        refresh = session_data.get("refreshJwt")
+        if not access or not refresh:
+            return False
+
+        self.handle = session_data.get("handle") or self.handle
+        self.did = session_data.get("did") or self.did
+        self.accessjwt = access
+        self.refreshjwt = refresh
+        self.last_refresh = datetime.now(timezone.utc)
+        self.access_expires_at = self._decode_jwt_expiry(access)
+
+        if not all([self.handle, self.did]):
+            return False
+
+        self.bind_account(self.did)  # type: ignore[arg-type]
+        if self._identifier is not None:
+            self._session_store.save(
+                self._identifier,
+                {"handle": self.handle, "did": self.did, "refreshJwt": refresh},
+            )
+        return True
+
+    @staticmethod
+    def _decode_jwt_expiry(token: str) -> datetime | None:
+        # 署名は検証せず、有効期限(exp)のみを読む
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+            return datetime.fromtimestamp(exp, timezone.utc) if exp else None
+        except Exception:
+            return None
+
+    def _post(
         self, text: str, reply_to: str | None = None, max_retries: int = 3
     ) -> PostResponse:
         """
@@ -90,56 +200,154 @@ class BlueskyClient(BaseSocialClient):
         -----
         401エラーが発生した場合、トークンを更新して再試行する。ただし、再試行は一度だけ行う
         returnした投稿情報を直接渡せばリプライが可能
+        自身の投稿への返信ではgetRecordを呼ばず、createRecordの結果から返信先を組み立てる
         """
+        if not self.accessjwt:
+            self.logger.error("Not logged in")
+            return PostResponse(success=False, error="Not logged in")
+
+        reply_refs: dict[str, dict] = {}
+        if reply_to:
+            reply_refs = self._get_reply_refs(reply_to)
+            if not reply_refs:
+                self.logger.warning("Failed to get reply refs, posting without reply")
+
+        return self._create_post(text, reply_refs, max_retries, make_tid())
+
+    def make_post_key(self) -> str:
+        return make_tid()
+
+    def post_thread(
+        self,
+        messages: list[str],
+        reply_to: str | None = None,
+        max_retries: int = 3,
+        on_posted: Callable[[int, PostResponse], None] | None = None,
+        post_keys: list[str | None] | None = None,
+    ) -> ThreadResponse:
+        """
+        Blueskyにスレッドを投稿
+
+        返信先の参照は直前のcreateRecordの結果から組み立てるため、各メッセージはHTTP1回で投稿される。
+
+        notes
+        -----
+        applyWritesによる一括投稿は、返信先にまだ作成されていないレコードのCIDが必要になるため使用しない
+        post_keysの各キーはそのメッセージのrkeyとして使い、キーがない場合はここで作成する
+        """
+        start = time.monotonic()
+        if not self.accessjwt:
+            self.logger.error("Not logged in")
+            return ThreadResponse(
+                results=[PostResponse(success=False, error="Not logged in")]
+            )
+
+        reply_refs: dict[str, dict] = {}
+        if reply_to:
+            reply_refs = self._get_reply_refs(reply_to)
+            if not reply_refs:
+                self.logger.warning("Failed to get reply refs, posting without reply")
+
+        results: list[PostResponse] = []
+        for i, text in enumerate(messages):
+            parent_uri = reply_refs.get("parent", {}).get("uri")
+            rkey = (post_keys[i] if post_keys else None) or make_tid()
+            result = self._send(
+                text,
+                parent_uri,
+                partial(self._create_post, text, reply_refs, max_retries, rkey),
+            )
+            results.append(result)
+            if not result.success or not result.ref:
+                break
+
+            if result.raw is not None:
+                parent = {"uri": result.raw["uri"], "cid": result.raw["cid"]}
+            else:
+                # 配信済みで省略した投稿は、キャッシュまたはgetRecordから参照を得る
+                parent = self._get_reply_refs(result.ref).get("parent", {})
+                if not parent:
+                    results[-1] = PostResponse(
+                        success=False, error="Failed to get reply refs"
+                    )
+                    break
+            reply_refs = {"root": reply_refs.get("root", parent), "parent": parent}
+            if on_posted is not None:
+                on_posted(i, result)
+
+        return ThreadResponse(results=results, elapsed=time.monotonic() - start)
+
+    def _create_post(
+        self, text: str, reply_refs: dict[str, dict], max_retries: int, rkey: str
+    ) -> PostResponse:
+        """
+        createRecordで投稿する。
+
+        notes
+        -----
+        再試行はすべて同じrkeyで行うため、応答を受け取る前にサーバーで作成済みだった場合も
+        二重に投稿されない。rkeyが既に使われている場合は、作成済みのレコードを結果として返す。
+        """
+        created_at = datetime.now(timezone.utc)
         for i in range(max_retries):
             try:
-                if not self.accessjwt:
-                    self.logger.error("Not logged in")
-                    return PostResponse(success=False, error="Not logged in")
-
                 self._refresh_token()
+                access = self.accessjwt
 
                 url = self.HOST + self.CREATE_RECORD_ENDPOINT
                 headers = {
                     "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.accessjwt}",
+                    "Authorization": f"Bearer {access}",
                 }
                 data: dict[str, Any] = {
                     "repo": self.handle,
-                    "collection": "app.bsky.feed.post",
+                    "collection": POST_COLLECTION,
+                    "rkey": rkey,
                     "record": {
-                        "$type": "app.bsky.feed.post",
+                        "$type": POST_COLLECTION,
                         "text": text,
-                        "createdAt": datetime.now(timezone.utc).strftime(
-                            "%Y-%m-%dT%H:%M:%S.%fZ"
-                        ),
+                        "createdAt": created_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
                     },
                 }
+                if reply_refs:
+                    data["record"]["reply"] = reply_refs
 
-                if reply_to:
-                    reply_refs = self._get_reply_refs(reply_to)
-                    if reply_refs:
-                        data["record"]["reply"] = reply_refs
-                    else:
-                        self.logger.warning(
-                            "Failed to get reply refs, posting without reply"
-                        )
-
-                response = self.session.post(
-                    url, json=data, headers=headers, timeout=20
-                )
+                with self.rate_limiter.acquire():
+                    response = self.session.post(
+                        url, json=data, headers=headers, timeout=20
+                    )
+                self.rate_limiter.update_from_headers(response.headers)
                 response.raise_for_status()
+                result = response.json()
 
-                return PostResponse(
-                    success=True, ref=response.json().get("uri"), raw=response.json()
-                )
+                ref = {"uri": result.get("uri"), "cid": result.get("cid")}
+                if ref["uri"] and ref["cid"]:
+                    self._remember_thread_ref(ref, reply_refs.get("root", ref))
+
+                return PostResponse(success=True, ref=ref["uri"], raw=result)
 
             except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 401:
+                status = e.response.status_code if e.response is not None else None
+                if status == 401:
                     self.logger.warning(
                         "Failed to authenticate.token may be expired.\n Refreshing token and retrying..."
                     )
-                    self._request_refresh_jwt()
+                    with self._session_lock:
+                        # 他のスレッドが既に更新していれば更新しない
+                        if self.accessjwt == access:
+                            self._request_refresh_jwt()
+                elif e.response is not None and status == 429:
+                    self.logger.warning("Rate limited. Waiting for the limit to reset")
+                    if "Retry-After" not in e.response.headers:
+                        self.rate_limiter.block_for(2**i)
+                elif status in (400, 409):
+                    # rkeyは投稿ごとに作成するため、使われていれば以前の試行で作成済みの投稿
+                    existing = self._get_own_post(rkey)
+                    if existing is not None:
+                        self.logger.info(f"Post was already created: {rkey}")
+                        ref = {"uri": existing["uri"], "cid": existing["cid"]}
+                        self._remember_thread_ref(ref, reply_refs.get("root", ref))
+                        return PostResponse(success=True, ref=ref["uri"], raw=ref)
 
                 if i < max_retries - 1:
                     self.logger.info(f"Retrying... ({i + 1}/{max_retries})")
@@ -155,7 +363,25 @@ class BlueskyClient(BaseSocialClient):
 
         return PostResponse(success=False, error="All retries failed")
 
-    def _request_refresh_jwt(self) -> None:
+    def _get_own_post(self, rkey: str) -> dict[str, Any] | None:
+        try:
+            r = self.session.get(
+                self.HOST + self.GET_RECORD_ENDPOINT,
+                params={"repo": self.did, "collection": POST_COLLECTION, "rkey": rkey},
+                timeout=20,
+            )
+            if r.status_code in (400, 404):
+                return None
+            r.raise_for_status()
+            return r.json()
+        except Exception:
+            self.logger.error("An error occurred", exc_info=True)
+            return None
+
+    def _request_refresh_jwt(self) -> bool:
+        """
+        リフレッシュトークンでセッションを更新する。_session_lockを保持して呼ぶ。
+        """
         try:
             url = self.HOST + self.REFRESH_SESSION_ENDPOINT
             response = self.session.post(
@@ -167,30 +393,37 @@ class BlueskyClient(BaseSocialClient):
                 timeout=20,
             )
             response.raise_for_status()
-            session_data = response.json()
 
-            if session_data.get("accessJwt") and session_data.get("refreshJwt"):
-                self.accessjwt = session_data.get("accessJwt")
-                self.refreshjwt = session_data.get("refreshJwt")
-                self.last_refresh = datetime.now(timezone.utc)
+            if self._apply_session(response.json()):
                 self.logger.info("Refreshed JWT")
-            else:
-                self.logger.error("Failed to refresh JWT")
-                return
+                return True
 
+            self.logger.error("Failed to refresh JWT")
+            return False
         except Exception:
             self.logger.error("An error occurred", exc_info=True)
-            return
+            return False
 
     def _should_refresh(self) -> bool:
+        now = datetime.now(timezone.utc)
+        if self.access_expires_at is not None:
+            return now >= self.access_expires_at - timedelta(
+                seconds=self.refresh_margin
+            )
+
         if self.last_refresh is None:
             return True
-        elapsed_time = (datetime.now(timezone.utc) - self.last_refresh).total_seconds()
+        elapsed_time = (now - self.last_refresh).total_seconds()
         return elapsed_time > self.refresh_interval
 
     def _refresh_token(self) -> None:
-        if self._should_refresh():
-            self._request_refresh_jwt()
+        if not self._should_refresh():
+            return
+
+        # 同時に複数のスレッドが期限切れを検知しても、更新は一度だけ行う
+        with self._session_lock:
+            if self._should_refresh():
+                self._request_refresh_jwt()
 
     def _parse_uri(self, uri: str) -> dict:
         try:
@@ -209,7 +442,30 @@ class BlueskyClient(BaseSocialClient):
             self.logger.error("An error occurred", exc_info=True)
             return {}
 
+    def _thread_root(self, reply_to: str | None) -> str | None:
+        if reply_to is None:
+            return None
+        return self._get_reply_refs(reply_to).get("root", {}).get("uri", reply_to)
+
+    def _remember_thread_ref(self, ref: dict, root: dict) -> None:
+        with self._thread_refs_lock:
+            self._thread_refs[ref["uri"]] = {"root": root, "parent": ref}
+            self._thread_refs.move_to_end(ref["uri"])
+            while len(self._thread_refs) > self.thread_refs_maxsize:
+                self._thread_refs.popitem(last=False)
+
+    def _get_cached_reply_refs(self, uri: str) -> dict[str, dict] | None:
+        with self._thread_refs_lock:
+            refs = self._thread_refs.get(uri)
+            if refs is not None:
+                self._thread_refs.move_to_end(uri)
+            return refs
+
     def _get_reply_refs(self, uri: str) -> dict[str, dict]:
+        cached = self._get_cached_reply_refs(uri)
+        if cached is not None:
+            return cached
+
         try:
             url = self.HOST + self.GET_RECORD_ENDPOINT
             uri_parts = self._parse_uri(uri)
@@ -235,16 +491,10 @@ class BlueskyClient(BaseSocialClient):
             else:
                 root = parent
 
-            return {
-                "root": {
-                    "uri": root["uri"],
-                    "cid": root["cid"],
-                },
-                "parent": {
-                    "uri": parent["uri"],
-                    "cid": parent["cid"],
-                },
-            }
+            root_ref = {"uri": root["uri"], "cid": root["cid"]}
+            parent_ref = {"uri": parent["uri"], "cid": parent["cid"]}
+            self._remember_thread_ref(parent_ref, root_ref)
+            return {"root": root_ref, "parent": parent_ref}
         except Exception:
             self.logger.error("An error occurred", exc_info=True)
             return {}
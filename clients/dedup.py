@@ -0,0 +1,170 @@
+import hashlib
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+from traininfo.database import get_redis_client
+from utils.make_logger import make_logger
+from utils.metrics import REGISTRY
+
+DEDUP_KEY = "traininfo:dedup:{digest}"
+ATTEMPT_KEY = "traininfo:dedup:attempt:{digest}"
+
+logger = make_logger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    比較用に投稿内容を正規化する。NFKC正規化し、空白の違いを無視する。
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class PostDeduplicator:
+    """
+    配信済みの投稿を記録し、同じ投稿の重複を防ぐ
+
+    (サービス, アカウント, 正規化した投稿内容, スレッドのroot)のハッシュをキーに、
+    投稿のrefを有効期限付きで保存する。Redisが利用可能な場合はRedisに、
+    利用できない場合は上限付きのプロセス内キャッシュに保存する。
+
+    Attributes
+    ----------
+    ttl : int
+        記録の有効期限（秒）
+    maxsize : int
+        プロセス内キャッシュの最大件数
+    hits : int
+        重複と判定した回数
+    misses : int
+        重複ではないと判定した回数
+
+    Methods
+    -------
+    lookup(service: str, account: str, text: str, root: str | None) -> str | None
+        配信済みであればその投稿のrefを返す
+    record(service: str, account: str, text: str, root: str | None, ref: str) -> None
+        配信済みとして記録する
+    record_attempt(service: str, account: str, text: str, root: str | None, at: float) -> None
+        成否が確認できなかった投稿の試行時刻を記録する
+    last_attempt(service: str, account: str, text: str, root: str | None) -> float | None
+        成否が確認できなかった投稿の試行時刻を返す
+    """
+
+    def __init__(self, ttl: int = 900, maxsize: int = 4096) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._local: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._attempts: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(service: str, account: str, text: str, root: str | None) -> str:
+        payload = "\0".join([service, account, root or "", normalize_text(text)])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(
+        self, service: str, account: str, text: str, root: str | None
+    ) -> str | None:
+        key = self.make_key(service, account, text, root)
+        ref = self._get(self._local, DEDUP_KEY, key)
+        with self._lock:
+            if ref is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return ref
+
+    def record(
+        self, service: str, account: str, text: str, root: str | None, ref: str
+    ) -> None:
+        key = self.make_key(service, account, text, root)
+        self._set(self._local, DEDUP_KEY, key, ref)
+
+    def record_attempt(
+        self, service: str, account: str, text: str, root: str | None, at: float
+    ) -> None:
+        """
+        タイムアウトなどで成否が確認できなかった投稿の試行時刻（UNIX時間）を記録する。
+        再試行の前にこの時刻以降の投稿を確認し、サーバーで投稿済みの場合は再投稿しない。
+        """
+        key = self.make_key(service, account, text, root)
+        self._set(self._attempts, ATTEMPT_KEY, key, str(at))
+
+    def last_attempt(
+        self, service: str, account: str, text: str, root: str | None
+    ) -> float | None:
+        key = self.make_key(service, account, text, root)
+        at = self._get(self._attempts, ATTEMPT_KEY, key)
+        return None if at is None else float(at)
+
+    def _set(
+        self,
+        local: OrderedDict[str, tuple[float, str]],
+        template: str,
+        key: str,
+        value: str,
+    ) -> None:
+        with self._lock:
+            local[key] = (time.monotonic() + self.ttl, value)
+            local.move_to_end(key)
+            while len(local) > self.maxsize:
+                local.popitem(last=False)
+
+        r = get_redis_client()
+        if r is None:
+            return
+        try:
+            r.set(template.format(digest=key), value, ex=self.ttl)
+        except Exception:
+            logger.error("Failed to record post", exc_info=True)
+
+    def _get(
+        self, local: OrderedDict[str, tuple[float, str]], template: str, key: str
+    ) -> str | None:
+        with self._lock:
+            cached = local.get(key)
+            if cached is not None:
+                expires_at, value = cached
+                if expires_at > time.monotonic():
+                    return value
+                del local[key]
+
+        r = get_redis_client()
+        if r is None:
+            return None
+        try:
+            return r.get(template.format(digest=key))  # type: ignore[return-value]
+        except Exception:
+            logger.error("Failed to look up post", exc_info=True)
+            return None
+
+
+@lru_cache(maxsize=1)
+def get_deduplicator() -> PostDeduplicator:
+    """
+    プロセス内で共有する重複排除のインスタンスを取得する。
+
+    Returns
+    -------
+    PostDeduplicator
+        重複排除のインスタンス
+    """
+    return PostDeduplicator(ttl=int(os.getenv("POST_DEDUP_TTL", "900")))
+
+
+REGISTRY.register_callback(
+    "traininfo_dedup_lookups_total",
+    "Duplicate post lookups by result",
+    "counter",
+    lambda: [
+        ({"result": "hit"}, get_deduplicator().hits),
+        ({"result": "miss"}, get_deduplicator().misses),
+    ],
+)
@@ -1,46 +1,142 @@
-from misskey import Misskey
-from misskey.exceptions import MisskeyAPIException
+import hashlib
+import time
+from threading import Lock
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
 
 from enums import AuthType, Service
 from utils.make_logger import make_logger
 
 from .baseclient import BaseSocialClient, PostResponse
+from .dedup import normalize_text
+
+_SHARED_SESSION: requests.Session | None = None
+_SHARED_SESSION_LOCK = Lock()
+
+
+def get_shared_session(pool_maxsize: int = 10) -> requests.Session:
+    """
+    Misskeyクライアント間で共有するkeep-aliveセッションを取得する。一度作成したらキャッシュする。
+
+    Parameters
+    ----------
+    pool_maxsize : int, optional
+        コネクションプールの最大数, by default 10
+
+    Returns
+    -------
+    requests.Session
+        共有セッション
+    """
+    global _SHARED_SESSION
+    with _SHARED_SESSION_LOCK:
+        if _SHARED_SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _SHARED_SESSION = session
+        return _SHARED_SESSION
+
+
+class MisskeyAPIError(Exception):
+    """
+    Misskey APIがエラーを返した場合の例外
+    """
+
+    def __init__(self, status: int, error: dict[str, Any] | None = None) -> None:
+        error = error or {}
+        self.status = status
+        self.code: str = error.get("code", "UNKNOWN")
+        self.message: str = error.get("message", "Unknown error")
+        super().__init__(f"{self.code} ({status}): {self.message}")
 
 
 class MisskeyIOClient(BaseSocialClient):
-    def __init__(self, context: str | None = None) -> None:
+    # トークンのハッシュとアカウントIDの対応。検証済みのトークンは再検証しない
+    _validated_tokens: dict[str, str] = {}
+    _validated_tokens_lock = Lock()
+
+    def __init__(
+        self,
+        context: str | None = None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 20.0,
+    ) -> None:
         self.logger = make_logger(type(self).__name__, context=context)
         super().__init__(
             service_name=Service.MISSKEYIO,
             auth_type=AuthType.TOKEN,
             post_string_limit=3000,
+            # notes/createは1時間あたり300件まで
+            rate=300 / 3600,
+            burst=10,
+            max_in_flight=2,
         )
 
+        self.session = get_shared_session()
+        self.timeout = (connect_timeout, read_timeout)
         self.token: str | None = None
-        self.misskey: Misskey | None = None
 
         self.HOST: str = "https://misskey.io"
+        self.I_ENDPOINT = "/api/i"
+        self.CREATE_NOTE_ENDPOINT = "/api/notes/create"
+        self.USER_NOTES_ENDPOINT = "/api/users/notes"
+
+    def _request(self, endpoint: str, payload: dict[str, Any]) -> Any:
+        response = self.session.post(
+            self.HOST + endpoint,
+            json={"i": self.token, **payload},
+            timeout=self.timeout,
+        )
+        self.rate_limiter.update_from_headers(response.headers)
+        if response.status_code >= 400:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            raise MisskeyAPIError(response.status_code, error)
+
+        if response.status_code == 204 or not response.content:
+            return {}
+        return response.json()
 
     def login(self, token: str | None) -> bool:
+        """
+        トークンを検証する。
+        一度検証に成功したトークンはプロセス内でキャッシュし、再度APIを呼ばない。
+        """
         if not token:
             self.logger.error("Missing token")
             return False
 
+        self.token = token
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        with self._validated_tokens_lock:
+            account_id = self._validated_tokens.get(token_hash)
+
         try:
-            self.misskey = Misskey(self.HOST, i=token)
-            meta = self.misskey.meta()
+            if account_id is None:
+                account_id = self._request(self.I_ENDPOINT, {}).get("id")
+                if not account_id:
+                    self.logger.error("Failed to validate token")
+                    return False
+                with self._validated_tokens_lock:
+                    self._validated_tokens[token_hash] = account_id
 
-            if meta:
-                self.logger.info("Login successful")
-            return bool(meta)
-        except MisskeyAPIException as e:
+            self.bind_account(account_id)
+            self.logger.info("Login successful")
+            return True
+        except MisskeyAPIError as e:
             self.logger.error(f"Misskey API Error: {e.message}", exc_info=True)
             return False
         except Exception:
             self.logger.error("An error occurred", exc_info=True)
             return False
 
-    def post(
+    def _post(
         self,
         text: str,
         reply_to: str | None = None,
@@ -65,25 +161,105 @@ class MisskeyIOClient(BaseSocialClient):
 
         notes
         -----
-        401エラーが発生した場合、再試行は行わない
+        401/403エラーが発生した場合、再試行は行わない
+        タイムアウトした場合は試行を記録し、再試行の前に作成済みのノートがないか確認する
         returnした投稿情報を直接渡せばリプライが可能
         """
-        if not self.misskey:
+        if not self.token:
             self.logger.error("Client not logged in")
             return PostResponse(success=False, error="Client not logged in")
 
+        payload: dict[str, Any] = {"text": text}
+        if reply_to:
+            payload["replyId"] = reply_to
+
+        # タイムアウトした試行はサーバーで作成済みの可能性があるため、記録して再投稿前に確認する
+        dedup_args = (
+            self.service_name,
+            self.account,
+            text,
+            self._thread_root(reply_to),
+        )
+        attempted_at = self.deduplicator.last_attempt(*dedup_args)
+        error = "An exception occurred"
         for i in range(max_retries):
+            if attempted_at is not None:
+                note = self._find_recent_note(text, reply_to, attempted_at)
+                if note is not None:
+                    self.logger.info(f"Note was already created: {note['id']}")
+                    return PostResponse(
+                        success=True, ref=note["id"], raw={"createdNote": note}
+                    )
             try:
-                result = self.misskey.notes_create(text=text, reply_id=reply_to)
+                with self.rate_limiter.acquire():
+                    result = self._request(self.CREATE_NOTE_ENDPOINT, payload)
                 return PostResponse(
                     success=True,
                     ref=result.get("createdNote", {}).get("id"),
                     raw=result,
                 )
-            except Exception:
+            except MisskeyAPIError as e:
+                self.logger.error(f"Misskey API Error: {e}")
+                error = str(e)
+                if e.status in (401, 403):
+                    return PostResponse(success=False, error=error)
+                if e.status == 429 or e.code == "RATE_LIMIT_EXCEEDED":
+                    self.rate_limiter.block_for(2**i * 10)
+            except requests.Timeout as e:
+                self.logger.warning(f"Request timed out: {e}")
+                error = str(e)
+                if attempted_at is None:
+                    attempted_at = time.time()
+                    self.deduplicator.record_attempt(*dedup_args, attempted_at)
+            except Exception as e:
                 self.logger.error("An error occurred", exc_info=True)
-                if i < max_retries - 1:
-                    self.logger.info(f"Retrying... ({i + 1}/{max_retries})")
-                    continue
+                error = str(e)
+
+            if i < max_retries - 1:
+                self.logger.info(f"Retrying... ({i + 1}/{max_retries})")
+                time.sleep(min(2**i, 10))
+
+        return PostResponse(success=False, error=error)
+
+    def _find_recent_note(
+        self, text: str, reply_to: str | None, since: float
+    ) -> dict[str, Any] | None:
+        """
+        試行時刻以降の自身のノートから、同じ内容・同じ返信先のノートを探す。
+        確認できなかった場合はNoneを返し、再投稿する。
+        """
+        try:
+            notes = self._request(
+                self.USER_NOTES_ENDPOINT,
+                {
+                    "userId": self.account,
+                    "limit": 20,
+                    # サーバーとの時刻のずれを考慮して少し前から確認する
+                    "sinceDate": int((since - 60) * 1000),
+                },
+            )
+        except Exception:
+            self.logger.error("Failed to fetch recent notes", exc_info=True)
+            return None
+
+        expected = normalize_text(text)
+        for note in notes if isinstance(notes, list) else []:
+            if (
+                normalize_text(note.get("text") or "") == expected
+                and note.get("replyId") == reply_to
+            ):
+                return note
+        return None
+
+    async def apost(
+        self,
+        text: str,
+        reply_to: str | None = None,
+        max_retries: int = 3,
+    ) -> PostResponse:
+        """
+        postの非同期版。イベントループを塞がないよう、ワーカースレッドで実行する。
+        """
+        import asyncio
 
-        return PostResponse(success=False, error="An exception occurred")
+        return await asyncio.to_thread(self.post, text, reply_to, max_retries)
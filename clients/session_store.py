@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import json
+import os
+from typing import Any
+
+from traininfo.database import get_redis_client
+from utils.make_logger import PROJECT_ROOT, make_logger
+
+SESSION_KEY = "traininfo:session:{service}:{account}"
+SESSION_DIR = os.path.join(PROJECT_ROOT, ".sessions")
+
+logger = make_logger(__name__)
+
+
+class SessionStore:
+    """
+    ログインセッションを暗号化して保存するストア
+
+    Redisが利用可能な場合はRedisに、利用できない場合はローカルファイルに保存する。
+    暗号化にはcryptographyのFernetを使い、鍵は環境変数SESSION_ENCRYPTION_KEYから導出する。
+    鍵が未設定またはcryptographyが利用できない場合、平文で保存しないよう永続化を無効にする。
+
+    Methods
+    -------
+    load(account: str) -> dict[str, Any] | None
+        保存されたセッションを読み込む
+    save(account: str, data: dict[str, Any]) -> None
+        セッションを保存する
+    delete(account: str) -> None
+        保存されたセッションを削除する
+    """
+
+    def __init__(self, service: str, secret: str | None = None) -> None:
+        self.service = service
+        self._fernet = self._create_fernet(
+            secret or os.getenv("SESSION_ENCRYPTION_KEY")
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    @staticmethod
+    def _create_fernet(secret: str | None) -> Any:
+        if not secret:
+            return None
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            logger.warning(
+                "cryptography is not installed. Session persistence is disabled"
+            )
+            return None
+
+        key = base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
+        return Fernet(key)
+
+    def _key(self, account: str) -> str:
+        return SESSION_KEY.format(service=self.service, account=account)
+
+    def _path(self, account: str) -> str:
+        digest = hashlib.sha256(self._key(account).encode()).hexdigest()
+        return os.path.join(SESSION_DIR, f"{digest}.bin")
+
+    def load(self, account: str) -> dict[str, Any] | None:
+        if self._fernet is None:
+            return None
+
+        try:
+            r = get_redis_client()
+            if r is not None:
+                token = r.get(self._key(account))
+            elif os.path.exists(self._path(account)):
+                with open(self._path(account), "r") as f:
+                    token = f.read()
+            else:
+                token = None
+
+            if not token:
+                return None
+            return json.loads(self._fernet.decrypt(str(token).encode()))
+        except Exception:
+            logger.error("Failed to load session", exc_info=True)
+            return None
+
+    def save(self, account: str, data: dict[str, Any]) -> None:
+        if self._fernet is None:
+            return
+
+        try:
+            token = self._fernet.encrypt(json.dumps(data).encode()).decode()
+            r = get_redis_client()
+            if r is not None:
+                r.set(self._key(account), token)
+                return
+
+            os.makedirs(SESSION_DIR, mode=0o700, exist_ok=True)
+            fd = os.open(
+                self._path(account), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+            )
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+        except Exception:
+            logger.error("Failed to save session", exc_info=True)
+
+    def delete(self, account: str) -> None:
+        try:
+            r = get_redis_client()
+            if r is not None:
+                r.delete(self._key(account))
+            elif os.path.exists(self._path(account)):
+                os.remove(self._path(account))
+        except Exception:
+            logger.error("Failed to delete session", exc_info=True)
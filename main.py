@@ -1,4 +1,7 @@
+import argparse
 import os
+import signal
+import sys
 import time
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
@@ -6,12 +9,31 @@ from datetime import datetime
 from dotenv import load_dotenv
 
 from enums import Region
+from runner.health import HEALTH
 from runner.manager import RegionalManager
-from server.run import server_run
-from utils.make_logger import clear_log_file, make_logger
+from runner.sharding import (
+    ShardCoordinator,
+    assign_regions,
+    default_worker_id,
+    set_local_assignment,
+)
+from runner.status_cache import STATUS_CACHE
+from utils.make_logger import (
+    configure_log_format,
+    configure_log_rotation,
+    enable_async_logging,
+    make_logger,
+)
+from utils.metrics import REGISTRY
+from utils.profiling import active_session
 
 logger = make_logger("Main")
 
+SCHEDULER_LAG_SECONDS = REGISTRY.histogram(
+    "traininfo_scheduler_lag_seconds",
+    "Delay between the scheduled and actual start of a cycle",
+)
+
 
 def _calc_next_execute(interval: int, now: datetime | None = None) -> datetime:
     now = now or datetime.now()
@@ -21,26 +43,216 @@ def _calc_next_execute(interval: int, now: datetime | None = None) -> datetime:
     return datetime.fromtimestamp(next_ts)
 
 
-def main():
+def _create_managers(
+    regions: tuple[Region, ...], login_deadline: float
+) -> dict[Region, RegionalManager]:
+    """
+    地域ごとのマネージャーを並行して作成し、ログインを開始する。
+    期限までに終わらなかったログインはバックグラウンドで継続し、初回の投稿前に再試行される。
+
+    Parameters
+    ----------
+    regions : tuple[Region, ...]
+        作成する地域
+    login_deadline : float
+        ログインを待つ最大時間（秒）
+
+    Returns
+    -------
+    dict[Region, RegionalManager]
+        地域とマネージャーの対応
+    """
+    if not regions:
+        return {}
+
+    with ThreadPoolExecutor() as executor:
+        managers = dict(zip(regions, executor.map(RegionalManager, regions)))
+
+    for manager in managers.values():
+        manager.start_login()
+
+    deadline = time.monotonic() + login_deadline
+    for region, manager in managers.items():
+        if not manager.wait_login(max(deadline - time.monotonic(), 0.0)):
+            logger.warning(
+                f"Login for {region.label} is not complete. Continuing in background"
+            )
+    return managers
+
+
+def main(worker_id: str | None = None, peers: tuple[str, ...] = ()):
+    started_at = time.monotonic()
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
-    managers = [RegionalManager(region) for region in Region]
     interval = 600 if not DEBUG else 60  # seconds
+    login_deadline = float(os.getenv("STARTUP_LOGIN_DEADLINE", "30"))
+
+    coordinator = ShardCoordinator(worker_id or default_worker_id(), peers=peers)
+    coordinator.start()
+    managers: dict[Region, RegionalManager] = {}
+    try:
+        managers.update(_create_managers(coordinator.rebalance(), login_deadline))
+        logger.info(f"Startup completed in {time.monotonic() - started_at:.2f}s")
+        _run_cycles(coordinator, managers, interval, login_deadline, started_at)
+    finally:
+        for manager in managers.values():
+            manager.close()
+        coordinator.stop()
+
+
+def _release_region(managers: dict[Region, RegionalManager], region: Region) -> None:
+    """
+    他のワーカーへ移った地域のマネージャーを停止し、状態を破棄する。
+    """
+    logger.info(f"Released region {region.label}")
+    managers.pop(region).close()
+    HEALTH.remove(region.label)
+    STATUS_CACHE.remove(region.label)
+
+
+def _run_cycles(
+    coordinator: ShardCoordinator,
+    managers: dict[Region, RegionalManager],
+    interval: int,
+    login_deadline: float,
+    started_at: float,
+) -> None:
+    first_cycle = True
+    waited = 0.0
 
     while True:
         next_execute = _calc_next_execute(interval=interval)
         now = datetime.now()
         sleep_sec = (next_execute - now).total_seconds()
+        HEALTH.scheduler_heartbeat(next_expected_in=max(sleep_sec, 0.0))
         if sleep_sec > 0:
             logger.info(f"Sleep {int(sleep_sec)} seconds")
             logger.info(f"Next execution at {next_execute:%H:%M:%S}")
             time.sleep(sleep_sec)
+            waited += sleep_sec
+            lag = (datetime.now() - next_execute).total_seconds()
+            SCHEDULER_LAG_SECONDS.labels().observe(max(lag, 0.0))
+
+        regions = coordinator.rebalance()
+        for region in set(managers) - set(regions):
+            _release_region(managers, region)
+        new_regions = tuple(r for r in regions if r not in managers)
+        managers.update(_create_managers(new_regions, login_deadline))
 
         with ThreadPoolExecutor() as executor:
-            executor.map(lambda m: m.execute(), managers)
+            executor.map(lambda m: m.execute(), managers.values())
+
+        # 計測中は投稿までを1サイクルとして数える
+        if (session := active_session()) is not None:
+            for manager in managers.values():
+                manager.join(timeout=interval)
+            session.cycle_finished()
+
+        if first_cycle:
+            elapsed = time.monotonic() - started_at
+            logger.info(
+                f"Time to first cycle: {elapsed:.2f}s "
+                f"({elapsed - waited:.2f}s excluding scheduled wait)"
+            )
+            first_cycle = False
+
+
+def _configure_logging() -> None:
+    configure_log_rotation()
+    configure_log_format()
+    if os.getenv("LOG_ASYNC", "False").lower() == "true":
+        enable_async_logging(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+
+
+def _exit_on_sigterm() -> None:
+    # SIGTERMでも終了処理(HTTPサーバーの停止やログの書き出し、マネージャーの停止)が行われるようにする
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+def _run_worker(worker_id: str, peers: tuple[str, ...], port: int) -> None:
+    load_dotenv()
+    _configure_logging()
+    # 監視プロセスの終了時にはSIGTERMで停止される
+    _exit_on_sigterm()
+
+    from server.run import server_run
+
+    # 地域の状態はこのプロセスにあるため、運行状況やメトリクスはワーカーごとのポートで提供する
+    server_run(port)
+    main(worker_id=worker_id, peers=peers)
+
+
+def run_worker_pool(processes: int, port: int = 8080) -> None:
+    """
+    地域を複数のワーカープロセスに分散して実行する。
+    終了したワーカーは再起動する。
+    各ワーカーはport+1から順にHTTPサーバーを起動し、このプロセスのサーバーはportで待ち受ける。
+
+    Parameters
+    ----------
+    processes : int
+        ワーカープロセス数
+    port : int, optional
+        このプロセスのHTTPサーバーのポート, by default 8080
+    """
+    import multiprocessing
+
+    from server.run import server_run
+
+    base_id = default_worker_id()
+    peers = tuple(f"{base_id}-{i}" for i in range(processes))
+    set_local_assignment(assign_regions(tuple(Region), peers))
+    worker_ports = {worker_id: port + 1 + i for i, worker_id in enumerate(peers)}
+    server_run(port, worker_ports=worker_ports)
+
+    ctx = multiprocessing.get_context("spawn")
+    workers: dict[str, multiprocessing.process.BaseProcess] = {}
+
+    while True:
+        for worker_id in peers:
+            process = workers.get(worker_id)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.warning(
+                    f"Worker {worker_id} exited with code {process.exitcode}. Restarting..."
+                )
+            process = ctx.Process(
+                target=_run_worker,
+                args=(worker_id, peers, worker_ports[worker_id]),
+                daemon=True,
+            )
+            process.start()
+            workers[worker_id] = process
+        # 地域の状態は各ワーカーが持つため、ここではワーカーの監視が続いていることのみ示す
+        HEALTH.scheduler_heartbeat(next_expected_in=5)
+        time.sleep(5)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print the import time of each module at startup and exit",
+    )
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from utils.startup_profile import format_report, profile_imports
+
+        print(format_report(profile_imports("main")))
+        raise SystemExit(0)
+
     load_dotenv()
-    clear_log_file()
-    server_run()
-    main()
+    _configure_logging()
+    _exit_on_sigterm()
+
+    processes = int(os.getenv("WORKER_PROCESSES", "1"))
+    if processes > 1:
+        run_worker_pool(processes)
+    else:
+        # HTTPサーバーは起動時にのみ使うため、ここで読み込む
+        from server.run import server_run
+
+        server_run()
+        main()
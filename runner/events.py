@@ -0,0 +1,264 @@
+import json
+import os
+import queue
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import count
+from threading import Lock
+
+from traininfo.message import StatusDiff
+from traininfo.trainstatus import TrainStatus
+from utils.metrics import REGISTRY
+
+
+@dataclass(frozen=True)
+class StatusEvent:
+    """
+    配信する運行状況の変化
+
+    Attributes
+    ----------
+    id : int
+        プロセス内で単調に増加する連番。SSEのイベントIDはEventBroker.event_idで作成する
+    region : str
+        地域のラベル
+    frame : bytes
+        SSEの形式にエンコード済みのイベント。全購読者で共有する
+    """
+
+    id: int
+    region: str
+    frame: bytes
+
+
+# 購読者のキューが溢れたことを知らせる番兵
+_OVERFLOW = StatusEvent(-1, "", b"")
+
+
+class Subscription:
+    """
+    イベントの購読。キューが溢れた場合は、リングバッファから再開する必要がある
+
+    Attributes
+    ----------
+    region : str | None
+        購読する地域。Noneの場合はすべての地域
+    backlog : list[StatusEvent]
+        購読開始時点でリングバッファから再送するイベント
+    gap : bool
+        再開位置のイベントがリングバッファに残っておらず、取りこぼしがある
+    position : int
+        購読開始時点の最新のイベントの連番。これより後のイベントがキューに届く
+    """
+
+    def __init__(self, region: str | None, maxsize: int) -> None:
+        self.region = region
+        self.backlog: list[StatusEvent] = []
+        self.gap = False
+        self.position = 0
+        self._maxsize = maxsize
+        # 番兵を入れる余地を1つ残しておく
+        self._queue: queue.Queue[StatusEvent | None] = queue.Queue(maxsize + 1)
+
+    def offer(self, event: StatusEvent) -> bool:
+        """
+        イベントを待たずに追加する。キューが溢れた場合は番兵を入れてFalseを返す
+        """
+        if self._queue.qsize() >= self._maxsize:
+            self._queue.put_nowait(_OVERFLOW)
+            return False
+        self._queue.put_nowait(event)
+        return True
+
+    def close(self) -> None:
+        self._queue.put_nowait(None)
+
+    def get(self, timeout: float) -> StatusEvent | None:
+        """
+        次のイベントを取得する。
+
+        Returns
+        -------
+        StatusEvent | None
+            イベント。timeout秒以内に届かない場合はNone
+
+        Raises
+        ------
+        OverflowError
+            キューが溢れ、以降のイベントを取りこぼした場合
+        EOFError
+            購読が終了した場合
+        """
+        try:
+            event = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if event is None:
+            raise EOFError
+        if event is _OVERFLOW:
+            raise OverflowError
+        return event
+
+
+class EventBroker:
+    """
+    運行状況の変化を購読者へ配信する
+
+    直近のイベントをリングバッファに保持し、Last-Event-IDからの再開に使う。
+    イベントIDは"{epoch}-{連番}"の形式で、epochはインスタンスごとに異なる。
+    再起動前や他のプロセスのIDで再開しようとした場合は、取りこぼしとして扱う。
+    配信は購読者ごとの有界なキューへ待たずに追加するだけなので、遅い購読者が
+    ボットのサイクルを止めることはない。キューが溢れた購読者はリングバッファから再開する。
+
+    Attributes
+    ----------
+    epoch : str
+        このインスタンスのイベントIDの接頭辞
+
+    Methods
+    -------
+    publish_diff(region: str, diff: StatusDiff) -> list[StatusEvent]
+        差分を路線ごとのイベントとして配信する
+    event_id(seq: int) -> str
+        連番からSSEのイベントIDを作成する
+    subscribe(region: str | None = None, last_event_id: str | None = None) -> Subscription
+        購読を開始する
+    unsubscribe(subscription: Subscription) -> None
+        購読を終了する
+    close() -> None
+        すべての購読を終了する
+    """
+
+    def __init__(self, buffer_size: int = 1024, queue_size: int = 256) -> None:
+        self.queue_size = queue_size
+        self.epoch = os.urandom(4).hex()
+        self._buffer: deque[StatusEvent] = deque(maxlen=buffer_size)
+        self._subscribers: set[Subscription] = set()
+        self._ids = count(1)
+        self._last_id = 0
+        self.overflows = 0
+        self._lock = Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, region: str, event_type: str, data: dict) -> StatusEvent:
+        with self._lock:
+            event_id = next(self._ids)
+            payload = json.dumps(
+                {"region": region, **data}, ensure_ascii=False, separators=(",", ":")
+            )
+            event = StatusEvent(
+                event_id,
+                region,
+                f"id: {self.event_id(event_id)}\nevent: {event_type}\n"
+                f"data: {payload}\n\n".encode(),
+            )
+            self._buffer.append(event)
+            self._last_id = event_id
+            for subscription in list(self._subscribers):
+                if subscription.region not in (None, region):
+                    continue
+                if not subscription.offer(event):
+                    self._subscribers.discard(subscription)
+                    self.overflows += 1
+            return event
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def _parse_event_id(self, event_id: str) -> int | None:
+        epoch, _, seq = event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish_diff(self, region: str, diff: StatusDiff) -> list[StatusEvent]:
+        """
+        差分を路線ごとのイベント（changed, new, resolved）として配信する。
+        """
+        at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        changes: list[tuple[str, str, str | None, TrainStatus | None]] = [
+            *(("changed", ts.train, prev.status, ts) for ts, prev in diff.changed),
+            *(("new", ts.train, None, ts) for ts in diff.new),
+            *(("resolved", prev.train, prev.status, None) for prev in diff.resolved),
+        ]
+        return [
+            self.publish(
+                region,
+                event_type,
+                {
+                    "train": train,
+                    "previous_status": previous_status,
+                    "status": latest.status if latest else None,
+                    "detail": latest.detail if latest else None,
+                    "at": at,
+                },
+            )
+            for event_type, train, previous_status, latest in changes
+        ]
+
+    def subscribe(
+        self, region: str | None = None, last_event_id: str | None = None
+    ) -> Subscription:
+        """
+        購読を開始する。
+
+        Parameters
+        ----------
+        region : str | None, optional
+            購読する地域。Noneの場合はすべての地域
+        last_event_id : str | None, optional
+            最後に受信したイベントID。指定した場合は、それより後のイベントをbacklogに入れる
+
+        Returns
+        -------
+        Subscription
+            購読
+        """
+        subscription = Subscription(region, self.queue_size)
+        with self._lock:
+            subscription.position = self._last_id
+            if last_event_id is not None:
+                seq = self._parse_event_id(last_event_id)
+                if seq is None or seq > self._last_id:
+                    # 再起動前や他のプロセスのIDのため、どこまで受信したか分からない
+                    subscription.gap = True
+                else:
+                    oldest = self._buffer[0].id if self._buffer else self._last_id + 1
+                    subscription.gap = seq < oldest - 1
+                    subscription.backlog = [
+                        event
+                        for event in self._buffer
+                        if event.id > seq and region in (None, event.region)
+                    ]
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self) -> None:
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription.close()
+            self._subscribers.clear()
+
+
+EVENTS = EventBroker()
+
+REGISTRY.register_callback(
+    "traininfo_sse_subscribers",
+    "Connected status event subscribers",
+    "gauge",
+    lambda: [({}, EVENTS.subscribers)],
+)
+REGISTRY.register_callback(
+    "traininfo_sse_overflows_total",
+    "Subscribers that fell behind and resumed from the ring buffer",
+    "counter",
+    lambda: [({}, EVENTS.overflows)],
+)
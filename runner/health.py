@@ -0,0 +1,192 @@
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+
+@dataclass
+class HealthThresholds:
+    """
+    ヘルスチェックの閾値（秒）
+
+    Attributes
+    ----------
+    scheduler_grace : float
+        スケジューラが予定の時刻を過ぎても応答しない場合に異常とみなすまでの猶予
+    cycle_timeout : float
+        1回のサイクルがこの時間を超えて終わらない場合に異常とみなす
+    fetch_stale : float
+        最後に運行情報の取得に成功してからこの時間を過ぎた場合に準備未完了とみなす
+    post_stale : float
+        最後に投稿に成功してからこの時間を過ぎた場合に準備未完了とみなす。0の場合は確認しない
+    """
+
+    scheduler_grace: float = 120.0
+    cycle_timeout: float = 300.0
+    fetch_stale: float = 1800.0
+    post_stale: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "HealthThresholds":
+        return cls(
+            scheduler_grace=float(os.getenv("HEALTH_SCHEDULER_GRACE", "120")),
+            cycle_timeout=float(os.getenv("HEALTH_CYCLE_TIMEOUT", "300")),
+            fetch_stale=float(os.getenv("HEALTH_FETCH_STALE", "1800")),
+            post_stale=float(os.getenv("HEALTH_POST_STALE", "0")),
+        )
+
+
+@dataclass
+class RegionHealth:
+    """
+    地域ごとの稼働状況。時刻はすべてmonotonic
+
+    Attributes
+    ----------
+    heartbeat_at : float | None
+        最後にサイクルを終えた時刻
+    cycle_started_at : float | None
+        実行中のサイクルの開始時刻。実行中でなければNone
+    last_fetch_at : float | None
+        最後に運行情報の取得に成功した時刻
+    last_post_at : float | None
+        最後に投稿に成功した時刻
+    logged_in : dict[str, bool]
+        サービスごとのログイン状態
+    """
+
+    heartbeat_at: float | None = None
+    cycle_started_at: float | None = None
+    last_fetch_at: float | None = None
+    last_post_at: float | None = None
+    logged_in: dict[str, bool] = field(default_factory=dict)
+
+    def cycle_started(self) -> None:
+        self.cycle_started_at = monotonic()
+
+    def cycle_finished(self) -> None:
+        self.cycle_started_at = None
+        self.heartbeat_at = monotonic()
+
+    def fetch_succeeded(self) -> None:
+        self.last_fetch_at = monotonic()
+
+    def post_succeeded(self) -> None:
+        self.last_post_at = monotonic()
+
+    def set_logged_in(self, service: str, logged_in: bool) -> None:
+        self.logged_in[service] = logged_in
+
+
+def _age(at: float | None, now: float) -> float | None:
+    return None if at is None else round(now - at, 1)
+
+
+class HealthRegistry:
+    """
+    スケジューラと各地域の稼働状況を保持し、liveness/readinessを判定する
+
+    判定はメモリ上の状態のみから行い、I/Oは発生しない。
+
+    Methods
+    -------
+    scheduler_heartbeat(next_expected_in: float) -> None
+        スケジューラの応答を記録する
+    region(label: str) -> RegionHealth
+        地域の稼働状況を取得する。未登録の場合は作成する
+    remove(label: str) -> None
+        担当から外れた地域を削除する
+    liveness() -> tuple[bool, dict[str, Any]]
+        スケジューラや地域のサイクルが停止していないかを判定する
+    readiness() -> tuple[bool, dict[str, Any]]
+        ログイン済みで、運行情報を取得できているかを判定する
+    """
+
+    def __init__(self, thresholds: HealthThresholds | None = None) -> None:
+        self._thresholds = thresholds
+        self._regions: dict[str, RegionHealth] = {}
+        self._scheduler_deadline: float | None = None
+        self._lock = Lock()
+
+    @property
+    def thresholds(self) -> HealthThresholds:
+        # 環境変数を読み込んだ後に参照するため、初回の判定時に作成する
+        if self._thresholds is None:
+            self._thresholds = HealthThresholds.from_env()
+        return self._thresholds
+
+    def scheduler_heartbeat(self, next_expected_in: float = 0.0) -> None:
+        """
+        スケジューラの応答を記録する。
+
+        Parameters
+        ----------
+        next_expected_in : float, optional
+            次に応答する予定までの秒数。待機中はこの時間に猶予を加えた間、正常とみなす
+        """
+        self._scheduler_deadline = monotonic() + next_expected_in
+
+    def region(self, label: str) -> RegionHealth:
+        with self._lock:
+            return self._regions.setdefault(label, RegionHealth())
+
+    def remove(self, label: str) -> None:
+        with self._lock:
+            self._regions.pop(label, None)
+
+    def _snapshot(self) -> list[tuple[str, RegionHealth]]:
+        with self._lock:
+            return list(self._regions.items())
+
+    def liveness(self) -> tuple[bool, dict[str, Any]]:
+        now = monotonic()
+        thresholds = self.thresholds
+        problems: list[str] = []
+
+        deadline = self._scheduler_deadline
+        if deadline is not None and now > deadline + thresholds.scheduler_grace:
+            problems.append(f"scheduler is overdue by {now - deadline:.0f}s")
+
+        regions: dict[str, Any] = {}
+        for label, health in self._snapshot():
+            running = _age(health.cycle_started_at, now)
+            if running is not None and running > thresholds.cycle_timeout:
+                problems.append(f"{label} cycle has been running for {running:.0f}s")
+            regions[label] = {
+                "heartbeat_age": _age(health.heartbeat_at, now),
+                "cycle_running_for": running,
+            }
+
+        return not problems, {"problems": problems, "regions": regions}
+
+    def readiness(self) -> tuple[bool, dict[str, Any]]:
+        now = monotonic()
+        thresholds = self.thresholds
+        problems: list[str] = []
+
+        regions: dict[str, Any] = {}
+        for label, health in self._snapshot():
+            fetch_age = _age(health.last_fetch_at, now)
+            post_age = _age(health.last_post_at, now)
+            if fetch_age is None:
+                problems.append(f"{label} has not fetched train info yet")
+            elif fetch_age > thresholds.fetch_stale:
+                problems.append(f"{label} last fetched {fetch_age:.0f}s ago")
+            if thresholds.post_stale and (
+                post_age is None or post_age > thresholds.post_stale
+            ):
+                problems.append(f"{label} has not posted for too long")
+            for service, logged_in in health.logged_in.items():
+                if not logged_in:
+                    problems.append(f"{label} is not logged in to {service}")
+            regions[label] = {
+                "last_fetch_age": fetch_age,
+                "last_post_age": post_age,
+                "logged_in": dict(health.logged_in),
+            }
+
+        return not problems, {"problems": problems, "regions": regions}
+
+
+HEALTH = HealthRegistry()
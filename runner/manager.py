@@ -1,15 +1,96 @@
+import math
 import os
 from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from time import monotonic
 
-from clients.baseclient import BaseSocialClient
+from clients.baseclient import BaseSocialClient, PostResponse
 from clients.bluesky import BlueskyClient
 from clients.misskeyio import MisskeyIOClient
 from enums import AuthType, Region, Service
 from traininfo.database import get_previous_status, set_latest_status
-from traininfo.message import create_message
+from traininfo.message import create_message, diff_status, render_messages
 from traininfo.request import TrainInfoClient
 from traininfo.trainstatus import TrainStatus
+from utils.log_context import cycle, cycle_timings, log_context, timed
 from utils.make_logger import make_logger
+from utils.metrics import REGISTRY
+
+from .events import EVENTS
+from .health import HEALTH
+from .outbox import Outbox, OutboxEntry
+from .pipeline import Stage
+from .status_cache import STATUS_CACHE
+
+CYCLE_SECONDS = REGISTRY.histogram(
+    "traininfo_cycle_seconds",
+    "Duration of fetching train info and submitting it to the diff stage",
+    ("region",),
+)
+DIFF_MESSAGES = REGISTRY.histogram(
+    "traininfo_diff_messages",
+    "Number of messages produced by a diff (0 when unchanged)",
+    ("region",),
+    buckets=(0, 1, 2, 3, 5, 10, 20),
+)
+POST_JOB_SECONDS = REGISTRY.histogram(
+    "traininfo_post_job_seconds",
+    "Time from a post job being created until it is processed",
+    ("region",),
+)
+OUTBOX_RETRIES = REGISTRY.counter(
+    "traininfo_outbox_retries_total",
+    "Outbox entries scheduled for retry",
+    ("region", "service"),
+)
+
+
+@dataclass
+class FetchedStatus:
+    """
+    fetchステージからdiffステージへ渡す取得結果
+    """
+
+    table_name: str | None
+    latest: tuple[TrainStatus, ...]
+
+
+@dataclass
+class PostJob:
+    """
+    diffステージからpostステージへ渡す投稿ジョブ
+    """
+
+    table_name: str | None
+    latest: tuple[TrainStatus, ...]
+    previous: tuple[TrainStatus, ...]
+    created_at: float = field(default_factory=monotonic)
+
+    def merge(self, newer: "PostJob") -> "PostJob":
+        """
+        未投稿のジョブに新しいジョブを合流させる。
+        前回の状態は最後に投稿した状態のまま、最新の状態のみ更新する。
+        """
+        return PostJob(
+            table_name=newer.table_name,
+            latest=newer.latest,
+            previous=self.previous,
+            created_at=self.created_at,
+        )
+
+
+@dataclass
+class LoginState:
+    """
+    クライアントごとのログイン状態
+    """
+
+    logged_in: bool = False
+    attempts: int = 0
+    next_attempt_at: float = 0.0  # monotonic
+    lock: Lock = field(default_factory=Lock)
 
 
 class RegionalManager:
@@ -26,17 +107,35 @@ class RegionalManager:
         ロガー
     clients : dict[Service, BaseSocialClient]
         各サービスのクライアント辞書
+    diff_stage : Stage[FetchedStatus]
+        取得結果と前回の状態を比較するステージ
+    post_stage : Stage[PostJob]
+        投稿と最新データの保存を行うステージ
+    outboxes : dict[Service, Outbox]
+        各サービスの未配信投稿の送信箱
+    login_states : dict[Service, LoginState]
+        各サービスのログイン状態
 
     Methods
     -------
+    login(service: Service) -> bool
+        指定されたサービスのクライアントでログインを試みる
     login_all() -> bool
-        すべてのクライアントでログインを試みる
+        すべてのクライアントで並行してログインを試みる
+    start_login() -> None
+        すべてのクライアントがログインするまで、バックグラウンドでログインを再試行する
+    wait_login(timeout: float | None = None) -> bool
+        すべてのクライアントがログインするまで待機する
     get_auth(service: Service, auth_type: AuthType) -> tuple[str, ...] | None
         指定されたサービスと認証タイプに基づいて認証情報を取得する
     _get_table_name() -> str | None
         データベースのテーブル名を取得する
     execute() -> None
-        運行情報の取得、メッセージの生成、投稿を実行する
+        運行情報を取得し、diffステージへ投入する
+    join(timeout: float | None = None) -> bool
+        投入済みの処理がすべて完了するまで待機する
+    close(timeout: float = 10.0) -> bool
+        各ステージとログインの再試行を停止する
     """
 
     _CLIENT_MAP: dict[Service, type[BlueskyClient] | type[MisskeyIOClient]] = {
@@ -55,25 +154,108 @@ class RegionalManager:
             for service, client_class in self._CLIENT_MAP.items()
         }
 
-        self.login_all()
+        self.outboxes: dict[Service, Outbox] = {
+            service: Outbox(region.label, service.label) for service in self.clients
+        }
 
-    def login_all(self) -> bool:
+        # 最後にpostステージへ渡した状態。diffはRedisではなくこれを基準に行う
+        self._snapshot: tuple[TrainStatus, ...] | None = None
+        self.diff_stage: Stage[FetchedStatus] = Stage(
+            "diff", self._diff, context=region.label.upper()
+        )
+        self.post_stage: Stage[PostJob] = Stage(
+            "post", self._deliver, merge=PostJob.merge, context=region.label.upper()
+        )
+
+        # ログインは初回の投稿までに済めばよいため、ここでは行わない
+        self.login_states: dict[Service, LoginState] = {
+            service: LoginState() for service in self.clients
+        }
+        self.login_backoff: float = 5.0  # seconds
+        self.login_max_backoff: float = 300.0  # seconds
+        self._all_logged_in = Event()
+        self._login_thread: Thread | None = None
+        self._closed = Event()
+
+        self.health = HEALTH.region(region.label)
+        for service in self.clients:
+            self.health.set_logged_in(service.label, False)
+
+    def login(self, service: Service) -> bool:
         """
-        すべてのクライアントでログインを試みる
+        指定されたサービスのクライアントでログインを試みる。
+        ログイン済みの場合は何もしない。失敗した場合は指数バックオフの間、再試行しない。
+
+        Parameters
+        ----------
+        service : Service
+            ログインするサービス
 
         Returns
         -------
         bool
-            すべてのクライアントが正常にログインできた場合はTrue、そうでない場合はFalse
+            ログイン済みの場合はTrue
         """
-        is_succeed: list[bool] = []
-
-        for service, client in self.clients.items():
+        state = self.login_states[service]
+        with state.lock:
+            if state.logged_in:
+                return True
+            if monotonic() < state.next_attempt_at:
+                return False
+
+            client = self.clients[service]
             auth = self.get_auth(service, client.auth_type)
             if auth is None:
-                is_succeed.append(False)
-                continue
-            is_succeed.append(client.login(*auth))
+                # 認証情報が設定されていない場合は再試行しても成功しない
+                state.next_attempt_at = math.inf
+                return False
+
+            if client.login(*auth):
+                state.logged_in = True
+                self.health.set_logged_in(service.label, True)
+                if all(s.logged_in for s in self.login_states.values()):
+                    self._all_logged_in.set()
+                return True
+
+            state.attempts += 1
+            delay = min(
+                self.login_backoff * 2 ** (state.attempts - 1), self.login_max_backoff
+            )
+            state.next_attempt_at = monotonic() + delay
+            self.logger.warning(
+                f"Failed to log in to {service.label}. Retrying in {delay:.0f}s"
+            )
+            return False
+
+    def start_login(self) -> None:
+        if self._login_thread is not None:
+            return
+        self._login_thread = Thread(target=self._login_loop, daemon=True)
+        self._login_thread.start()
+
+    def wait_login(self, timeout: float | None = None) -> bool:
+        return self._all_logged_in.wait(timeout)
+
+    def _login_loop(self) -> None:
+        while not self._closed.is_set() and not self.login_all():
+            next_attempt = min(
+                s.next_attempt_at for s in self.login_states.values() if not s.logged_in
+            )
+            if next_attempt == math.inf:
+                return
+            self._closed.wait(max(next_attempt - monotonic(), 0.0))
+
+    def login_all(self) -> bool:
+        """
+        すべてのクライアントで並行してログインを試みる
+
+        Returns
+        -------
+        bool
+            すべてのクライアントが正常にログインできた場合はTrue、そうでない場合はFalse
+        """
+        with ThreadPoolExecutor() as executor:
+            is_succeed = list(executor.map(self.login, self.clients))
 
         if all(is_succeed):
             self.logger.info(f"All clients logged in for {self.region.label}")
@@ -124,25 +306,127 @@ class RegionalManager:
 
     def execute(self) -> None:
         """
-        運行情報の取得、メッセージの生成、投稿を実行する
+        運行情報を取得し、diffステージへ投入する。
+        比較と投稿は各ステージのスレッドで行われるため、投稿が遅れても取得の周期は保たれる。
+        各ステージのログには、このサイクルのcycle_idと計測時間が付与される。
         """
-        table_name = self._get_table_name()
-        now = self._fetch_now_train_info()
-        prev = self._fetch_prev_train_info(table_name=table_name)
+        self.health.cycle_started()
+        try:
+            with (
+                cycle(self.region.label),
+                CYCLE_SECONDS.labels(self.region.label).time(),
+            ):
+                now = self._fetch_now_train_info()
+                if not now:
+                    return
+                self.health.fetch_succeeded()
+                # /statusの応答はSourceやRedisに触れず、この時点の状態から返す
+                STATUS_CACHE.publish(self.region.label, now)
+
+                self.diff_stage.submit(
+                    self.region,
+                    FetchedStatus(table_name=self._get_table_name(), latest=now),
+                )
+        finally:
+            self.health.cycle_finished()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """
+        投入済みの処理がすべて完了するまで待機する
+
+        Parameters
+        ----------
+        timeout : float | None, optional
+            各ステージの最大待機時間（秒）
+
+        Returns
+        -------
+        bool
+            すべて完了した場合はTrue
+        """
+        return self.diff_stage.join(timeout) and self.post_stage.join(timeout)
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """
+        各ステージとログインの再試行を停止する。処理待ちの比較と投稿ジョブは破棄する。
+        未配信の投稿は送信箱に残るため、地域を引き継いだワーカーが配信する。
+
+        Parameters
+        ----------
+        timeout : float, optional
+            処理中のジョブとスレッドの終了を待つ最大時間（秒）, by default 10.0
+
+        Returns
+        -------
+        bool
+            すべてのスレッドが終了した場合はTrue
+        """
+        self._closed.set()
+        deadline = monotonic() + timeout
+
+        def _remaining() -> float:
+            return max(deadline - monotonic(), 0.0)
+
+        stopped = self.diff_stage.stop(discard=True, timeout=_remaining())
+        stopped = self.post_stage.stop(discard=True, timeout=_remaining()) and stopped
+        if self._login_thread is not None:
+            self._login_thread.join(_remaining())
+            stopped = stopped and not self._login_thread.is_alive()
+        if not stopped:
+            self.logger.warning("Some threads did not stop in time")
+        return stopped
+
+    def _diff(self, fetched: FetchedStatus) -> None:
+        now = fetched.latest
+        prev = self._snapshot
+        if prev is None:
+            prev = self._fetch_prev_train_info(table_name=fetched.table_name)
 
-        if not now:
-            return
         if not prev:
-            self._save_latest_data(table_name=table_name, data=now)
+            self._save_latest_data(table_name=fetched.table_name, data=now)
+            self._snapshot = now
             return
 
-        messages = create_message(now, prev)
-        if messages == ["運行状況に変更はありません。"]:
-            self.logger.info("No changes in train status")
+        with timed("diff_ms"):
+            diff = diff_status(now, prev)
+            messages = render_messages(diff)
+        unchanged = not diff.has_changes
+        DIFF_MESSAGES.labels(self.region.label).observe(
+            0 if unchanged else len(messages)
+        )
+        if unchanged:
+            self.logger.info("No changes in train status", extra=cycle_timings())
+            # 前回までに配信できなかった投稿があれば再試行する
+            if any(outbox.due(limit=1) for outbox in self.outboxes.values()):
+                self.post_stage.submit(
+                    self.region,
+                    PostJob(table_name=fetched.table_name, latest=prev, previous=prev),
+                )
             return
 
-        self._post_messages(now, prev)
-        self._save_latest_data(table_name=table_name, data=now)
+        # 投稿を待たずに、差分が確定した時点で購読者へ配信する
+        EVENTS.publish_diff(self.region.label, diff)
+        self._snapshot = now
+        self.post_stage.submit(
+            self.region,
+            PostJob(table_name=fetched.table_name, latest=now, previous=prev),
+        )
+
+    def _deliver(self, job: PostJob) -> None:
+        # 合流の結果、前回投稿した状態に戻っている場合は投稿しない
+        if create_message(job.latest, job.previous) != ["運行状況に変更はありません。"]:
+            self._enqueue_messages(job.latest, job.previous)
+
+        # 送信箱へ登録した時点で配信は保証されるため、投稿の成否に関わらず保存する
+        self._save_latest_data(table_name=job.table_name, data=job.latest)
+        with timed("post_ms"):
+            self._drain_outboxes()
+        elapsed = monotonic() - job.created_at
+        POST_JOB_SECONDS.labels(self.region.label).observe(elapsed)
+        self.logger.info(
+            f"Processed post job in {elapsed:.1f}s",
+            extra=cycle_timings(),
+        )
 
     def _get_table_name(self) -> str | None:
         """
@@ -171,7 +455,8 @@ class RegionalManager:
     def _fetch_prev_train_info(self, table_name: str | None) -> tuple[TrainStatus, ...]:
         try:
             if table_name is not None:
-                previous = get_previous_status(table_name)
+                with timed("redis_ms"):
+                    previous = get_previous_status(table_name)
             else:
                 raise RuntimeError("table name is None")
         except Exception:
@@ -184,39 +469,95 @@ class RegionalManager:
     ) -> None:
         try:
             if table_name is not None:
-                set_latest_status(table_name, list(data))
+                with timed("redis_ms"):
+                    set_latest_status(table_name, list(data))
             else:
                 raise RuntimeError("table name is None")
         except Exception:
             self.logger.error("Failed to save data", exc_info=True)
 
-    def _post(
-        self,
-        client: BaseSocialClient,
-        data: tuple[TrainStatus, ...],
-        prev: tuple[TrainStatus, ...],
-    ) -> None:
-        messages = create_message(data, prev, width=client.post_string_limit)
-        post = None
-        for i, message in enumerate(messages):
-            try:
-                post = client.post(message, post.ref if post and post.ref else None)
-                if post.success:
-                    self.logger.info(
-                        f"Completed posting to {client.service_name} {i + 1}/{len(messages)}"
-                    )
-                else:
-                    self.logger.warning(
-                        f"Failed to post message to {client.service_name} {i + 1}/{len(messages)}"
-                    )
-            except Exception:
-                self.logger.error("Failed to post message", exc_info=True)
-
-    def _post_messages(
+    def _enqueue_messages(
         self, data: tuple[TrainStatus, ...], prev: tuple[TrainStatus, ...]
     ) -> None:
-        with ThreadPoolExecutor() as executor:
-            executor.map(
-                lambda client: self._post(client, data, prev),
-                self.clients.values(),
+        for service, client in self.clients.items():
+            messages = create_message(data, prev, width=client.post_string_limit)
+            self.outboxes[service].enqueue(messages)
+
+    def _drain(self, service: Service) -> None:
+        with log_context(service=service.label):
+            self._drain_service(service)
+
+    def _drain_service(self, service: Service) -> None:
+        client = self.clients[service]
+        outbox = self.outboxes[service]
+        if not outbox.due(limit=1):
+            return
+        if not self.login(service):
+            self.logger.warning(
+                f"{client.service_name} is not logged in. Deferring pending posts"
+            )
+            return
+
+        # 古い投稿を追い越さないよう、失敗した時点で打ち切る。
+        # 地域を手放した後は、引き継いだワーカーと重複しないよう投稿しない
+        for entry in outbox.due():
+            if self._closed.is_set() or not self._post(client, outbox, entry):
+                break
+
+    def _post(
+        self, client: BaseSocialClient, outbox: Outbox, entry: OutboxEntry
+    ) -> bool:
+        total = len(entry.messages)
+        offset = entry.sent
+        if offset >= total:
+            outbox.complete(entry)
+            return True
+
+        if not entry.post_keys:
+            # 応答を受け取れなかった投稿を再試行で二重に作成しないよう、キーを先に保存する
+            entry.post_keys = [client.make_post_key() for _ in entry.messages]
+            outbox.save(entry)
+
+        def _on_posted(i: int, post: PostResponse) -> None:
+            self.logger.info(
+                f"Completed posting to {client.service_name} {offset + i + 1}/{total}"
+            )
+            entry.sent = offset + i + 1
+            entry.reply_to = post.ref
+            outbox.save(entry)
+
+        try:
+            thread = client.post_thread(
+                entry.messages[offset:],
+                entry.reply_to,
+                on_posted=_on_posted,
+                post_keys=entry.post_keys[offset:],
+            )
+        except Exception as e:
+            self.logger.error("Failed to post message", exc_info=True)
+            OUTBOX_RETRIES.labels(self.region.label, outbox.service).inc()
+            outbox.schedule_retry(entry, str(e))
+            return False
+
+        if not thread.success:
+            self.logger.warning(
+                f"Failed to post message to {client.service_name} {entry.sent + 1}/{total}"
             )
+            OUTBOX_RETRIES.labels(self.region.label, outbox.service).inc()
+            error = thread.results[-1].error if thread.results else None
+            outbox.schedule_retry(entry, error)
+            return False
+
+        self.health.post_succeeded()
+        self.logger.info(
+            f"Posted thread of {total - offset} messages to {client.service_name} "
+            f"in {thread.elapsed:.2f}s"
+        )
+        outbox.complete(entry)
+        return True
+
+    def _drain_outboxes(self) -> None:
+        # ワーカースレッドにもcycle_idなどのコンテキストを引き継ぐ
+        with ThreadPoolExecutor() as executor:
+            for service in self.clients:
+                executor.submit(copy_context().run, self._drain, service)
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from threading import Lock
+from weakref import WeakSet
+
+from traininfo.database import get_redis_client
+from utils.make_logger import make_logger
+from utils.metrics import REGISTRY
+
+OUTBOX_KEY = "traininfo:outbox:{region}:{service}"
+
+
+@dataclass
+class OutboxEntry:
+    """
+    未配信の投稿(スレッド単位)
+
+    Attributes
+    ----------
+    key : str
+        冪等キー。同じ内容のスレッドが重複して登録されないようにする
+    messages : list[str]
+        スレッドを構成するメッセージ
+    created_at : float
+        登録時刻(UNIX時間)
+    sent : int
+        配信済みのメッセージ数
+    reply_to : str | None
+        次のメッセージの返信先
+    attempts : int
+        失敗した試行回数
+    next_attempt_at : float
+        次に配信を試みる時刻(UNIX時間)
+    last_error : str | None
+        最後に発生したエラー
+    post_keys : list[str | None]
+        最初の試行で作成した各メッセージのキー。再試行でも同じキーで投稿する
+    """
+
+    key: str
+    messages: list[str]
+    created_at: float = field(default_factory=time.time)
+    sent: int = 0
+    reply_to: str | None = None
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: str | None = None
+    post_keys: list[str | None] = field(default_factory=list)
+
+
+@dataclass
+class DeliveryStats:
+    """
+    配信の統計情報
+    """
+
+    delivered: int = 0
+    failed_attempts: int = 0
+    expired: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.delivered if self.delivered else 0.0
+
+
+def make_idempotency_key(region: str, service: str, messages: list[str]) -> str:
+    payload = json.dumps([region, service, messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Outbox:
+    """
+    サービス・地域ごとの永続的な投稿の送信箱
+
+    Redisが利用可能な場合はRedisに保存し、再起動後も未配信の投稿を引き継ぐ。
+    利用できない場合はプロセス内に保持する。
+    配信に失敗した投稿は指数バックオフで次回以降のサイクルに再試行する。
+
+    Attributes
+    ----------
+    region : str
+        地域のラベル
+    service : str
+        サービス名
+    base_delay : float
+        再試行の基本待機時間（秒）
+    max_delay : float
+        再試行の最大待機時間（秒）
+    expire_after : float
+        登録からこの秒数を過ぎた投稿は破棄する
+    stats : DeliveryStats
+        配信の統計情報
+
+    Methods
+    -------
+    enqueue(messages: list[str]) -> OutboxEntry
+        投稿を登録する
+    due(limit: int = 10, now: float | None = None) -> list[OutboxEntry]
+        配信時刻に達した投稿を古い順に取得する。再試行を待つ投稿より新しい投稿は返さない
+    save(entry: OutboxEntry) -> None
+        配信の進捗を保存する
+    complete(entry: OutboxEntry) -> None
+        配信完了として削除する
+    schedule_retry(entry: OutboxEntry, error: str | None) -> None
+        次の再試行をスケジュールする
+    """
+
+    def __init__(
+        self,
+        region: str,
+        service: str,
+        base_delay: float = 60.0,
+        max_delay: float = 3600.0,
+        expire_after: float = 86400.0,
+    ) -> None:
+        self.region = region
+        self.service = service
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expire_after = expire_after
+        self.stats = DeliveryStats()
+        self.logger = make_logger(type(self).__name__, context=f"{region}:{service}")
+
+        self._key = OUTBOX_KEY.format(region=region, service=service)
+        self._local: dict[str, str] = {}
+        self._lock = Lock()
+        _OUTBOXES.add(self)
+
+    def enqueue(self, messages: list[str]) -> OutboxEntry:
+        key = make_idempotency_key(self.region, self.service, messages)
+        with self._lock:
+            existing = self._load_all().get(key)
+            if existing is not None:
+                self.logger.info(f"Already queued: {key[:12]}")
+                return existing
+
+            entry = OutboxEntry(key=key, messages=messages)
+            self._store(entry)
+            return entry
+
+    def due(self, limit: int = 10, now: float | None = None) -> list[OutboxEntry]:
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = sorted(self._load_all().values(), key=lambda e: e.created_at)
+
+            result = []
+            for entry in entries:
+                if now - entry.created_at > self.expire_after:
+                    self.logger.error(
+                        f"Dropped undelivered post after {entry.attempts} attempts: {entry.last_error}"
+                    )
+                    self.stats.expired += 1
+                    self._delete(entry.key)
+                    continue
+                # 古い投稿を追い越さないよう、再試行を待つ投稿があればそこで打ち切る
+                if entry.next_attempt_at > now:
+                    break
+                result.append(entry)
+            return result[:limit]
+
+    def save(self, entry: OutboxEntry) -> None:
+        with self._lock:
+            self._store(entry)
+
+    def complete(self, entry: OutboxEntry) -> None:
+        latency = time.time() - entry.created_at
+        with self._lock:
+            self._delete(entry.key)
+            self.stats.delivered += 1
+            self.stats.total_latency += latency
+            self.stats.max_latency = max(self.stats.max_latency, latency)
+        self.logger.info(
+            f"Delivered {len(entry.messages)} messages in {latency:.1f}s "
+            f"(attempts: {entry.attempts + 1})"
+        )
+
+    def schedule_retry(self, entry: OutboxEntry, error: str | None) -> None:
+        entry.attempts += 1
+        entry.last_error = error
+        delay = min(self.base_delay * 2 ** (entry.attempts - 1), self.max_delay)
+        entry.next_attempt_at = time.time() + delay
+        with self._lock:
+            self._store(entry)
+            self.stats.failed_attempts += 1
+        self.logger.warning(
+            f"Delivery failed ({entry.sent}/{len(entry.messages)} sent). "
+            f"Retrying in {delay:.0f}s: {error}"
+        )
+
+    def _load_all(self) -> dict[str, OutboxEntry]:
+        r = get_redis_client()
+        raw: dict[str, str] = self._local
+        if r is not None:
+            try:
+                raw = r.hgetall(self._key)  # type: ignore[assignment]
+            except Exception:
+                self.logger.error("Failed to load outbox from Redis", exc_info=True)
+        return {k: OutboxEntry(**json.loads(v)) for k, v in raw.items()}
+
+    def _store(self, entry: OutboxEntry) -> None:
+        value = json.dumps(asdict(entry), ensure_ascii=False)
+        self._local[entry.key] = value
+        r = get_redis_client()
+        if r is None:
+            return
+        try:
+            r.hset(self._key, entry.key, value)
+        except Exception:
+            self.logger.error("Failed to save outbox to Redis", exc_info=True)
+
+    def _delete(self, key: str) -> None:
+        self._local.pop(key, None)
+        r = get_redis_client()
+        if r is None:
+            return
+        try:
+            r.hdel(self._key, key)
+        except Exception:
+            self.logger.error("Failed to delete outbox entry from Redis", exc_info=True)
+
+
+_OUTBOXES: WeakSet[Outbox] = WeakSet()
+
+
+def _outbox_samples(attribute: str) -> list[tuple[dict[str, str], float]]:
+    # 同じ地域・サービスの送信箱が複数存在する場合は合算する
+    totals: dict[tuple[str, str], float] = {}
+    for outbox in list(_OUTBOXES):
+        key = (outbox.region, outbox.service)
+        totals[key] = totals.get(key, 0.0) + getattr(outbox.stats, attribute)
+    return [
+        ({"region": region, "service": service}, value)
+        for (region, service), value in totals.items()
+    ]
+
+
+for _name, _attribute, _help in (
+    ("traininfo_outbox_delivered_total", "delivered", "Delivered outbox entries"),
+    (
+        "traininfo_outbox_failed_attempts_total",
+        "failed_attempts",
+        "Failed delivery attempts of outbox entries",
+    ),
+    ("traininfo_outbox_expired_total", "expired", "Expired outbox entries"),
+    (
+        "traininfo_outbox_latency_seconds_total",
+        "total_latency",
+        "Total time from enqueue to delivery of outbox entries",
+    ),
+):
+    REGISTRY.register_callback(
+        _name, _help, "counter", partial(_outbox_samples, _attribute)
+    )
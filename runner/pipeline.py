@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from contextvars import Context, copy_context
+from threading import Condition, Thread
+from time import monotonic
+from typing import Generic, TypeVar
+
+from utils.make_logger import make_logger
+
+T = TypeVar("T")
+
+
+class Stage(Generic[T]):
+    """
+    キーごとに合流(coalesce)する有界キューを持つパイプラインのステージ
+
+    同じキーの項目が処理待ちの場合、新しい項目はmergeで既存の項目と合流する。
+    同じキーの項目が同時に処理されることはないため、キーごとの処理順序は保たれる。
+    項目は投入時のコンテキスト（合流した場合は最後に投入した時のもの）で処理される。
+
+    Attributes
+    ----------
+    name : str
+        ステージ名
+    handler : Callable[[T], None]
+        項目を処理する関数
+    merge : Callable[[T, T], T] | None
+        処理待ちの項目と新しい項目を合流させる関数。Noneの場合は新しい項目で置き換える
+    workers : int
+        ワーカースレッド数
+    maxsize : int
+        処理待ちにできるキーの最大数
+    coalesced : int
+        合流した項目の累計数
+
+    Methods
+    -------
+    submit(key: Hashable, item: T, timeout: float | None = None) -> bool
+        項目を投入する
+    join(timeout: float | None = None) -> bool
+        処理待ち・処理中の項目がなくなるまで待機する
+    stop(discard: bool = False, timeout: float | None = None) -> bool
+        ワーカースレッドを停止する
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[T], None],
+        merge: Callable[[T, T], T] | None = None,
+        workers: int = 1,
+        maxsize: int = 16,
+        context: str | None = None,
+    ) -> None:
+        self.name = name
+        self.handler = handler
+        self.merge = merge
+        self.workers = workers
+        self.maxsize = maxsize
+        self.coalesced = 0
+        self.logger = make_logger(f"{type(self).__name__}:{name}", context=context)
+
+        self._pending: OrderedDict[Hashable, T] = OrderedDict()
+        self._contexts: dict[Hashable, Context] = {}
+        self._running: set[Hashable] = set()
+        self._cond = Condition()
+        self._threads: list[Thread] = []
+        self._stopped = False
+
+    def submit(self, key: Hashable, item: T, timeout: float | None = None) -> bool:
+        """
+        項目を投入する。キューが満杯の場合は空きが出るまで待機する。
+
+        Parameters
+        ----------
+        key : Hashable
+            合流の単位となるキー
+        item : T
+            投入する項目
+        timeout : float | None, optional
+            満杯時の最大待機時間（秒）。Noneの場合は無制限に待機する
+
+        Returns
+        -------
+        bool
+            投入できた場合はTrue、タイムアウトした場合はFalse
+        """
+        with self._cond:
+            if self._stopped:
+                self.logger.warning(f"Stage is stopped. Dropped item for {key}")
+                return False
+            self._start_workers()
+
+            if key in self._pending:
+                current = self._pending[key]
+                self._pending[key] = self.merge(current, item) if self.merge else item
+                self._contexts[key] = copy_context()
+                self.coalesced += 1
+                self.logger.info(f"Coalesced pending item for {key}")
+                return True
+
+            if not self._cond.wait_for(
+                lambda: len(self._pending) < self.maxsize, timeout=timeout
+            ):
+                self.logger.warning(f"Queue is full. Dropped item for {key}")
+                return False
+
+            self._pending[key] = item
+            self._contexts[key] = copy_context()
+            self._cond.notify_all()
+            return True
+
+    def join(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._running, timeout=timeout
+            )
+
+    def stop(self, discard: bool = False, timeout: float | None = None) -> bool:
+        """
+        ワーカースレッドを停止する。以降に投入された項目は受け付けない。
+
+        Parameters
+        ----------
+        discard : bool, optional
+            処理待ちの項目を破棄するか, by default False。
+            Falseの場合は処理待ちの項目を処理してから停止する
+        timeout : float | None, optional
+            ワーカースレッドの終了を待つ最大時間（秒）。Noneの場合は待機しない
+
+        Returns
+        -------
+        bool
+            ワーカースレッドがすべて終了した場合はTrue
+        """
+        with self._cond:
+            self._stopped = True
+            if discard and self._pending:
+                self.logger.info(f"Discarded {len(self._pending)} pending items")
+                self._pending.clear()
+                self._contexts.clear()
+            self._cond.notify_all()
+
+        if timeout is None:
+            return not any(t.is_alive() for t in self._threads)
+        deadline = monotonic() + timeout
+        for t in self._threads:
+            t.join(max(deadline - monotonic(), 0.0))
+        return not any(t.is_alive() for t in self._threads)
+
+    def _start_workers(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _next_key(self) -> Hashable | None:
+        return next((k for k in self._pending if k not in self._running), None)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopped or self._next_key() is not None
+                )
+                key = self._next_key()
+                if key is None:
+                    return
+                item = self._pending.pop(key)
+                context = self._contexts.pop(key)
+                self._running.add(key)
+                self._cond.notify_all()
+
+            try:
+                context.run(self.handler, item)
+            except Exception:
+                self.logger.error(f"Failed to process item for {key}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+                    self._cond.notify_all()
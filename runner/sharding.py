@@ -0,0 +1,233 @@
+import hashlib
+import os
+import socket
+import time
+from threading import Event, Lock, Thread
+
+from enums import Region
+from traininfo.database import get_redis_client
+from utils.make_logger import make_logger
+
+WORKERS_KEY = "traininfo:shard:workers"
+ASSIGNMENT_KEY = "traininfo:shard:assignment"
+
+logger = make_logger(__name__)
+
+# Redisが利用できない場合に参照する、このプロセス内の割り当て表
+_local_assignment: dict[str, str] = {}
+_local_lock = Lock()
+
+
+def default_worker_id() -> str:
+    """
+    ワーカーIDを取得する。環境変数WORKER_IDが未設定の場合はホスト名とPIDから生成する。
+
+    Returns
+    -------
+    str
+        ワーカーID
+    """
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def assign_regions(
+    regions: tuple[Region, ...], workers: tuple[str, ...]
+) -> dict[Region, str]:
+    """
+    Rendezvous hashingで地域をワーカーに割り当てる。
+    全ノードが同じワーカー集合から同じ結果を得られるため、調停は不要。
+    ワーカーの増減時も移動する地域は最小限になる。
+
+    Parameters
+    ----------
+    regions : tuple[Region, ...]
+        割り当て対象の地域
+    workers : tuple[str, ...]
+        生存しているワーカーIDのタプル
+
+    Returns
+    -------
+    dict[Region, str]
+        地域とワーカーIDの対応表。ワーカーが空の場合は空の辞書
+    """
+    if not workers:
+        return {}
+
+    def _score(worker: str, region: Region) -> int:
+        digest = hashlib.sha256(f"{worker}:{region.label}".encode()).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    return {
+        region: max(sorted(workers), key=lambda w: _score(w, region))
+        for region in regions
+    }
+
+
+def describe_assignment() -> dict[str, dict[str, str]]:
+    """
+    現在の割り当て表を取得する。Redisが利用できない場合はプロセス内の割り当て表を返す。
+
+    Returns
+    -------
+    dict[str, dict[str, str]]
+        regions: 地域ラベルとワーカーIDの対応、workers: ワーカーIDと最終ハートビート時刻
+    """
+    r = get_redis_client()
+    if r is None:
+        with _local_lock:
+            return {"regions": dict(_local_assignment), "workers": {}}
+
+    try:
+        return {
+            "regions": r.hgetall(ASSIGNMENT_KEY),  # type: ignore[dict-item]
+            "workers": r.hgetall(WORKERS_KEY),  # type: ignore[dict-item]
+        }
+    except Exception:
+        logger.error("Failed to read shard assignment from Redis", exc_info=True)
+        return {"regions": {}, "workers": {}}
+
+
+def set_local_assignment(assignment: dict[Region, str]) -> None:
+    """
+    プロセス内の割り当て表を更新する。
+
+    Parameters
+    ----------
+    assignment : dict[Region, str]
+        地域とワーカーIDの対応表
+    """
+    with _local_lock:
+        _local_assignment.clear()
+        _local_assignment.update({r.label: w for r, w in assignment.items()})
+
+
+class ShardCoordinator:
+    """
+    地域をワーカー間で分散するためのコーディネーター
+
+    Redisが利用可能な場合はハートビートで生存ワーカーを管理し、
+    ワーカーの参加・離脱に応じて割り当てを再計算する。
+    Redisが利用できない場合はpeersで与えられた固定のワーカー集合で割り当てる。
+
+    Attributes
+    ----------
+    worker_id : str
+        このワーカーのID
+    regions : tuple[Region, ...]
+        割り当て対象の地域
+    peers : tuple[str, ...]
+        Redisが利用できない場合に使う固定のワーカー集合
+    ttl : int
+        ハートビートが途絶えてからワーカーを離脱とみなすまでの秒数
+
+    Methods
+    -------
+    start() -> None
+        ハートビートスレッドを開始する
+    stop() -> None
+        ハートビートを停止し、ワーカー登録を解除する
+    heartbeat() -> None
+        生存を通知する
+    live_workers() -> tuple[str, ...]
+        生存しているワーカーIDを取得する
+    rebalance() -> tuple[Region, ...]
+        割り当てを再計算し、このワーカーが担当する地域を返す
+    """
+
+    def __init__(
+        self,
+        worker_id: str,
+        regions: tuple[Region, ...] = tuple(Region),
+        peers: tuple[str, ...] = (),
+        ttl: int = 30,
+    ) -> None:
+        self.worker_id = worker_id
+        self.regions = regions
+        self.peers = peers
+        self.ttl = ttl
+        self.logger = make_logger(type(self).__name__, context=worker_id)
+
+        self._assignment: dict[Region, str] = {}
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self.heartbeat()
+        self._thread = Thread(target=self._heartbeat_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        r = get_redis_client()
+        if r is None:
+            return
+        try:
+            r.hdel(WORKERS_KEY, self.worker_id)
+        except Exception:
+            self.logger.error("Failed to unregister worker", exc_info=True)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            self.heartbeat()
+
+    def heartbeat(self) -> None:
+        r = get_redis_client()
+        if r is None:
+            return
+        try:
+            r.hset(WORKERS_KEY, self.worker_id, str(time.time()))
+        except Exception:
+            self.logger.error("Failed to send heartbeat", exc_info=True)
+
+    def live_workers(self) -> tuple[str, ...]:
+        r = get_redis_client()
+        if r is None:
+            return self.peers or (self.worker_id,)
+
+        try:
+            workers: dict[str, str] = r.hgetall(WORKERS_KEY)  # type: ignore[assignment]
+        except Exception:
+            self.logger.error("Failed to fetch workers", exc_info=True)
+            return tuple(sorted(set(self._assignment.values()))) or (self.worker_id,)
+
+        deadline = time.time() - self.ttl
+        alive = {w for w, ts in workers.items() if float(ts) >= deadline}
+        stale = set(workers) - alive
+        if stale:
+            try:
+                r.hdel(WORKERS_KEY, *stale)
+            except Exception:
+                self.logger.error("Failed to remove stale workers", exc_info=True)
+
+        alive.add(self.worker_id)
+        return tuple(sorted(alive))
+
+    def rebalance(self) -> tuple[Region, ...]:
+        self.heartbeat()
+        assignment = assign_regions(self.regions, self.live_workers())
+
+        if assignment != self._assignment:
+            self.logger.info(
+                "Shard assignment changed: "
+                + ", ".join(f"{r.label}->{w}" for r, w in assignment.items())
+            )
+            self._publish(assignment)
+            self._assignment = assignment
+
+        return tuple(r for r, w in assignment.items() if w == self.worker_id)
+
+    def _publish(self, assignment: dict[Region, str]) -> None:
+        r = get_redis_client()
+        if r is None:
+            set_local_assignment(assignment)
+            return
+        try:
+            r.hset(
+                ASSIGNMENT_KEY,
+                mapping={region.label: w for region, w in assignment.items()},
+            )
+        except Exception:
+            self.logger.error("Failed to publish shard assignment", exc_info=True)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from threading import Lock
+
+from traininfo.message import sort_status
+from traininfo.trainstatus import TrainStatus
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """
+    シリアライズ済みの応答
+
+    Attributes
+    ----------
+    body : bytes
+        JSONの本文
+    etag : str
+        本文から計算した強いETag
+    """
+
+    body: bytes
+    etag: str
+
+
+@dataclass(frozen=True)
+class RegionStatus:
+    """
+    ある時点の地域の運行状況。公開後は変更しない
+
+    Attributes
+    ----------
+    region : str
+        地域のラベル
+    updated_at : datetime
+        運行状況が最後に変化した時刻
+    statuses : tuple[TrainStatus, ...]
+        優先度順にソートした運行状況
+    region_response : CachedResponse
+        地域全体の応答
+    line_responses : dict[str, CachedResponse]
+        路線名ごとの応答
+    """
+
+    region: str
+    updated_at: datetime
+    statuses: tuple[TrainStatus, ...]
+    region_response: CachedResponse
+    line_responses: dict[str, CachedResponse] = field(default_factory=dict)
+
+
+def _serialize(payload: dict) -> CachedResponse:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    return CachedResponse(
+        body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    )
+
+
+def build_region_status(
+    region: str, statuses: tuple[TrainStatus, ...], updated_at: datetime
+) -> RegionStatus:
+    """
+    運行状況から地域全体と路線ごとの応答を作成する。
+
+    Parameters
+    ----------
+    region : str
+        地域のラベル
+    statuses : tuple[TrainStatus, ...]
+        最新の運行状況
+    updated_at : datetime
+        運行状況が変化した時刻
+
+    Returns
+    -------
+    RegionStatus
+        シリアライズ済みの運行状況
+    """
+    statuses = sort_status(statuses)
+    timestamp = updated_at.isoformat(timespec="seconds")
+    lines = [asdict(s) for s in statuses]
+    return RegionStatus(
+        region=region,
+        updated_at=updated_at,
+        statuses=statuses,
+        region_response=_serialize(
+            {"region": region, "updated_at": timestamp, "lines": lines}
+        ),
+        line_responses={
+            line["train"]: _serialize(
+                {"region": region, "updated_at": timestamp, **line}
+            )
+            for line in lines
+        },
+    )
+
+
+class StatusCache:
+    """
+    地域ごとの最新の運行状況を保持する
+
+    サイクルごとに新しいRegionStatusを作成して差し替えるため、参照側はロックなしで
+    一貫した状態を読み取れる。運行状況が変化していない場合は差し替えず、ETagも変わらない。
+
+    Methods
+    -------
+    publish(region: str, statuses: tuple[TrainStatus, ...]) -> RegionStatus
+        最新の運行状況を公開する
+    get(region: str) -> RegionStatus | None
+        公開中の運行状況を取得する
+    remove(region: str) -> None
+        担当から外れた地域を削除する
+    """
+
+    def __init__(self) -> None:
+        self._regions: dict[str, RegionStatus] = {}
+        self._lock = Lock()
+
+    def publish(self, region: str, statuses: tuple[TrainStatus, ...]) -> RegionStatus:
+        current = self._regions.get(region)
+        if current is not None and set(current.statuses) == set(statuses):
+            return current
+
+        published = build_region_status(
+            region, statuses, datetime.now(timezone.utc).replace(microsecond=0)
+        )
+        with self._lock:
+            regions = dict(self._regions)
+            regions[region] = published
+            self._regions = regions
+        return published
+
+    def get(self, region: str) -> RegionStatus | None:
+        return self._regions.get(region)
+
+    def remove(self, region: str) -> None:
+        with self._lock:
+            regions = dict(self._regions)
+            regions.pop(region, None)
+            self._regions = regions
+
+
+STATUS_CACHE = StatusCache()
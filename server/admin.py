@@ -0,0 +1,201 @@
+import os
+from collections.abc import Callable
+from functools import wraps
+from typing import Any
+
+from bottle import Bottle, request, response
+
+from utils import profiling
+
+from .logs import _unauthorized, auth
+
+admin_app = Bottle()
+
+PROFILE_MAX_WAIT = 300
+
+
+def _require_auth(func: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        # ログと異なり、パスワード未設定時は管理用のエンドポイントを使えないようにする
+        if not os.getenv("LOG_PASSWORD"):
+            response.status = 403
+            return "Admin endpoints are disabled. Set LOG_PASSWORD to enable them."
+        if not auth(request.headers.get("Authorization", "")):
+            return _unauthorized()
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _bad_request(message: str) -> str:
+    response.status = 400
+    return message
+
+
+@admin_app.route("/profile", method=["POST"])
+@_require_auth
+def start_profile():
+    """
+    次のNサイクルの計測を開始する。結果はGET /profileで取得する。
+
+    Query Parameters
+    ----------------
+    mode : str
+        "cprofile"（関数ごとの呼び出し回数と時間）または"sampling"（スタックの採取）,
+        by default "sampling"
+    cycles : int
+        計測するサイクル数, by default 1
+    timeout : float
+        サイクルが終わらない場合に計測を打ち切るまでの秒数, by default 3600
+    interval : float
+        samplingでスタックを採取する間隔（秒）, by default 0.005
+    """
+    query = request.query
+    try:
+        session = profiling.start_session(
+            query.get("mode") or "sampling",
+            cycles=max(int(query.get("cycles") or 1), 1),
+            timeout=float(query.get("timeout") or 3600),
+            interval=float(query.get("interval") or 0.005),
+        )
+    except ValueError as e:
+        return _bad_request(f"Invalid query: {e}")
+    except RuntimeError as e:
+        response.status = 409
+        return str(e)
+    response.status = 202
+    return session.status()
+
+
+@admin_app.route("/profile", method=["GET"])
+@_require_auth
+def get_profile():
+    """
+    計測の結果を返す。計測中の場合は202で進捗を返す。
+
+    Query Parameters
+    ----------------
+    wait : float
+        計測の終了をこの秒数まで待つ, by default 0
+    format : str
+        cprofileでは"text"（pstatsの表）または"pstats"（dump_statsと同じ形式）,
+        samplingでは"collapsed"（flamegraph.plやspeedscopeで読み込める形式）
+    sort : str
+        cprofileの表の並び順, by default "cumulative"
+    limit : int
+        cprofileの表の行数, by default 50
+    """
+    session = profiling.current_session()
+    if session is None:
+        response.status = 404
+        return "No profile session."
+
+    query = request.query
+    try:
+        wait = min(float(query.get("wait") or 0), PROFILE_MAX_WAIT)
+        limit = int(query.get("limit") or 50)
+    except ValueError as e:
+        return _bad_request(f"Invalid query: {e}")
+    if not session.done.wait(wait):
+        response.status = 202
+        return session.status()
+
+    if isinstance(session, profiling.CProfileSession):
+        if query.get("format") == "pstats":
+            response.content_type = "application/octet-stream"
+            response.headers["Content-Disposition"] = (
+                'attachment; filename="profile.pstats"'
+            )
+            return session.dump()
+        response.content_type = "text/plain; charset=utf-8"
+        try:
+            return session.report(sort=query.get("sort") or "cumulative", limit=limit)
+        except KeyError as e:
+            return _bad_request(f"Invalid sort key: {e}")
+
+    assert isinstance(session, profiling.SamplingSession)
+    response.content_type = "text/plain; charset=utf-8"
+    return session.collapsed()
+
+
+@admin_app.route("/profile", method=["DELETE"])
+@_require_auth
+def stop_profile():
+    """
+    計測を途中で終了する。それまでの結果はGET /profileで取得できる。
+    """
+    session = profiling.current_session()
+    if session is None:
+        response.status = 404
+        return "No profile session."
+    session.finish()
+    return session.status()
+
+
+@admin_app.route("/threads", method=["GET"])
+@_require_auth
+def threads():
+    """
+    すべてのスレッドのスタックを返す
+    """
+    response.content_type = "text/plain; charset=utf-8"
+    return profiling.thread_dump()
+
+
+@admin_app.route("/tracemalloc", method=["POST"])
+@_require_auth
+def start_tracemalloc():
+    """
+    メモリ確保の追跡を開始し、基準のスナップショットを取る。
+    追跡中であれば基準のスナップショットのみ取り直す。
+
+    Query Parameters
+    ----------------
+    frames : int
+        記録するスタックの深さ, by default 1
+    """
+    try:
+        frames = int(request.query.get("frames") or 1)
+    except ValueError as e:
+        return _bad_request(f"Invalid query: {e}")
+    profiling.start_tracemalloc(frames)
+    response.status = 201
+    return {"tracing": True, "frames": frames}
+
+
+@admin_app.route("/tracemalloc", method=["GET"])
+@_require_auth
+def tracemalloc_diff():
+    """
+    基準のスナップショットからのメモリ使用量の差分を返す。
+
+    Query Parameters
+    ----------------
+    limit : int
+        出力する件数, by default 20
+    group : str
+        集計の単位。"lineno", "filename", "traceback"のいずれか, by default "lineno"
+    """
+    query = request.query
+    group = query.get("group") or "lineno"
+    if group not in ("lineno", "filename", "traceback"):
+        return _bad_request(f"Invalid group: {group}")
+    try:
+        limit = int(query.get("limit") or 20)
+    except ValueError as e:
+        return _bad_request(f"Invalid query: {e}")
+    try:
+        body = profiling.tracemalloc_diff(limit=limit, key_type=group)
+    except RuntimeError as e:
+        response.status = 409
+        return str(e)
+    response.content_type = "text/plain; charset=utf-8"
+    return body
+
+
+@admin_app.route("/tracemalloc", method=["DELETE"])
+@_require_auth
+def stop_tracemalloc():
+    profiling.stop_tracemalloc()
+    return {"tracing": False}
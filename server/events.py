@@ -0,0 +1,72 @@
+import os
+from collections.abc import Iterator
+
+from bottle import Bottle, request, response
+
+from runner.events import EVENTS
+
+events_app = Bottle()
+
+RETRY_MILLISECONDS = 5000
+RESET_FRAME = (
+    b'event: reset\ndata: {"reason":"events were missed, refetch /status"}\n\n'
+)
+
+
+def _stream(
+    region: str | None, last_event_id: str | None, heartbeat: float
+) -> Iterator[bytes]:
+    # 応答を返し始めるまで購読しないことで、送信されない購読が残らないようにする
+    subscription = EVENTS.subscribe(region, last_event_id)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+        while True:
+            if subscription.gap:
+                yield RESET_FRAME
+            for buffered in subscription.backlog:
+                yield buffered.frame
+            last_id = subscription.position
+            try:
+                while True:
+                    event = subscription.get(timeout=heartbeat)
+                    if event is None:
+                        # 切断された接続を検出し、プロキシに接続を切られないようにする
+                        yield b": keepalive\n\n"
+                        continue
+                    yield event.frame
+                    last_id = event.id
+            except OverflowError:
+                # 送信が追いつかずキューが溢れたため、最後に送った位置から再開する
+                subscription = EVENTS.subscribe(region, EVENTS.event_id(last_id))
+            except EOFError:
+                return
+    finally:
+        EVENTS.unsubscribe(subscription)
+
+
+@events_app.route("/")
+def stream_events():
+    """
+    運行状況の変化をServer-Sent Eventsで配信する。
+    イベントはchanged, new, resolvedのいずれかで、dataは路線ごとの変化を表すJSON。
+
+    Query Parameters
+    ----------------
+    region : str
+        この地域のイベントのみ配信する
+    last_event_id : str
+        Last-Event-IDヘッダの代わりに、再開するイベントIDを指定する
+    """
+    region = request.query.get("region") or None
+    last_event_id = (
+        request.headers.get("Last-Event-ID")
+        or request.query.get("last_event_id")
+        or None
+    )
+    heartbeat = float(os.getenv("SSE_HEARTBEAT", "15"))
+
+    response.content_type = "text/event-stream; charset=utf-8"
+    response.headers["Cache-Control"] = "no-cache"
+    # リバースプロキシでバッファリングされないようにする
+    response.headers["X-Accel-Buffering"] = "no"
+    return _stream(region, last_event_id, heartbeat)
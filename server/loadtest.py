@@ -0,0 +1,140 @@
+import argparse
+import http.client
+from dataclasses import dataclass
+from statistics import quantiles
+from threading import Lock, Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+
+
+@dataclass
+class LoadTestResult:
+    """
+    負荷試験の結果
+
+    Attributes
+    ----------
+    requests : int
+        送信したリクエスト数
+    errors : int
+        失敗したリクエスト数（接続エラーまたは5xx）
+    elapsed : float
+        全体の所要時間（秒）
+    latencies : list[float]
+        成功したリクエストごとの応答時間（秒）
+    """
+
+    requests: int
+    errors: int
+    elapsed: float
+    latencies: list[float]
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return quantiles(self.latencies, n=100)[p - 1]
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests, {self.errors} errors in {self.elapsed:.2f}s "
+            f"({self.throughput:.1f} req/s, "
+            f"p50 {self.percentile(50) * 1000:.1f}ms, "
+            f"p99 {self.percentile(99) * 1000:.1f}ms)"
+        )
+
+
+def run_load_test(
+    url: str, requests: int = 200, concurrency: int = 16, keepalive: bool = True
+) -> LoadTestResult:
+    """
+    指定したURLに並行してGETリクエストを送り、スループットと応答時間を計測する。
+
+    Parameters
+    ----------
+    url : str
+        リクエスト先のURL
+    requests : int, optional
+        送信するリクエストの総数, by default 200
+    concurrency : int, optional
+        同時に送信するクライアント数, by default 16
+    keepalive : bool, optional
+        クライアントごとに接続を再利用する, by default True
+
+    Returns
+    -------
+    LoadTestResult
+        計測結果
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+    lock = Lock()
+
+    def _take() -> bool:
+        nonlocal remaining
+        with lock:
+            if remaining <= 0:
+                return False
+            remaining -= 1
+            return True
+
+    def _client() -> None:
+        nonlocal errors
+        conn: http.client.HTTPConnection | None = None
+        while _take():
+            started_at = perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(
+                        parts.hostname or "localhost", parts.port or 80, timeout=30
+                    )
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 500
+                if not keepalive or response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                ok = False
+                if conn is not None:
+                    conn.close()
+                conn = None
+            with lock:
+                if ok:
+                    latencies.append(perf_counter() - started_at)
+                else:
+                    errors += 1
+        if conn is not None:
+            conn.close()
+
+    started_at = perf_counter()
+    threads = [Thread(target=_client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return LoadTestResult(requests, errors, perf_counter() - started_at, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simple HTTP load test")
+    parser.add_argument("url", nargs="?", default="http://localhost:8080/healthz")
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--no-keepalive", action="store_true")
+    args = parser.parse_args()
+
+    result = run_load_test(
+        args.url, args.requests, args.concurrency, keepalive=not args.no_keepalive
+    )
+    print(result.summary())
@@ -0,0 +1,338 @@
+import json
+import os
+import re
+from bisect import bisect_left
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any
+
+HEADER_PATTERN = re.compile(
+    rb"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} ([A-Z]+) (.*?) - "
+)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+RELATIVE_TIME_PATTERN = re.compile(r"^(\d+)([smhd])$")
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+
+@dataclass
+class LogEntry:
+    """
+    ログファイル中の1件のログ。トレースバックなどの継続行を含む
+
+    Attributes
+    ----------
+    offset : int
+        ファイル内での開始位置
+    timestamp : datetime | None
+        ログの日時。ヘッダを解析できない場合はNone
+    level : str
+        ログレベル
+    logger : str
+        ロガー名
+    raw : bytes
+        ログの内容（改行を含む）
+    fields : dict[str, Any]
+        JSON形式のログの場合はその内容
+    """
+
+    offset: int
+    timestamp: datetime | None
+    level: str
+    logger: str
+    raw: bytes
+    fields: dict[str, Any] = field(default_factory=dict)
+
+
+Header = tuple[datetime, str, str, dict[str, Any]]
+
+
+def parse_header(line: bytes) -> Header | None:
+    """
+    ログの先頭行を解析する。テキスト形式とJSON形式のどちらにも対応する。
+    継続行の場合はNoneを返す。
+    """
+    if line.startswith(b"{"):
+        return _parse_json_line(line)
+
+    match = HEADER_PATTERN.match(line)
+    if match is None:
+        return None
+    try:
+        timestamp = datetime.strptime(match.group(1).decode(), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    logger = match.group(3).decode(errors="replace")
+    return timestamp, match.group(2).decode(), logger, {}
+
+
+def _parse_json_line(line: bytes) -> Header | None:
+    try:
+        data = json.loads(line)
+        timestamp = datetime.fromisoformat(data["ts"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    return timestamp, data.get("level", ""), data.get("logger", ""), data
+
+
+def parse_time(value: str, now: datetime | None = None) -> datetime:
+    """
+    時刻の指定を解析する。
+
+    Parameters
+    ----------
+    value : str
+        ISO 8601形式の日時、または"15m"や"2h"のような現在からの相対時間
+    now : datetime | None, optional
+        相対時間の基準, by default datetime.now()
+
+    Returns
+    -------
+    datetime
+        ローカル時刻のnaiveな日時
+
+    Raises
+    ------
+    ValueError
+        解析できない場合
+    """
+    match = RELATIVE_TIME_PATTERN.match(value)
+    if match:
+        unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+        delta = timedelta(**{unit[match.group(2)]: int(match.group(1))})
+        return (now or datetime.now()) - delta
+
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+@dataclass
+class LogFilter:
+    """
+    ログの絞り込み条件
+
+    Attributes
+    ----------
+    level : str | None
+        このレベル以上のログのみ
+    logger : str | None
+        ロガー名にこの文字列を含むログのみ
+    since : datetime | None
+        この日時以降のログのみ
+    until : datetime | None
+        この日時より前のログのみ
+    cycle_id, region, service : str | None
+        JSON形式のログで、この値を持つログのみ
+    """
+
+    level: str | None = None
+    logger: str | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    cycle_id: str | None = None
+    region: str | None = None
+    service: str | None = None
+
+    def __post_init__(self) -> None:
+        if self.level is not None:
+            self.level = self.level.upper()
+            if self.level not in LEVELS:
+                raise ValueError(f"Unknown log level: {self.level}")
+
+    @property
+    def empty(self) -> bool:
+        return not (
+            self.level
+            or self.logger
+            or self.since
+            or self.until
+            or self._context_fields()
+        )
+
+    def _context_fields(self) -> dict[str, str]:
+        fields = {
+            "cycle_id": self.cycle_id,
+            "region": self.region,
+            "service": self.service,
+        }
+        return {name: value for name, value in fields.items() if value}
+
+    def match(self, entry: LogEntry) -> bool:
+        if self.level and LEVELS.get(entry.level, 0) < LEVELS[self.level]:
+            return False
+        if self.logger and self.logger not in entry.logger:
+            return False
+        if self.since or self.until:
+            if entry.timestamp is None:
+                return False
+            if self.since and entry.timestamp < self.since:
+                return False
+            if self.until and entry.timestamp >= self.until:
+                return False
+        for name, value in self._context_fields().items():
+            if str(entry.fields.get(name, "")).lower() != value.lower():
+                return False
+        return True
+
+
+def iter_entries(f, start: int = 0) -> Iterator[LogEntry]:
+    """
+    バイナリモードで開いたログファイルから、startの位置以降のログを順に読み込む。
+    startはログの先頭行の開始位置である必要がある。
+    """
+    f.seek(start)
+    offset = start
+    current: LogEntry | None = None
+    for line in f:
+        header = parse_header(line)
+        if header is not None or current is None:
+            if current is not None:
+                yield current
+            timestamp, level, logger, fields = header or (None, "", "", {})
+            current = LogEntry(offset, timestamp, level, logger, line, fields)
+        else:
+            current.raw += line
+        offset += len(line)
+    if current is not None:
+        yield current
+
+
+def _iter_lines_reversed(
+    f, start: int = 0, block_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    remainder = b""
+    while position > start:
+        read_size = min(block_size, position - start)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + remainder).splitlines(keepends=True)
+        remainder = lines.pop(0) if position > start else b""
+        yield from reversed(lines)
+    if remainder:
+        yield remainder
+
+
+def tail_entries(
+    f, count: int, log_filter: LogFilter | None = None, start: int = 0
+) -> list[LogEntry]:
+    """
+    ファイルの末尾から読み、条件に合う最新のcount件のログを古い順に返す。
+    ファイル全体は読み込まない。
+    ログの日時は前後することがあるため、sinceより前のログがあっても読み続け、startの位置で止める。
+    startはログの先頭行の開始位置である必要がある。
+    """
+    log_filter = log_filter or LogFilter()
+    entries: list[LogEntry] = []
+    continuation = b""
+    for line in _iter_lines_reversed(f, start):
+        header = parse_header(line)
+        if header is None:
+            continuation = line + continuation
+            continue
+
+        timestamp, level, logger, fields = header
+        entry = LogEntry(-1, timestamp, level, logger, line + continuation, fields)
+        continuation = b""
+        if log_filter.match(entry):
+            entries.append(entry)
+            if len(entries) >= count:
+                break
+    entries.reverse()
+    return entries
+
+
+class LogIndex:
+    """
+    ログファイルの日時とファイル内の位置の対応を保持する索引
+
+    一定のバイト数ごとにログの先頭行の位置と、そこまでのログの日時の最大値を記録し、
+    日時の範囲指定で読み込みを始める位置を求める。非同期の書き込みや複数のプロセスからの
+    書き込みでログの日時が前後しても、開始位置より前に条件に合うログが残らない。
+    索引は追記された部分だけを差分で更新し、ファイルがローテーションされた場合は作り直す。
+
+    Methods
+    -------
+    seek_offset(since: datetime) -> int
+        since以降のログを読むための開始位置を返す
+    """
+
+    def __init__(self, path: str, step: int = 64 * 1024) -> None:
+        self.path = path
+        self.step = step
+        # 各位置までに現れたログの日時の最大値。単調に増加するため二分探索できる
+        self._timestamps: list[datetime] = []
+        self._offsets: list[int] = []
+        self._latest: datetime | None = None
+        self._indexed_to = 0
+        self._stat: os.stat_result | None = None
+        self._lock = Lock()
+
+    def _reset(self) -> None:
+        self._timestamps.clear()
+        self._offsets.clear()
+        self._latest = None
+        self._indexed_to = 0
+
+    def update(self) -> None:
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                self._stat = None
+                return
+
+            if (
+                self._stat is None
+                or not os.path.samestat(self._stat, stat)
+                or stat.st_size < self._indexed_to
+            ):
+                self._reset()
+            self._stat = stat
+            if stat.st_size == self._indexed_to:
+                return
+
+            next_mark = self._offsets[-1] + self.step if self._offsets else 0
+            offset = self._indexed_to
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    # 書き込み途中の行は次回の更新で読む
+                    if not line.endswith(b"\n"):
+                        break
+                    header = parse_header(line)
+                    if header is not None:
+                        if self._latest is None or header[0] > self._latest:
+                            self._latest = header[0]
+                        if offset >= next_mark:
+                            self._timestamps.append(self._latest)
+                            self._offsets.append(offset)
+                            next_mark = offset + self.step
+                    offset += len(line)
+            self._indexed_to = offset
+
+    def seek_offset(self, since: datetime) -> int:
+        self.update()
+        with self._lock:
+            i = bisect_left(self._timestamps, since)
+            return self._offsets[i - 1] if i > 0 else 0
+
+
+_indexes: dict[str, LogIndex] = {}
+_indexes_lock = Lock()
+
+
+def get_log_index(path: str) -> LogIndex:
+    """
+    ログファイルの索引を取得する。一度作成したらキャッシュする。
+    """
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = LogIndex(path)
+        return index
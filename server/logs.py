@@ -1,13 +1,25 @@
 import base64
+import io
 import os
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from datetime import datetime
 
 from bottle import Bottle, request, response, static_file
 
-from utils.make_logger import LOG_FILE_PATH
+from utils.make_logger import LOG_FILE_PATH, list_log_segments, make_logger
+
+from .log_query import LogFilter, get_log_index, iter_entries, parse_time, tail_entries
+
+logger = make_logger(__name__)
 
 logs_app = Bottle()
 
 LOGS_USER = "admin"
+CHUNK_SIZE = 64 * 1024
+FOLLOW_POLL_INTERVAL = 0.5
+FOLLOW_MAX_TIMEOUT = 300
 
 
 def auth(header: str) -> bool:
@@ -29,20 +41,218 @@ def auth(header: str) -> bool:
         return False
 
 
+def _unauthorized() -> str:
+    response.status = 401
+    response.headers["WWW-Authenticate"] = 'Basic realm="Logs Access", charset="UTF-8"'
+    return "Authentication required."
+
+
 @logs_app.route("/", method=["GET"])
 def get_logs():
+    """
+    ログを返す。クエリを指定しない場合はファイル全体を返し、Rangeリクエストにも対応する。
+
+    Query Parameters
+    ----------------
+    tail : int
+        条件に合う最新のN件のみ返す。1以上
+    level : str
+        このレベル以上のログのみ返す
+    logger : str
+        ロガー名にこの文字列を含むログのみ返す
+    since, until : str
+        日時の範囲。ISO 8601形式または"15m"のような現在からの相対時間
+    cycle_id, region, service : str
+        JSON形式のログで、この値を持つログのみ返す
+    follow : bool
+        追記されたログを返し続ける
+    timeout : int
+        followの最大継続時間（秒）, by default 30
+    """
     if not auth(request.headers.get("Authorization", "")):
-        response.status = 401
-        response.headers["WWW-Authenticate"] = (
-            'Basic realm="Logs Access", charset="UTF-8"'
-        )
-        return "Authentication required."
+        return _unauthorized()
 
+    query = request.query
     try:
-        return static_file(LOG_FILE_PATH, root="/", download=True)
-    except FileNotFoundError:
+        log_filter = LogFilter(
+            level=query.get("level") or None,
+            logger=query.get("logger") or None,
+            since=parse_time(query.since) if query.get("since") else None,
+            until=parse_time(query.until) if query.get("until") else None,
+            cycle_id=query.get("cycle_id") or None,
+            region=query.get("region") or None,
+            service=query.get("service") or None,
+        )
+        tail = int(query.tail) if query.get("tail") else None
+        if tail is not None and tail <= 0:
+            raise ValueError("tail must be a positive integer")
+        follow = query.get("follow", "").lower() in ("1", "true")
+        timeout = min(int(query.get("timeout") or 30), FOLLOW_MAX_TIMEOUT)
+    except ValueError as e:
+        response.status = 400
+        return f"Invalid query: {e}"
+
+    if not os.path.exists(LOG_FILE_PATH):
         response.status = 404
         return "Log file not found."
+
+    try:
+        if log_filter.empty and tail is None and not follow:
+            # Rangeリクエストはstatic_fileが処理する
+            if "Range" in request.headers or not _accepts_gzip():
+                return static_file(LOG_FILE_PATH, root="/", download=True)
+            response.headers["Content-Disposition"] = (
+                f'attachment; filename="{os.path.basename(LOG_FILE_PATH)}"'
+            )
+            body: Iterable[bytes] = _read_file(LOG_FILE_PATH)
+        else:
+            body = _query_logs(log_filter, tail, follow, timeout)
+
+        response.content_type = "text/plain; charset=utf-8"
+        return _encode(body)
     except Exception as e:
         response.status = 500
         return f"Error: {e}"
+
+
+def _accepts_gzip() -> bool:
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+
+def _encode(body: Iterable[bytes]) -> Iterable[bytes]:
+    if not _accepts_gzip():
+        return body
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return _gzip(body)
+
+
+def _gzip(body: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in body:
+        # followで逐次届くよう、チャンクごとにflushする
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _read_file(path: str) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+    except OSError:
+        # 応答の開始後はステータスを変えられないため、送信済みの分で終える
+        logger.error("Failed to read log file", exc_info=True)
+
+
+def _batch(entries: Iterable, log_filter: LogFilter) -> Iterator[bytes]:
+    # ログの日時は前後することがあるため、untilを過ぎたログがあっても最後まで読む
+    buffer = bytearray()
+    for entry in entries:
+        if not log_filter.match(entry):
+            continue
+        buffer += entry.raw
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _query_logs(
+    log_filter: LogFilter, tail: int | None, follow: bool, timeout: int
+) -> Iterator[bytes]:
+    # 応答の開始後にローテーションなどでファイルを読めなくなった場合は、送信済みの分で終える
+    try:
+        with open(LOG_FILE_PATH, "rb") as f:
+            stat = os.fstat(f.fileno())
+            end = stat.st_size
+            start = 0
+            if log_filter.since:
+                start = get_log_index(LOG_FILE_PATH).seek_offset(log_filter.since)
+            if tail is not None:
+                entries = tail_entries(f, tail, log_filter, start)
+                if entries:
+                    yield b"".join(entry.raw for entry in entries)
+            else:
+                yield from _batch(iter_entries(f, start), log_filter)
+    except OSError:
+        logger.error("Failed to read log file", exc_info=True)
+        return
+
+    if follow:
+        yield from _follow(log_filter, stat, end, timeout)
+
+
+def _follow(
+    log_filter: LogFilter, stat: os.stat_result, position: int, timeout: int
+) -> Iterator[bytes]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if log_filter.until and datetime.now() >= log_filter.until:
+            return
+        time.sleep(FOLLOW_POLL_INTERVAL)
+
+        try:
+            current = os.stat(LOG_FILE_PATH)
+        except FileNotFoundError:
+            continue
+        # ローテーションされた場合は新しいファイルを先頭から読む
+        if not os.path.samestat(stat, current) or current.st_size < position:
+            stat, position = current, 0
+        if current.st_size == position:
+            continue
+
+        try:
+            with open(LOG_FILE_PATH, "rb") as f:
+                f.seek(position)
+                data = f.read(current.st_size - position)
+        except FileNotFoundError:
+            # statの後にローテーションされた場合は、次回に新しいファイルを読む
+            continue
+        except OSError:
+            logger.error("Failed to follow log file", exc_info=True)
+            return
+        # 書き込み途中の行は次回に読む
+        data = data[: data.rfind(b"\n") + 1]
+        position += len(data)
+        if data:
+            yield from _batch(iter_entries(io.BytesIO(data)), log_filter)
+
+
+@logs_app.route("/segments", method=["GET"])
+def list_segments():
+    """
+    現在のログファイルとローテーション済みのログファイルを新しい順に返す
+    """
+    if not auth(request.headers.get("Authorization", "")):
+        return _unauthorized()
+
+    segments = []
+    for path in [LOG_FILE_PATH, *list_log_segments()]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        segments.append(
+            {
+                "name": os.path.basename(path),
+                "size": stat.st_size,
+                "modified": stat.st_mtime,
+            }
+        )
+    return {"segments": segments}
+
+
+@logs_app.route("/segments/<name>", method=["GET"])
+def get_segment(name: str):
+    if not auth(request.headers.get("Authorization", "")):
+        return _unauthorized()
+
+    # 一覧にないファイルは返さない
+    paths = {os.path.basename(p): p for p in [LOG_FILE_PATH, *list_log_segments()]}
+    path = paths.get(name)
+    if path is None or not os.path.exists(path):
+        response.status = 404
+        return "Log segment not found."
+    return static_file(name, root=os.path.dirname(path), download=True)
@@ -1,11 +1,53 @@
-from threading import Thread
+import atexit
+import http.client
+import json
 
-from bottle import Bottle
+from bottle import Bottle, HTTPResponse, request, response
 
+from runner.events import EVENTS
+from runner.health import HEALTH
+from runner.sharding import describe_assignment
+from utils.metrics import REGISTRY
+
+from .admin import admin_app
+from .events import events_app
 from .logs import logs_app
+from .status import status_app
+from .wsgi import EmbeddedServer
 
 app = Bottle()
+app.mount("/admin", admin_app)
 app.mount("/logs", logs_app)
+app.mount("/events", events_app)
+app.mount("/status", status_app)
+
+# 地域の状態を持ち、WORKER_PROCESSES>1では各ワーカーのサーバーが提供するエンドポイント。
+# /adminの計測もサイクルを実行するワーカーで行う
+WORKER_ROUTES = frozenset({"status", "events", "metrics", "admin"})
+
+# 監視プロセスで起動した場合のワーカーIDと待ち受けるポートの対応
+_worker_ports: dict[str, int] = {}
+
+WORKER_HEALTH_TIMEOUT = 2.0
+
+
+@app.hook("before_request")
+def _route_to_workers() -> None:
+    """
+    監視プロセスには地域の状態がないため、該当するエンドポイントは各ワーカーのポートを案内する
+    """
+    if not _worker_ports or request.path.split("/")[1] not in WORKER_ROUTES:
+        return
+    raise HTTPResponse(
+        json.dumps(
+            {
+                "error": "Served by each worker process with WORKER_PROCESSES>1",
+                "workers": _worker_ports,
+            }
+        ),
+        status=503,
+        headers={"Content-Type": "application/json; charset=utf-8"},
+    )
 
 
 @app.route("/")
@@ -13,13 +55,107 @@ def root():
     return "I'm alive!"
 
 
-def server_run():
-    def _run():
-        app.run(host="0.0.0.0", port=8080)
+@app.route("/workers")
+def workers():
+    return describe_assignment()
+
+
+def _check_workers(path: str) -> tuple[bool, dict[str, dict]]:
+    """
+    各ワーカーのサーバーにヘルスチェックを問い合わせる。
+
+    Parameters
+    ----------
+    path : str
+        問い合わせるパス
+
+    Returns
+    -------
+    tuple[bool, dict[str, dict]]
+        すべてのワーカーが正常かと、ワーカーごとの結果
+    """
+    results: dict[str, dict] = {}
+    for worker_id, port in _worker_ports.items():
+        conn = http.client.HTTPConnection(
+            "127.0.0.1", port, timeout=WORKER_HEALTH_TIMEOUT
+        )
+        try:
+            conn.request("GET", path)
+            res = conn.getresponse()
+            results[worker_id] = {"ok": res.status == 200, **json.loads(res.read())}
+        except (OSError, ValueError) as e:
+            # 再起動中などで応答がないワーカーは異常とみなす
+            results[worker_id] = {"ok": False, "status": "unreachable", "error": str(e)}
+        finally:
+            conn.close()
+    return all(result["ok"] for result in results.values()), results
+
+
+def _health(ok: bool, details: dict, path: str) -> tuple[bool, dict]:
+    # 監視プロセスでは、地域の状態を持つ各ワーカーの結果と合わせて判定する
+    if not _worker_ports:
+        return ok, details
+    workers_ok, workers = _check_workers(path)
+    return ok and workers_ok, {**details, "workers": workers}
+
+
+@app.route("/healthz")
+def healthz():
+    """
+    スケジューラや地域のサイクルが停止している場合は503を返す。
+    WORKER_PROCESSES>1の監視プロセスでは、いずれかのワーカーが異常な場合も503を返す。
+    """
+    ok, details = _health(*HEALTH.liveness(), "/healthz")
+    response.status = 200 if ok else 503
+    return {"status": "ok" if ok else "unhealthy", **details}
+
+
+@app.route("/readyz")
+def readyz():
+    """
+    ログインや運行情報の取得ができていない場合は503を返す。
+    WORKER_PROCESSES>1の監視プロセスでは、いずれかのワーカーが準備できていない場合も503を返す。
+    """
+    ok, details = _health(*HEALTH.readiness(), "/readyz")
+    response.status = 200 if ok else 503
+    return {"status": "ok" if ok else "not ready", **details}
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Prometheus形式のメトリクスを返す
+    """
+    response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+    return REGISTRY.render()
+
+
+def server_run(
+    port: int = 8080, worker_ports: dict[str, int] | None = None
+) -> EmbeddedServer:
+    """
+    HTTPサーバーをバックグラウンドで起動する。
+    実装は環境変数HTTP_SERVERで選択でき、プロセスの終了時に処理中のリクエストを待って停止する。
+
+    Parameters
+    ----------
+    port : int, optional
+        待ち受けるポート, by default 8080
+    worker_ports : dict[str, int] | None, optional
+        監視プロセスで起動する場合の、ワーカーIDと各ワーカーのサーバーのポートの対応, by default None
 
-    t = Thread(target=_run, daemon=True)
-    t.start()
-    return t
+    Returns
+    -------
+    EmbeddedServer
+        起動したサーバー
+    """
+    _worker_ports.update(worker_ports or {})
+    server = EmbeddedServer(app, port=port)
+    server.start()
+    atexit.register(server.stop)
+    # 登録と逆順に実行されるため、停止を待つ前にイベントの配信を終える
+    atexit.register(EVENTS.close)
+    return server
 
 
 if __name__ == "__main__":
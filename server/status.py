@@ -0,0 +1,62 @@
+import os
+from functools import lru_cache
+
+from bottle import Bottle, request, response
+
+from runner.status_cache import STATUS_CACHE, CachedResponse
+
+status_app = Bottle()
+
+
+@lru_cache(maxsize=1)
+def _cache_control() -> str:
+    max_age = int(os.getenv("STATUS_MAX_AGE", "30"))
+    return f"public, max-age={max_age}"
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Matchは弱い比較を行う
+    return any(
+        tag.strip().removeprefix("W/") in (etag, "*")
+        for tag in if_none_match.split(",")
+    )
+
+
+def _respond(cached: CachedResponse) -> bytes:
+    response.headers["ETag"] = cached.etag
+    response.headers["Cache-Control"] = _cache_control()
+    if _matches(request.headers.get("If-None-Match", ""), cached.etag):
+        response.status = 304
+        return b""
+    response.content_type = "application/json; charset=utf-8"
+    return cached.body
+
+
+def _not_found(message: str) -> dict[str, str]:
+    response.status = 404
+    return {"error": message}
+
+
+@status_app.route("/<region>")
+def region_status(region: str):
+    """
+    地域全体の運行状況を返す。応答は公開時にシリアライズ済みで、SourceやRedisには触れない。
+    """
+    published = STATUS_CACHE.get(region)
+    if published is None:
+        return _not_found(f"No status available for {region}")
+    return _respond(published.region_response)
+
+
+@status_app.route("/<region>/<line>")
+def line_status(region: str, line: str):
+    """
+    路線の運行状況を返す。一覧にない路線は平常運転とみなされるため404を返す。
+    """
+    published = STATUS_CACHE.get(region)
+    if published is None:
+        return _not_found(f"No status available for {region}")
+    cached = published.line_responses.get(line)
+    if cached is None:
+        return _not_found(f"{line} is not listed for {region}")
+    return _respond(cached)
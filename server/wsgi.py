@@ -0,0 +1,372 @@
+import os
+import queue
+import socket
+from collections.abc import Callable
+from threading import Condition, Lock, Thread, current_thread
+from time import monotonic
+from typing import Any
+from wsgiref.simple_server import (
+    ServerHandler,
+    WSGIRequestHandler,
+    WSGIServer,
+    make_server,
+)
+
+from utils.make_logger import make_logger
+
+logger = make_logger(__name__)
+
+
+class _ServerHandler(ServerHandler):
+    # closeでヘッダが破棄されるため、接続を維持できるかをその前に記録する
+    has_content_length = False
+
+    def close(self) -> None:
+        headers = getattr(self, "headers", None)
+        self.has_content_length = headers is not None and "Content-Length" in headers
+        super().close()
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    1つの接続で複数のリクエストを処理するリクエストハンドラ
+
+    リクエストの受信中はrequest_timeout、次のリクエストを待つ間はkeepalive_timeoutを
+    ソケットのタイムアウトとする。Content-Lengthのない応答（ストリーミング）の後は接続を閉じる。
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "ThreadPoolWSGIServer"
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.settimeout(self.server.request_timeout)
+        # ヘッダと本文を別々に書き込むため、Nagleアルゴリズムによる遅延を避ける
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self) -> None:
+        self.close_connection = True
+        self._handle_request()
+        while not self.close_connection and not self.server.stopping:
+            self.connection.settimeout(self.server.keepalive_timeout)
+            try:
+                # 次のリクエストが届くまで待機する
+                if not self.rfile.peek(1):  # type: ignore[attr-defined]
+                    return
+            except (TimeoutError, OSError):
+                return
+            self.connection.settimeout(self.server.request_timeout)
+            self._handle_request()
+
+    def _handle_request(self) -> None:
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (TimeoutError, OSError):
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            self.close_connection = True
+            return
+
+        handler = _ServerHandler(
+            self.rfile,
+            self.wfile,  # type: ignore[arg-type]
+            self.get_stderr(),
+            self.get_environ(),
+            multithread=True,
+        )
+        handler.http_version = self.request_version.removeprefix("HTTP/")
+        handler.request_handler = self  # type: ignore[attr-defined]
+        app = self.server.get_app()
+        assert app is not None
+        with self.server.track_request():
+            handler.run(app)
+
+        if not handler.has_content_length:
+            self.close_connection = True
+
+    def log_request(self, code: int | str = "-", size: int | str = "-") -> None:
+        # ヘルスチェックなどでログが埋まらないよう、正常なリクエストは記録しない
+        pass
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.warning(f"{self.address_string()} - {format % args}")
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """
+    固定数のワーカースレッドで接続を処理するWSGIサーバー
+
+    Attributes
+    ----------
+    threads : int
+        常駐するワーカースレッド数
+    max_threads : int
+        ワーカースレッド数の上限。すべてのワーカーが処理中の場合は上限まで追加し、
+        追加したワーカーはidle_timeoutの間接続がなければ終了する。
+        SSEのように接続を保持し続ける応答が常駐ワーカーを占有しないようにする
+    request_timeout : float
+        リクエストの送受信のタイムアウト（秒）
+    keepalive_timeout : float
+        次のリクエストを待つ時間（秒）
+    """
+
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        handler_class: type[WSGIRequestHandler] = KeepAliveRequestHandler,
+        threads: int = 8,
+        request_timeout: float = 30.0,
+        keepalive_timeout: float = 5.0,
+        max_threads: int | None = None,
+        idle_timeout: float = 60.0,
+    ) -> None:
+        super().__init__(server_address, handler_class)
+        self.threads = threads
+        self.max_threads = max(max_threads or threads, threads)
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.idle_timeout = idle_timeout
+        self.stopping = False
+        self._active = 0
+        self._active_cond = Condition()
+
+        # 終了時に処理中の接続がプロセスの終了を妨げないよう、デーモンスレッドで処理する
+        self._connections: queue.Queue[tuple[Any, Any] | None] = queue.Queue()
+        self._workers: set[Thread] = set()
+        self._idle = 0
+        self._spawned = 0
+        self._workers_lock = Lock()
+        for _ in range(threads):
+            self._spawn(resident=True)
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    def _spawn(self, resident: bool) -> None:
+        worker = Thread(
+            target=self._work,
+            args=(resident,),
+            name=f"http-{self._spawned}",
+            daemon=True,
+        )
+        self._spawned += 1
+        self._workers.add(worker)
+        worker.start()
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        with self._workers_lock:
+            if self._idle == 0 and len(self._workers) < self.max_threads:
+                self._spawn(resident=False)
+        self._connections.put((request, client_address))
+
+    def _next_connection(self, resident: bool) -> tuple[Any, Any] | None:
+        with self._workers_lock:
+            self._idle += 1
+        try:
+            return self._connections.get(
+                timeout=None if resident else self.idle_timeout
+            )
+        except queue.Empty:
+            return None
+        finally:
+            with self._workers_lock:
+                self._idle -= 1
+
+    def _work(self, resident: bool = True) -> None:
+        try:
+            while (item := self._next_connection(resident)) is not None:
+                self._handle(*item)
+        finally:
+            with self._workers_lock:
+                self._workers.discard(current_thread())
+
+    def _handle(self, request: Any, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def track_request(self) -> "_ActiveRequest":
+        return _ActiveRequest(self)
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        logger.error(
+            f"Error while handling request from {client_address}", exc_info=True
+        )
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """
+        新しい接続の受付を止め、処理中のリクエストの完了を待ってから停止する。
+
+        Parameters
+        ----------
+        timeout : float, optional
+            処理中のリクエストを待つ最大時間（秒）, by default 10.0
+
+        Returns
+        -------
+        bool
+            時間内にすべてのリクエストが完了した場合はTrue
+        """
+        self.stopping = True
+        self.shutdown()
+        self.server_close()
+        deadline = monotonic() + timeout
+        with self._active_cond:
+            completed = self._active_cond.wait_for(
+                lambda: self._active == 0, timeout=max(deadline - monotonic(), 0.0)
+            )
+        with self._workers_lock:
+            workers = len(self._workers)
+        for _ in range(workers):
+            self._connections.put(None)
+        return completed
+
+
+class _ActiveRequest:
+    def __init__(self, server: ThreadPoolWSGIServer) -> None:
+        self.server = server
+
+    def __enter__(self) -> None:
+        with self.server._active_cond:
+            self.server._active += 1
+
+    def __exit__(self, *exc: object) -> None:
+        with self.server._active_cond:
+            self.server._active -= 1
+            self.server._active_cond.notify_all()
+
+
+class EmbeddedServer:
+    """
+    バックグラウンドのスレッドで動作するHTTPサーバー
+
+    Attributes
+    ----------
+    backend : str
+        サーバーの実装。"threaded", "wsgiref", "waitress"のいずれか
+    thread : Thread
+        サーバーを実行しているスレッド
+
+    Methods
+    -------
+    start() -> None
+        サーバーを起動する
+    stop(timeout: float = 10.0) -> None
+        サーバーを停止する。処理中のリクエストは完了を待つ
+    """
+
+    BACKENDS = ("threaded", "wsgiref", "waitress")
+
+    def __init__(
+        self,
+        app: Callable,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        backend: str | None = None,
+        threads: int | None = None,
+        request_timeout: float | None = None,
+        keepalive_timeout: float | None = None,
+        max_threads: int | None = None,
+    ) -> None:
+        self.backend = (backend or os.getenv("HTTP_SERVER") or "threaded").lower()
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"Unknown HTTP server backend: {self.backend}")
+
+        threads = threads or int(os.getenv("HTTP_THREADS", "8"))
+        max_threads = max_threads or int(os.getenv("HTTP_MAX_THREADS", "256"))
+        request_timeout = request_timeout or float(
+            os.getenv("HTTP_REQUEST_TIMEOUT", "30")
+        )
+        keepalive_timeout = keepalive_timeout or float(
+            os.getenv("HTTP_KEEPALIVE_TIMEOUT", "5")
+        )
+
+        self._server: Any = None
+        if self.backend == "waitress":
+            self._server = self._create_waitress(
+                app, host, port, threads, request_timeout
+            )
+        if self._server is None and self.backend == "wsgiref":
+            self._server = make_server(host, port, app)
+        if self._server is None:
+            self.backend = "threaded"
+            self._server = make_server(  # type: ignore[call-overload]
+                host,
+                port,
+                app,
+                server_class=lambda address, handler: ThreadPoolWSGIServer(
+                    address,
+                    handler,
+                    threads=threads,
+                    request_timeout=request_timeout,
+                    keepalive_timeout=keepalive_timeout,
+                    max_threads=max_threads,
+                ),
+                handler_class=KeepAliveRequestHandler,
+            )
+        self.thread = Thread(target=self._serve, name="http-server", daemon=True)
+        self._stopped = False
+
+    @staticmethod
+    def _create_waitress(
+        app: Callable, host: str, port: int, threads: int, request_timeout: float
+    ) -> Any:
+        try:
+            from waitress import create_server  # type: ignore[import-untyped]
+        except ImportError:
+            logger.warning("waitress is not installed. Using the threaded server")
+            return None
+        return create_server(
+            app,
+            host=host,
+            port=port,
+            threads=threads,
+            channel_timeout=request_timeout,
+        )
+
+    @property
+    def port(self) -> int:
+        if self.backend == "waitress":
+            return self._server.effective_port
+        return self._server.server_address[1]
+
+    def _serve(self) -> None:
+        if self.backend == "waitress":
+            self._server.run()
+        else:
+            self._server.serve_forever()
+
+    def start(self) -> None:
+        self.thread.start()
+        logger.info(f"HTTP server ({self.backend}) listening on port {self.port}")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+        if self.backend == "waitress":
+            self._server.close()
+        elif isinstance(self._server, ThreadPoolWSGIServer):
+            if not self._server.stop(timeout):
+                logger.warning("HTTP server stopped with requests still in progress")
+        else:
+            self._server.shutdown()
+            self._server.server_close()
+        self.thread.join(timeout)
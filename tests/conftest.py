@@ -0,0 +1,17 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from enums import Region
+from runner.manager import RegionalManager
+
+
+@pytest.fixture
+def manager():
+    # 運行情報の取得とログインは行わず、ログインは成功したものとして扱う
+    with patch("runner.manager.TrainInfoClient"):
+        m = RegionalManager(Region.KANTO)
+    for client in m.clients.values():
+        client.login = MagicMock(return_value=True)
+    m.get_auth = MagicMock(return_value=("user", "pass"))
+    return m
@@ -0,0 +1,23 @@
+import json
+
+from benchmarks.fakes import FaultInjection
+from benchmarks.pipeline import BenchmarkConfig, compare, run_benchmark
+
+
+def test_pipeline_benchmark_reports_stage_latencies(tmp_path):
+    # スタンドインに対してサイクルを実行し、ステージごとの計測時間と投稿数を保存できること
+    config = BenchmarkConfig(
+        cycles=3, lines=10, change_rate=0.5, source_faults=FaultInjection(0.001)
+    )
+    result = run_benchmark(config)
+
+    stages = result.stages()
+    assert stages["cycle_ms"]["count"] == 3
+    for stage in ("fetch_ms", "redis_ms", "diff_ms"):
+        assert stages[stage]["count"] == 3
+    assert result.counters["posts"] > 0
+    assert result.cycles_per_sec > 0
+
+    data = json.loads(result.save(tmp_path / "result.json").read_text())
+    assert data["config"]["lines"] == 10
+    assert "cycles/s" in compare(data, data)
@@ -1,10 +1,17 @@
 from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
 
-from clients.bluesky import BlueskyClient
+import requests
+
+from clients.baseclient import POST_SECONDS, POSTS, RateLimiter
+from clients.bluesky import BlueskyClient, make_tid
+from clients.dedup import PostDeduplicator
 
 
 def _make_client() -> BlueskyClient:
-    return BlueskyClient()
+    client = BlueskyClient()
+    client.deduplicator = PostDeduplicator()
+    return client
 
 
 def test_parse_uri_valid():
@@ -81,3 +88,286 @@ def test_post_without_login_returns_failure():
     result = client.post("Hello")
     assert result.success is False
     assert result.error == "Not logged in"
+
+
+def _logged_in_client() -> BlueskyClient:
+    client = _make_client()
+    client.handle = "user.bsky.social"
+    client.did = "did:plc:abc123"
+    client.accessjwt = "access"
+    client.refreshjwt = "refresh"
+    client.last_refresh = datetime.now(timezone.utc)
+    client.session = MagicMock()
+    client.rate_limiter = RateLimiter(rate=1000, burst=1000, max_in_flight=10)
+    return client
+
+
+def _created(uri: str, cid: str) -> MagicMock:
+    response = MagicMock()
+    response.headers = {}
+    response.json.return_value = {"uri": uri, "cid": cid}
+    return response
+
+
+def test_reply_to_own_post_skips_get_record():
+    # 自身の投稿への返信では getRecord を呼ばず、root/parent が正しく設定されること
+    client = _logged_in_client()
+    root_uri = "at://did:plc:abc123/app.bsky.feed.post/root"
+    child_uri = "at://did:plc:abc123/app.bsky.feed.post/child"
+    client.session.post.side_effect = [
+        _created(root_uri, "cid-root"),
+        _created(child_uri, "cid-child"),
+        _created("at://did:plc:abc123/app.bsky.feed.post/grandchild", "cid-gc"),
+    ]
+
+    first = client.post("root")
+    second = client.post("child", reply_to=first.ref)
+    client.post("grandchild", reply_to=second.ref)
+
+    client.session.get.assert_not_called()
+    reply = client.session.post.call_args_list[2].kwargs["json"]["record"]["reply"]
+    assert reply["root"] == {"uri": root_uri, "cid": "cid-root"}
+    assert reply["parent"] == {"uri": child_uri, "cid": "cid-child"}
+
+
+def test_reply_to_external_post_is_cached():
+    # 外部の投稿の参照は一度だけ getRecord で取得し、以降はキャッシュを使うこと
+    client = _logged_in_client()
+    uri = "at://did:plc:other/app.bsky.feed.post/rkey"
+    record = MagicMock()
+    record.json.return_value = {"uri": uri, "cid": "cid-ext", "value": {}}
+    client.session.get.return_value = record
+
+    first = client._get_reply_refs(uri)
+    second = client._get_reply_refs(uri)
+
+    assert client.session.get.call_count == 1
+    assert first == second
+    assert first["root"] == {"uri": uri, "cid": "cid-ext"}
+
+
+def test_thread_ref_cache_is_bounded():
+    # キャッシュが上限を超えた場合、古い参照から破棄されること
+    client = _make_client()
+    client.thread_refs_maxsize = 2
+    for i in range(3):
+        ref = {"uri": f"at://did/app.bsky.feed.post/{i}", "cid": f"cid{i}"}
+        client._remember_thread_ref(ref, ref)
+    assert list(client._thread_refs) == [
+        "at://did/app.bsky.feed.post/1",
+        "at://did/app.bsky.feed.post/2",
+    ]
+
+
+def _jwt(exp: datetime) -> str:
+    import base64
+    import json
+
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"exp": int(exp.timestamp())}).encode()
+    ).rstrip(b"=")
+    return f"header.{payload.decode()}.signature"
+
+
+def test_decode_jwt_expiry():
+    # JWT のペイロードから有効期限が読み取れること
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert BlueskyClient._decode_jwt_expiry(_jwt(exp)) == exp
+
+
+def test_decode_jwt_expiry_invalid_token():
+    # 不正な JWT の場合、None が返ること
+    assert BlueskyClient._decode_jwt_expiry("invalid") is None
+
+
+def test_should_refresh_uses_jwt_expiry():
+    # JWT の有効期限が近づいた場合のみリフレッシュが必要と判定されること
+    client = _make_client()
+    client.last_refresh = datetime.now(timezone.utc)
+    client.access_expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    assert client._should_refresh() is False
+
+    client.access_expires_at = datetime.now(timezone.utc) + timedelta(
+        seconds=client.refresh_margin - 1
+    )
+    assert client._should_refresh() is True
+
+
+def test_concurrent_refresh_is_collapsed():
+    # 複数スレッドが同時に期限切れを検知しても、リフレッシュは一度だけ行われること
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = _logged_in_client()
+    client.access_expires_at = datetime.now(timezone.utc)
+    refreshed = MagicMock()
+    refreshed.json.return_value = {
+        "accessJwt": _jwt(datetime.now(timezone.utc) + timedelta(hours=2)),
+        "refreshJwt": "new-refresh",
+    }
+    client.session.post.return_value = refreshed
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: client._refresh_token(), range(8)))
+
+    assert client.session.post.call_count == 1
+    assert client.refreshjwt == "new-refresh"
+
+
+def test_login_resumes_saved_session():
+    # 保存されたセッションがある場合、createSession を呼ばずに再開すること
+    client = _make_client()
+    client.session = MagicMock()
+    client._session_store = MagicMock()
+    client._session_store.load.return_value = {
+        "handle": "user.bsky.social",
+        "did": "did:plc:abc123",
+        "refreshJwt": "saved-refresh",
+    }
+    refreshed = MagicMock()
+    refreshed.json.return_value = {
+        "accessJwt": _jwt(datetime.now(timezone.utc) + timedelta(hours=2)),
+        "refreshJwt": "new-refresh",
+    }
+    client.session.post.return_value = refreshed
+
+    assert client.login("user.bsky.social", "password") is True
+    assert client.session.post.call_count == 1
+    assert client.session.post.call_args.args[0].endswith("refreshSession")
+    client._session_store.save.assert_called_once()
+
+
+def test_post_thread_chains_replies_with_one_call_each():
+    # スレッド投稿では各メッセージが createRecord 1回で投稿され、返信先が連結されること
+    client = _logged_in_client()
+    uris = [f"at://did:plc:abc123/app.bsky.feed.post/{i}" for i in range(3)]
+    client.session.post.side_effect = [
+        _created(u, f"cid{i}") for i, u in enumerate(uris)
+    ]
+    posted = []
+
+    result = client.post_thread(
+        ["a", "b", "c"], on_posted=lambda i, post: posted.append((i, post.ref))
+    )
+
+    assert result.success is True
+    assert result.last_ref == uris[2]
+    assert posted == [(0, uris[0]), (1, uris[1]), (2, uris[2])]
+    assert client.session.post.call_count == 3
+    client.session.get.assert_not_called()
+    last = client.session.post.call_args_list[2].kwargs["json"]["record"]["reply"]
+    assert last["root"] == {"uri": uris[0], "cid": "cid0"}
+    assert last["parent"] == {"uri": uris[1], "cid": "cid1"}
+
+
+def test_post_thread_stops_at_first_failure():
+    # 投稿に失敗した時点でスレッドの投稿が打ち切られること
+    client = _logged_in_client()
+    failed = MagicMock()
+    failed.headers = {}
+    failed.raise_for_status.side_effect = Exception("server error")
+    client.session.post.side_effect = [
+        _created("at://did:plc:abc123/app.bsky.feed.post/0", "cid0"),
+        failed,
+    ]
+
+    result = client.post_thread(["a", "b", "c"], max_retries=1)
+
+    assert result.success is False
+    assert len(result.results) == 2
+    assert client.session.post.call_count == 2
+
+
+def test_post_skips_duplicate_delivery():
+    # 同じスレッドへの同じ内容の投稿が配信済みの場合、投稿せずに ref が返ること
+    client = _logged_in_client()
+    uri = "at://did:plc:abc123/app.bsky.feed.post/0"
+    client.session.post.return_value = _created(uri, "cid0")
+
+    first = client.post("Hello")
+    second = client.post("Hello")
+
+    assert client.session.post.call_count == 1
+    assert second.success is True
+    assert second.deduplicated is True
+    assert second.ref == first.ref
+    assert client.deduplicator.hits == 1
+
+
+def test_post_thread_resumes_after_duplicate():
+    # 配信済みのメッセージを省略し、残りのメッセージをそのスレッドに続けて投稿すること
+    client = _logged_in_client()
+    uris = [f"at://did:plc:abc123/app.bsky.feed.post/{i}" for i in range(3)]
+    client.session.post.side_effect = [
+        _created(u, f"cid{i}") for i, u in enumerate(uris)
+    ]
+    client.post_thread(["a"])
+
+    result = client.post_thread(["a", "b"])
+
+    assert result.success is True
+    assert result.results[0].deduplicated is True
+    assert client.session.post.call_count == 2
+    reply = client.session.post.call_args.kwargs["json"]["record"]["reply"]
+    assert reply["parent"] == {"uri": uris[0], "cid": "cid0"}
+
+
+def test_post_thread_counts_posts():
+    # スレッド投稿でも投稿数と所要時間が計測されること
+    client = _logged_in_client()
+    uris = [f"at://did:plc:abc123/app.bsky.feed.post/{i}" for i in range(2)]
+    client.session.post.side_effect = [
+        _created(u, f"cid{i}") for i, u in enumerate(uris)
+    ]
+    posts = POSTS.labels(client.service_name, "success")
+    seconds = POST_SECONDS.labels(client.service_name)
+    posted, observed = posts.value, seconds.count
+
+    assert client.post_thread(["a", "b"]).success is True
+    assert posts.value == posted + 2
+    assert seconds.count == observed + 2
+
+
+def test_retry_after_commit_reuses_rkey():
+    # 作成済みの投稿への再試行は同じ rkey で行われ、既存のレコードが結果として返ること
+    client = _logged_in_client()
+    uri = "at://did:plc:abc123/app.bsky.feed.post/rkey"
+    conflict = MagicMock()
+    conflict.headers = {}
+    conflict.raise_for_status.side_effect = requests.HTTPError(
+        response=MagicMock(status_code=400, headers={})
+    )
+    client.session.post.side_effect = [requests.ReadTimeout("timed out"), conflict]
+    existing = MagicMock(status_code=200)
+    existing.json.return_value = {"uri": uri, "cid": "cid0", "value": {"text": "Hello"}}
+    client.session.get.return_value = existing
+
+    result = client.post("Hello")
+
+    assert result.success is True
+    assert result.ref == uri
+    first, second = (c.kwargs["json"] for c in client.session.post.call_args_list)
+    assert first["rkey"] == second["rkey"]
+    assert client.session.get.call_args.kwargs["params"]["rkey"] == first["rkey"]
+
+
+def test_post_thread_uses_given_post_keys():
+    # 送信箱に保存したキーが各メッセージの rkey として使われること
+    client = _logged_in_client()
+    uris = [f"at://did:plc:abc123/app.bsky.feed.post/{i}" for i in range(2)]
+    client.session.post.side_effect = [
+        _created(u, f"cid{i}") for i, u in enumerate(uris)
+    ]
+    keys = [client.make_post_key(), client.make_post_key()]
+
+    assert client.post_thread(["a", "b"], post_keys=keys).success is True
+    assert [
+        c.kwargs["json"]["rkey"] for c in client.session.post.call_args_list
+    ] == keys
+
+
+def test_make_tid_is_time_ordered():
+    # TID は 13 文字で、作成順に並ぶこと
+    tids = [make_tid() for _ in range(100)]
+    assert all(len(tid) == 13 for tid in tids)
+    assert tids == sorted(tids)
+    assert len(set(tids)) == len(tids)
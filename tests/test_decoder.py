@@ -0,0 +1,102 @@
+import json
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from enums import Region
+from traininfo.sources import decoder
+from traininfo.sources.decoder import JSONDecoder, NHKPayload
+from traininfo.sources.nhk import NHKClient
+
+PAYLOAD = {
+    "channel": {
+        "title": "関東の運行情報",
+        "item": [
+            {
+                "trainLine": "山手線",
+                "detailStatusCode": "01",
+                "detailStatusName": "運転見合わせ",
+                "textShort": "見合わせ",
+                "textLong": "運転を見合わせています。",
+            }
+        ],
+        "itemLong": [],
+    }
+}
+CONTENT = json.dumps(PAYLOAD, ensure_ascii=False).encode()
+
+
+def test_fetch_decodes_response_bytes():
+    # 応答の本文をバイト列からデコードし、解析できること
+    response = requests.Response()
+    response.status_code = 200
+    response._content = CONTENT
+    session = MagicMock()
+    session.get.return_value = response
+
+    result = NHKClient(session=session, region=Region.KANTO).request()
+    assert result.is_success
+    assert result.data[0].status == "🛑運転見合わせ"
+    assert result.data[0].detail == "運転を見合わせています。"
+
+
+def test_missing_backend_falls_back_to_json():
+    # 指定した実装がインストールされていない場合は標準のjsonを使うこと
+    with patch.object(
+        decoder, "_load", lambda name: None if name == "orjson" else json.loads
+    ):
+        assert JSONDecoder(backend="orjson").backend == "json"
+    with pytest.raises(ValueError):
+        JSONDecoder(backend="simdjson")
+
+
+def test_schema_extracts_only_needed_fields():
+    # msgspecではスキーマにないフィールドを読み飛ばし、合わない応答ではスキーマを使わないこと
+    pytest.importorskip("msgspec")
+    typed = JSONDecoder(NHKPayload, backend="msgspec")
+    item = typed.decode(CONTENT)["channel"]["item"][0]
+    assert "textShort" not in item
+    assert item["trainLine"] == "山手線"
+
+    mismatched = json.dumps({"channel": {"item": [{"trainLine": 1}]}}).encode()
+    assert typed.decode(mismatched)["channel"]["item"][0]["trainLine"] == 1
+    assert typed.decode(CONTENT)["channel"]["title"] == "関東の運行情報"
+
+
+def test_backend_decode_error_is_raised_as_value_error():
+    # ValueErrorを継承しない実装のエラーも、ValueErrorとして送出されリトライされないこと
+    class DecodeError(Exception):
+        pass
+
+    class ValidationError(DecodeError):
+        pass
+
+    def decode(data):
+        raise DecodeError("malformed")
+
+    fake = SimpleNamespace(
+        DecodeError=DecodeError,
+        ValidationError=ValidationError,
+        json=SimpleNamespace(
+            decode=decode, Decoder=lambda schema: SimpleNamespace(decode=decode)
+        ),
+    )
+    with patch.dict(sys.modules, {"msgspec": fake}):
+        for schema in (None, NHKPayload):
+            typed = JSONDecoder(schema, backend="msgspec")
+            assert typed.backend == "msgspec"
+            with pytest.raises(ValueError):
+                typed.decode(b"{")
+
+        client = NHKClient(session=MagicMock(), region=Region.KANTO)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{"
+    client.session.get.return_value = response
+
+    result = client.request()
+    assert not result.is_success
+    client.session.get.assert_called_once()
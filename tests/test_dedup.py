@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from clients.dedup import PostDeduplicator, normalize_text
+
+
+@pytest.fixture(autouse=True)
+def _no_redis():
+    with patch("clients.dedup.get_redis_client", return_value=None):
+        yield
+
+
+def test_normalize_text_ignores_whitespace_and_width():
+    # 空白の違いや全角・半角の違いが無視されること
+    assert normalize_text("  山手線 :\n 遅延１ ") == normalize_text("山手線 : 遅延1")
+
+
+def test_lookup_after_record():
+    # 記録した投稿が重複として検出され、カウンタが更新されること
+    dedup = PostDeduplicator()
+    assert dedup.lookup("Bluesky", "did", "text", None) is None
+    dedup.record("Bluesky", "did", "text", None, "ref")
+    assert dedup.lookup("Bluesky", "did", "text", None) == "ref"
+    assert dedup.hits == 1
+    assert dedup.misses == 1
+
+
+def test_different_thread_root_is_not_duplicate():
+    # スレッドの root が異なる場合は重複とみなさないこと
+    dedup = PostDeduplicator()
+    dedup.record("Bluesky", "did", "text", "root-a", "ref")
+    assert dedup.lookup("Bluesky", "did", "text", "root-b") is None
+
+
+def test_record_expires_after_ttl():
+    # 有効期限を過ぎた記録は重複とみなさないこと
+    dedup = PostDeduplicator(ttl=10)
+    with patch("clients.dedup.time.monotonic", return_value=100.0):
+        dedup.record("Bluesky", "did", "text", None, "ref")
+    with patch("clients.dedup.time.monotonic", return_value=111.0):
+        assert dedup.lookup("Bluesky", "did", "text", None) is None
+
+
+def test_local_cache_is_bounded():
+    # プロセス内キャッシュが上限を超えた場合、古い記録から破棄されること
+    dedup = PostDeduplicator(maxsize=2)
+    for i in range(3):
+        dedup.record("Bluesky", "did", f"text{i}", None, f"ref{i}")
+    assert len(dedup._local) == 2
+    assert dedup.lookup("Bluesky", "did", "text0", None) is None
+
+
+def test_lookup_falls_back_to_redis():
+    # プロセス内にない記録は Redis から取得し、TTL 付きで保存されること
+    mock_redis = MagicMock()
+    mock_redis.get.return_value = "ref-from-redis"
+    with patch("clients.dedup.get_redis_client", return_value=mock_redis):
+        dedup = PostDeduplicator(ttl=60)
+        assert dedup.lookup("Bluesky", "did", "text", None) == "ref-from-redis"
+        dedup.record("Bluesky", "did", "text", None, "ref")
+    assert mock_redis.set.call_args.kwargs["ex"] == 60
@@ -0,0 +1,148 @@
+import http.client
+import json
+from unittest.mock import patch
+
+import pytest
+
+from runner.events import EventBroker
+from server import events
+from server.events import events_app
+from server.wsgi import EmbeddedServer
+from traininfo.message import diff_status
+from traininfo.trainstatus import TrainStatus
+
+PREVIOUS = (
+    TrainStatus("山手線", "🕒列車遅延", "遅れが出ています。"),
+    TrainStatus("中央線", "🛑運転見合わせ", "運転を見合わせています。"),
+)
+LATEST = (
+    TrainStatus("山手線", "🛑運転見合わせ", "運転を見合わせています。"),
+    TrainStatus("京浜東北線", "🕒列車遅延", "遅れが出ています。"),
+)
+
+
+def read_event(response: http.client.HTTPResponse) -> dict[str, str]:
+    fields: dict[str, str] = {}
+    while line := response.readline().decode().rstrip("\n"):
+        if line.startswith(":"):
+            continue
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    return fields or read_event(response)
+
+
+def test_diff_is_published_per_line():
+    # 差分が路線ごとにchanged, new, resolvedのイベントとして配信されること
+    broker = EventBroker()
+    published = broker.publish_diff("kanto", diff_status(LATEST, PREVIOUS))
+    frames = [event.frame.decode() for event in published]
+    assert [f.split("\n")[1] for f in frames] == [
+        "event: changed",
+        "event: new",
+        "event: resolved",
+    ]
+    data = json.loads(frames[0].split("\n")[2].removeprefix("data: "))
+    assert data["previous_status"] == "🕒列車遅延"
+    assert data["status"] == "🛑運転見合わせ"
+
+
+def test_resume_from_ring_buffer():
+    # Last-Event-ID以降のイベントを再送し、バッファから消えている場合は取りこぼしを知らせること
+    broker = EventBroker(buffer_size=2)
+    for i in range(3):
+        broker.publish("kanto", "changed", {"n": i})
+
+    resumed = broker.subscribe(last_event_id=broker.event_id(2))
+    assert [e.id for e in resumed.backlog] == [3]
+    assert not resumed.gap
+    assert broker.subscribe(last_event_id=broker.event_id(0)).gap
+    assert broker.subscribe(last_event_id=broker.event_id(100)).gap
+
+
+def test_event_ids_from_other_process_are_gaps():
+    # 再起動前や他のプロセスのイベントIDは、連番が同じでも取りこぼしとみなすこと
+    broker = EventBroker()
+    previous = EventBroker()
+    for i in range(3):
+        broker.publish("kanto", "changed", {"n": i})
+        previous.publish("kanto", "changed", {"n": i})
+
+    assert broker.epoch != previous.epoch
+    resumed = broker.subscribe(last_event_id=previous.event_id(1))
+    assert resumed.gap
+    assert resumed.backlog == []
+    for invalid in ("1", "", f"{broker.epoch}-x"):
+        assert broker.subscribe(last_event_id=invalid).gap
+
+
+def test_slow_subscriber_does_not_block_publisher():
+    # キューが溢れた購読者は切り離され、配信が待たされないこと
+    broker = EventBroker(queue_size=2)
+    slow = broker.subscribe()
+    for i in range(5):
+        broker.publish("kanto", "changed", {"n": i})
+
+    assert broker.subscribers == 0
+    assert slow.get(timeout=0).id == 1
+    assert slow.get(timeout=0).id == 2
+    with pytest.raises(OverflowError):
+        slow.get(timeout=0)
+
+
+@pytest.fixture
+def broker():
+    broker = EventBroker()
+    server = EmbeddedServer(events_app, host="127.0.0.1", port=0, threads=2)
+    with patch.object(events, "EVENTS", broker):
+        server.start()
+        yield broker, server.port
+        broker.close()
+        server.stop(timeout=5)
+
+
+def test_stream_to_many_subscribers(broker):
+    # 常駐ワーカー数を超える購読者にも、それぞれイベントが届くこと
+    broker, port = broker
+    connections = []
+    for _ in range(20):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/?region=kanto")
+        response = conn.getresponse()
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        assert read_event(response) == {"retry": "5000"}
+        connections.append((conn, response))
+
+    broker.publish("kansai", "new", {"train": "大阪環状線"})
+    broker.publish("kanto", "new", {"train": "山手線"})
+    for conn, response in connections:
+        event = read_event(response)
+        assert event["id"] == broker.event_id(2)
+        assert json.loads(event["data"])["train"] == "山手線"
+        conn.close()
+
+
+def test_stream_resumes_from_last_event_id(broker):
+    # Last-Event-IDを指定すると、それ以降のイベントから配信されること
+    broker, port = broker
+    for train in ("山手線", "中央線"):
+        broker.publish("kanto", "new", {"train": train})
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", "/", headers={"Last-Event-ID": broker.event_id(1)})
+    response = conn.getresponse()
+    read_event(response)
+    assert read_event(response)["id"] == broker.event_id(2)
+    conn.close()
+
+
+def test_stream_resets_unknown_last_event_id(broker):
+    # 再起動前のイベントIDで再開しようとした場合、resetイベントで再取得を促すこと
+    broker, port = broker
+    broker.publish("kanto", "new", {"train": "山手線"})
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", "/", headers={"Last-Event-ID": "0000-1"})
+    response = conn.getresponse()
+    read_event(response)
+    assert read_event(response)["event"] == "reset"
+    conn.close()
@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from runner.health import HealthRegistry, HealthThresholds
+
+THRESHOLDS = HealthThresholds(
+    scheduler_grace=10, cycle_timeout=30, fetch_stale=60, post_stale=0
+)
+
+
+def test_liveness_detects_overdue_scheduler():
+    # スケジューラが予定の時刻と猶予を過ぎても応答しない場合は異常とみなすこと
+    health = HealthRegistry(THRESHOLDS)
+    with patch("runner.health.monotonic", return_value=100.0):
+        health.scheduler_heartbeat(next_expected_in=50)
+    with patch("runner.health.monotonic", return_value=155.0):
+        assert health.liveness()[0]
+    with patch("runner.health.monotonic", return_value=161.0):
+        ok, details = health.liveness()
+    assert not ok
+    assert "scheduler is overdue" in details["problems"][0]
+
+
+def test_liveness_detects_stuck_cycle():
+    # サイクルが閾値を超えて終わらない場合は異常とみなすこと
+    health = HealthRegistry(THRESHOLDS)
+    region = health.region("kanto")
+    with patch("runner.health.monotonic", return_value=100.0):
+        region.cycle_started()
+    with patch("runner.health.monotonic", return_value=131.0):
+        assert not health.liveness()[0]
+        region.cycle_finished()
+        assert health.liveness()[0]
+
+
+def test_readiness_requires_login_and_recent_fetch():
+    # ログイン済みで、最近運行情報を取得できている場合のみ準備完了とみなすこと
+    health = HealthRegistry(THRESHOLDS)
+    region = health.region("kanto")
+    region.set_logged_in("Bluesky", False)
+    with patch("runner.health.monotonic", return_value=100.0):
+        assert not health.readiness()[0]
+        region.set_logged_in("Bluesky", True)
+        region.fetch_succeeded()
+        ok, details = health.readiness()
+    assert ok
+    assert details["regions"]["kanto"]["logged_in"] == {"Bluesky": True}
+
+    with patch("runner.health.monotonic", return_value=161.0):
+        assert not health.readiness()[0]
+
+    health.remove("kanto")
+    assert health.readiness()[0]
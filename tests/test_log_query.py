@@ -0,0 +1,115 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from server.log_query import (
+    LogFilter,
+    LogIndex,
+    iter_entries,
+    parse_time,
+    tail_entries,
+)
+
+LINES = [
+    b"2026-01-01 10:00:00,000 INFO Main - started\n",
+    b"2026-01-01 10:01:00,000 ERROR Client\\[kanto] - failed\n",
+    b"Traceback (most recent call last):\n",
+    b"ValueError: boom\n",
+    b"2026-01-01 10:02:00,000 WARNING Main - retrying\n",
+    b"2026-01-01 10:03:00,000 INFO Client\\[kansai] - posted\n",
+]
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "output.log"
+    path.write_bytes(b"".join(LINES))
+    return path
+
+
+def test_iter_entries_groups_continuation_lines(log_path):
+    # トレースバックなどの継続行が直前のログに含まれること
+    with open(log_path, "rb") as f:
+        entries = list(iter_entries(f))
+    assert [e.level for e in entries] == ["INFO", "ERROR", "WARNING", "INFO"]
+    assert entries[1].raw.endswith(b"ValueError: boom\n")
+    assert entries[1].logger == "Client\\[kanto]"
+    assert entries[2].offset == sum(map(len, LINES[:4]))
+
+
+def test_tail_entries_applies_filter(log_path):
+    # 末尾から条件に合うログを指定件数だけ古い順に返すこと
+    with open(log_path, "rb") as f:
+        entries = tail_entries(f, 2, LogFilter(level="warning"))
+    assert [e.level for e in entries] == ["ERROR", "WARNING"]
+    assert b"Traceback" in entries[0].raw
+
+
+def test_filter_by_logger_and_time():
+    # ロガー名と日時の範囲で絞り込めること
+    log_filter = LogFilter(
+        logger="kansai",
+        since=datetime(2026, 1, 1, 10, 2),
+        until=datetime(2026, 1, 1, 10, 4),
+    )
+    entries = list(iter_entries(io.BytesIO(b"".join(LINES))))
+    assert [e.raw for e in entries if log_filter.match(e)] == [LINES[5]]
+
+
+def test_parse_time_relative_and_iso():
+    # 相対時間とISO 8601形式を解析できること
+    now = datetime(2026, 1, 1, 12, 0)
+    assert parse_time("15m", now) == datetime(2026, 1, 1, 11, 45)
+    assert parse_time("2026-01-01T10:00:00") == datetime(2026, 1, 1, 10, 0)
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
+
+
+def test_log_index_seeks_near_timestamp(log_path):
+    # 索引から指定日時より前の位置を求め、追記にも追従すること
+    index = LogIndex(str(log_path), step=1)
+    offset = index.seek_offset(datetime(2026, 1, 1, 10, 2, 30))
+    assert offset == sum(map(len, LINES[:4]))
+
+    with open(log_path, "ab") as f:
+        f.write(b"2026-01-01 10:05:00,000 INFO Main - appended\n")
+    assert index.seek_offset(datetime(2026, 1, 1, 10, 6)) == sum(map(len, LINES))
+
+
+OUT_OF_ORDER = [
+    b"2026-01-01 10:00:00,000 INFO Main - started\n",
+    b"2026-01-01 10:05:00,000 INFO Worker - written late\n",
+    b"2026-01-01 10:01:00,000 INFO Main - queued\n",
+    b"2026-01-01 10:02:00,000 INFO Main - queued\n",
+]
+
+
+def test_out_of_order_timestamps_are_not_skipped(tmp_path):
+    # ログの日時が前後していても、索引や末尾からの読み込みで条件に合うログを読み飛ばさないこと
+    path = tmp_path / "output.log"
+    path.write_bytes(b"".join(OUT_OF_ORDER))
+    since = datetime(2026, 1, 1, 10, 3)
+
+    start = LogIndex(str(path), step=1).seek_offset(since)
+    assert start <= len(OUT_OF_ORDER[0])
+    with open(path, "rb") as f:
+        assert OUT_OF_ORDER[1] in [e.raw for e in iter_entries(f, start)]
+        entries = tail_entries(f, 10, LogFilter(since=since), start)
+    assert [e.raw for e in entries] == [OUT_OF_ORDER[1]]
+
+
+def test_json_lines_are_parsed_and_filtered():
+    # JSON形式のログを解析し、cycle_idなどで絞り込めること
+    lines = [
+        b'{"ts": "2026-01-01T10:00:00.000", "level": "INFO", "logger": "Main", '
+        b'"msg": "a", "cycle_id": "abc", "region": "kanto"}\n',
+        b'{"ts": "2026-01-01T10:01:00.000", "level": "ERROR", "logger": "Main", '
+        b'"msg": "b", "cycle_id": "def", "region": "kansai"}\n',
+    ]
+    entries = list(iter_entries(io.BytesIO(b"".join(lines))))
+    assert [e.level for e in entries] == ["INFO", "ERROR"]
+    assert entries[1].timestamp == datetime(2026, 1, 1, 10, 1)
+
+    log_filter = LogFilter(cycle_id="abc")
+    assert [e.raw for e in entries if log_filter.match(e)] == [lines[0]]
@@ -0,0 +1,109 @@
+import gzip
+from unittest.mock import patch
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from server import logs
+from server.logs import logs_app
+
+LINES = [
+    b"2026-01-01 10:00:00,000 INFO Main - started\n",
+    b"2026-01-01 10:01:00,000 ERROR Client\\[kanto] - failed\n",
+    b"2026-01-01 10:02:00,000 INFO Main - done\n",
+]
+
+
+def request(path: str, query: str = "", headers: dict[str, str] | None = None):
+    environ: dict = {}
+    setup_testing_defaults(environ)
+    environ.update(PATH_INFO=path, QUERY_STRING=query, REQUEST_METHOD="GET")
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+        result["headers"] = dict(response_headers)
+
+    body = b"".join(logs_app(environ, start_response))
+    return result["status"], result["headers"], body
+
+
+@pytest.fixture(autouse=True)
+def log_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("LOG_PASSWORD", raising=False)
+    path = tmp_path / "output.log"
+    path.write_bytes(b"".join(LINES))
+    with patch.object(logs, "LOG_FILE_PATH", str(path)):
+        yield path
+
+
+def test_range_request_returns_partial_content():
+    # クエリを指定しない場合はRangeリクエストに対応すること
+    status, _, body = request("/", headers={"Range": "bytes=0-9"})
+    assert status == 206
+    assert body == LINES[0][:10]
+
+
+def test_tail_with_level_filter():
+    # 条件に合う最新のログのみ返すこと
+    status, _, body = request("/", "tail=1&level=error")
+    assert status == 200
+    assert body == LINES[1]
+
+
+def test_time_window_and_gzip():
+    # 日時の範囲で絞り込み、gzipで返すこと
+    status, headers, body = request(
+        "/",
+        "since=2026-01-01T10:01:00&until=2026-01-01T10:02:00",
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == LINES[1]
+
+
+def test_time_window_reads_past_later_entries(log_file):
+    # untilより後の日時のログが途中にあっても、以降の範囲内のログを返すこと
+    log_file.write_bytes(LINES[0] + LINES[2] + LINES[1])
+    status, _, body = request("/", "until=2026-01-01T10:02:00")
+    assert status == 200
+    assert body == LINES[0] + LINES[1]
+
+
+def test_follow_returns_appended_lines(log_file):
+    # followでは追記されたログも返すこと
+    appended = b"2026-01-01 10:03:00,000 WARNING Main - appended\n"
+
+    def sleep(_):
+        with open(log_file, "ab") as f:
+            f.write(appended)
+
+    with patch.object(logs.time, "sleep", side_effect=sleep, autospec=True):
+        status, _, body = request("/", "follow=1&level=warning&timeout=1")
+    assert status == 200
+    assert body.startswith(LINES[1] + appended)
+
+
+def test_invalid_query_is_rejected():
+    # 不正なクエリは400を返すこと
+    status, _, _ = request("/", "level=verbose")
+    assert status == 400
+
+
+def test_non_positive_tail_is_rejected():
+    # tailに0以下を指定した場合は400を返すこと
+    for tail in ("0", "-1"):
+        status, _, _ = request("/", f"tail={tail}")
+        assert status == 400
+
+
+def test_read_error_while_streaming_ends_response(log_file):
+    # 応答の途中でファイルを読めなくなった場合、例外を送出せずに応答を終えること
+    with patch.object(logs, "open", side_effect=FileNotFoundError, create=True):
+        status, _, body = request("/", "level=info")
+    assert status == 200
+    assert body == b""
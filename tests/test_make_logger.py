@@ -0,0 +1,167 @@
+import gzip
+import json
+import logging
+import queue
+from unittest.mock import patch
+
+import pytest
+
+from utils import make_logger as make_logger_module
+from utils.log_context import LogContextFilter, cycle, cycle_timings, timed
+from utils.make_logger import (
+    BatchingFileHandler,
+    DroppingQueueHandler,
+    JsonFormatter,
+    RotatingLogHandler,
+    disable_async_logging,
+    enable_async_logging,
+    list_log_segments,
+    make_logger,
+)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "output.log"
+    with (
+        patch.object(make_logger_module, "LOG_FILE_PATH", str(path)),
+        patch.object(make_logger_module, "_file_handler", None),
+    ):
+        yield path
+        disable_async_logging()
+
+
+def _record(level: int, msg: str, *args) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 0, msg, args, None)
+
+
+def test_async_logging_writes_through_listener(log_file):
+    # 非同期モードでは作成済みのロガーもキュー経由でファイルに書き込むこと
+    logger = make_logger("test_async_logger")
+    enable_async_logging(maxsize=100)
+    assert isinstance(logger.handlers[0], DroppingQueueHandler)
+
+    logger.info("hello %s", "world")
+    disable_async_logging()
+
+    assert "INFO test_async_logger - hello world" in log_file.read_text()
+    assert not any(isinstance(h, DroppingQueueHandler) for h in logger.handlers)
+
+
+def test_queue_handler_drops_when_full():
+    # キューが満杯の場合はログを破棄し、件数を数えること
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1), error_timeout=0.01)
+    handler.handle(_record(logging.INFO, "first"))
+    handler.handle(_record(logging.INFO, "second"))
+    handler.handle(_record(logging.ERROR, "third"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 2
+
+
+def test_queue_handler_formats_arguments_before_enqueue():
+    # 引数はキューに積む前に展開されること
+    handler = DroppingQueueHandler(queue.Queue())
+    handler.handle(_record(logging.INFO, "value=%d", 1))
+
+    record = handler.queue.get_nowait()
+    assert record.msg == "value=1"
+    assert record.args is None
+
+
+def test_batching_file_handler_flushes_in_batches(tmp_path):
+    # 指定件数に達するまでflushしないこと
+    path = tmp_path / "batch.log"
+    handler = BatchingFileHandler(str(path), flush_every=3, flush_interval=60)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    handler.handle(_record(logging.INFO, "a"))
+    handler.handle(_record(logging.INFO, "b"))
+    assert path.read_text() == ""
+
+    handler.handle(_record(logging.INFO, "c"))
+    assert path.read_text() == "a\nb\nc\n"
+
+    handler.handle(_record(logging.INFO, "d"))
+    handler.close()
+    assert path.read_text().endswith("d\n")
+
+
+def test_rotation_compresses_and_prunes_segments(tmp_path):
+    # サイズ超過でローテーションし、圧縮と保持数を超えた分の削除が行われること
+    path = tmp_path / "output.log"
+    handler = RotatingLogHandler(str(path), max_bytes=10, interval=0, backup_count=2)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    for i in range(4):
+        handler.handle(_record(logging.INFO, f"message {i}"))
+        handler.join_compressor()
+    handler.close()
+
+    segments = list_log_segments(str(path))
+    assert handler.rotations == 3
+    assert len(segments) == 2
+    assert all(segment.endswith(".gz") for segment in segments)
+    with gzip.open(segments[0], "rt") as f:
+        assert f.read() == "message 2\n"
+    assert path.read_text() == "message 3\n"
+
+
+def test_rotation_by_interval(tmp_path):
+    # 指定時間が経過するとローテーションすること
+    path = tmp_path / "output.log"
+    handler = RotatingLogHandler(str(path), max_bytes=0, interval=60)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.handle(_record(logging.INFO, "old"))
+
+    handler._opened_at -= 61
+    handler.handle(_record(logging.INFO, "new"))
+    handler.join_compressor()
+    handler.close()
+
+    assert handler.rotations == 1
+    assert path.read_text() == "new\n"
+    assert len(list_log_segments(str(path))) == 1
+
+
+def test_rotation_by_another_process_is_not_repeated(tmp_path):
+    # 他のプロセスがローテーション済みの場合、新しいファイルを再度ローテーションしないこと
+    path = tmp_path / "output.log"
+    handlers = [
+        RotatingLogHandler(str(path), max_bytes=0, interval=0) for _ in range(2)
+    ]
+    for i, handler in enumerate(handlers):
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.handle(_record(logging.INFO, f"worker {i}"))
+
+    for handler in handlers:
+        handler.do_rollover()
+        handler.join_compressor()
+    handlers[1].handle(_record(logging.INFO, "after"))
+    for handler in handlers:
+        handler.close()
+
+    assert [h.rotations for h in handlers] == [1, 0]
+    segments = list_log_segments(str(path))
+    assert len(segments) == 1
+    with gzip.open(segments[0], "rt") as f:
+        assert f.read() == "worker 0\nworker 1\n"
+    assert path.read_text() == "after\n"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_json_formatter_includes_context_and_timings():
+    # JSON形式ではサイクルのコンテキストと計測時間が出力されること
+    with cycle("kanto") as cycle_id:
+        with timed("diff_ms"):
+            pass
+        record = _record(logging.INFO, "done %s", "now")
+        record.__dict__.update(cycle_timings())
+        LogContextFilter().filter(record)
+
+    data = json.loads(JsonFormatter().format(record))
+    assert data["msg"] == "done now"
+    assert data["cycle_id"] == cycle_id
+    assert data["region"] == "kanto"
+    assert "service" not in data
+    assert data["diff_ms"] >= 0
@@ -0,0 +1,165 @@
+from threading import Event, Timer
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import main
+from clients.baseclient import ThreadResponse
+from enums import Region, Service
+from runner.manager import FetchedStatus, PostJob
+from traininfo.trainstatus import TrainStatus
+
+NORMAL = (TrainStatus("山手線", "🕒列車遅延", "遅れが出ています。"),)
+DELAYED = (TrainStatus("山手線", "🛑運転見合わせ", "運転を見合わせています。"),)
+RESUMED = (TrainStatus("山手線", "🕒列車遅延", "運転を再開しました。"),)
+STOPPED = (TrainStatus("山手線", "🛑運転見合わせ", "終日運転を見合わせます。"),)
+
+
+def test_release_region_stops_stage_threads(manager):
+    # 地域を手放した場合、ステージとログインのスレッドが停止し、処理待ちのジョブが破棄されること
+    started = Event()
+    release = Event()
+    processed = []
+    # ログインのスレッドが再試行を続けている状態にする
+    for client in manager.clients.values():
+        client.login.return_value = False
+
+    def diff(fetched):
+        started.set()
+        release.wait(timeout=5)
+        processed.append(fetched)
+
+    manager.diff_stage.handler = diff
+    manager.post_stage.handler = MagicMock()
+    manager.start_login()
+    manager.diff_stage.submit(Region.KANTO, FetchedStatus(table_name=None, latest=()))
+    assert started.wait(timeout=5)
+    manager.diff_stage.submit(Region.KANTO, FetchedStatus(table_name=None, latest=()))
+    manager.post_stage.submit(Region.KANTO, MagicMock())
+
+    managers = {Region.KANTO: manager}
+    # 処理中のジョブは終了を待ち、処理待ちのジョブは破棄すること
+    Timer(0.1, release.set).start()
+    main._release_region(managers, Region.KANTO)
+
+    assert managers == {}
+    threads = [*manager.diff_stage._threads, *manager.post_stage._threads]
+    assert threads and not any(t.is_alive() for t in threads)
+    assert manager._login_thread is not None
+    assert not manager._login_thread.is_alive()
+    assert len(processed) == 1
+    # 停止後に投入された項目は受け付けないこと
+    assert not manager.post_stage.submit(Region.KANTO, MagicMock())
+
+
+def test_post_with_empty_thread_result_schedules_retry(manager):
+    # 投稿結果が空の場合も例外にならず、再試行がスケジュールされること
+    client = manager.clients[Service.BLUESKY]
+    client.post_thread = MagicMock(return_value=ThreadResponse(results=[]))
+    outbox = manager.outboxes[Service.BLUESKY]
+    with patch("runner.outbox.get_redis_client", return_value=None):
+        entry = outbox.enqueue(["message"])
+        assert manager._post(client, outbox, entry) is False
+    assert entry.attempts == 1
+    assert entry.last_error is None
+
+
+def test_post_keys_are_saved_and_reused_on_retry(manager):
+    # 投稿のキーは最初の試行の前に送信箱へ保存され、再試行でも同じキーが使われること
+    client = manager.clients[Service.BLUESKY]
+    client.post_thread = MagicMock(return_value=ThreadResponse(results=[]))
+    outbox = manager.outboxes[Service.BLUESKY]
+    with patch("runner.outbox.get_redis_client", return_value=None):
+        entry = outbox.enqueue(["a", "b"])
+        manager._post(client, outbox, entry)
+        keys = entry.post_keys
+        manager._post(client, outbox, entry)
+        saved = outbox._load_all()[entry.key]
+
+    assert len(keys) == 2 and all(keys)
+    assert saved.post_keys == keys
+    calls = client.post_thread.call_args_list
+    assert [c.kwargs["post_keys"] for c in calls] == [keys, keys]
+
+
+@pytest.fixture
+def offline(manager):
+    # Redisや購読者への配信を行わない
+    manager._fetch_prev_train_info = MagicMock(return_value=NORMAL)
+    manager._save_latest_data = MagicMock()
+    with (
+        patch("runner.manager.EVENTS"),
+        patch("runner.outbox.get_redis_client", return_value=None),
+    ):
+        yield manager
+
+
+def test_diff_uses_snapshot_after_first_fetch(offline):
+    # 前回の状態をRedisから取得するのは初回のみで、以降は最後にpostステージへ渡した状態と比較すること
+    manager = offline
+    manager.post_stage.submit = MagicMock()
+
+    manager._diff(FetchedStatus(table_name="kanto", latest=DELAYED))
+    manager._diff(FetchedStatus(table_name="kanto", latest=RESUMED))
+
+    manager._fetch_prev_train_info.assert_called_once()
+    jobs = [c.args[1] for c in manager.post_stage.submit.call_args_list]
+    assert [(job.previous, job.latest) for job in jobs] == [
+        (NORMAL, DELAYED),
+        (DELAYED, RESUMED),
+    ]
+    assert manager._snapshot == RESUMED
+
+
+def test_coalesced_post_jobs_keep_previous(offline):
+    # 投稿を待つ間に合流したジョブは、最後に投稿した状態を前回の状態として保つこと
+    manager = offline
+    started = Event()
+    release = Event()
+    delivered = []
+
+    def deliver(job):
+        started.set()
+        release.wait(timeout=5)
+        delivered.append(job)
+
+    manager.post_stage.handler = deliver
+    manager._diff(FetchedStatus(table_name="kanto", latest=DELAYED))
+    assert started.wait(timeout=5)
+    manager._diff(FetchedStatus(table_name="kanto", latest=RESUMED))
+    manager._diff(FetchedStatus(table_name="kanto", latest=STOPPED))
+    release.set()
+    assert manager.post_stage.join(timeout=5)
+
+    assert manager.post_stage.coalesced == 1
+    assert [(job.previous, job.latest) for job in delivered] == [
+        (NORMAL, DELAYED),
+        (DELAYED, STOPPED),
+    ]
+
+
+def test_post_is_skipped_when_coalesced_back_to_previous(offline):
+    # 合流の結果、前回投稿した状態に戻った場合は投稿せず、状態のみ保存すること
+    manager = offline
+    job = PostJob(table_name="kanto", latest=DELAYED, previous=NORMAL)
+    job = job.merge(PostJob(table_name="kanto", latest=NORMAL, previous=DELAYED))
+    manager._enqueue_messages = MagicMock()
+
+    manager._deliver(job)
+
+    manager._enqueue_messages.assert_not_called()
+    manager._save_latest_data.assert_called_once_with(table_name="kanto", data=NORMAL)
+
+
+def test_due_outbox_is_retried_without_changes(offline):
+    # 運行状況に変化がなくても、配信を待つ投稿があれば再試行のジョブを投入すること
+    manager = offline
+    manager.post_stage.submit = MagicMock()
+    manager._diff(FetchedStatus(table_name="kanto", latest=NORMAL))
+    manager.post_stage.submit.assert_not_called()
+
+    manager.outboxes[Service.BLUESKY].enqueue(["message"])
+    manager._diff(FetchedStatus(table_name="kanto", latest=NORMAL))
+
+    job = manager.post_stage.submit.call_args.args[1]
+    assert job.latest == job.previous == NORMAL
@@ -0,0 +1,64 @@
+import math
+from unittest.mock import MagicMock, patch
+
+from enums import Service
+
+
+def test_init_does_not_log_in(manager):
+    # マネージャーの作成時にはログインしないこと
+    for client in manager.clients.values():
+        client.login.assert_not_called()
+
+
+def test_login_all_logs_in_every_client(manager):
+    # すべてのクライアントでログインし、完了を待機できること
+    assert manager.login_all() is True
+    assert manager.wait_login(timeout=0) is True
+    for client in manager.clients.values():
+        client.login.assert_called_once()
+
+
+def test_login_is_not_repeated_after_success(manager):
+    # ログイン済みのクライアントでは再度ログインしないこと
+    manager.login(Service.BLUESKY)
+    manager.login(Service.BLUESKY)
+    manager.clients[Service.BLUESKY].login.assert_called_once()
+
+
+def test_failed_login_backs_off(manager):
+    # ログインに失敗した場合、バックオフの間は再試行しないこと
+    client = manager.clients[Service.BLUESKY]
+    client.login.return_value = False
+
+    with patch("runner.manager.monotonic", return_value=100.0):
+        assert manager.login(Service.BLUESKY) is False
+        assert manager.login(Service.BLUESKY) is False
+    assert client.login.call_count == 1
+
+    state = manager.login_states[Service.BLUESKY]
+    assert state.next_attempt_at == 100.0 + manager.login_backoff
+
+    with patch("runner.manager.monotonic", return_value=100.0 + manager.login_backoff):
+        manager.login(Service.BLUESKY)
+    assert client.login.call_count == 2
+    assert state.next_attempt_at == 100.0 + 3 * manager.login_backoff
+
+
+def test_missing_credentials_are_not_retried(manager):
+    # 認証情報が未設定の場合、再試行しないこと
+    manager.get_auth = MagicMock(return_value=None)
+    assert manager.login(Service.MISSKEYIO) is False
+    assert manager.login_states[Service.MISSKEYIO].next_attempt_at == math.inf
+
+
+def test_drain_defers_when_not_logged_in(manager):
+    # ログインできない場合、送信箱の投稿は投稿されず保留されること
+    client = manager.clients[Service.BLUESKY]
+    client.login.return_value = False
+    client.post_thread = MagicMock()
+    outbox = manager.outboxes[Service.BLUESKY]
+    with patch("runner.outbox.get_redis_client", return_value=None):
+        outbox.enqueue(["message"])
+        manager._drain(Service.BLUESKY)
+        assert len(outbox.due()) == 1
+    client.post_thread.assert_not_called()
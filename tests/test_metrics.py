@@ -0,0 +1,61 @@
+import pytest
+
+from utils.metrics import REGISTRY, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    # ヒストグラムが累積のバケット、合計、件数として出力されること
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "help", ("region",), (1, 2))
+    histogram.labels("kanto").observe(1)
+    histogram.labels("kanto").observe(1.5)
+    histogram.labels("kanto").observe(5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{region="kanto",le="1"} 1' in lines
+    assert 'test_seconds_bucket{region="kanto",le="2"} 2' in lines
+    assert 'test_seconds_bucket{region="kanto",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{region="kanto"} 7.5' in lines
+    assert 'test_seconds_count{region="kanto"} 3' in lines
+
+
+def test_counter_and_callback():
+    # カウンタと出力時に値を取得するメトリクスが出力されること
+    registry = Registry()
+    counter = registry.counter("test_total", "help", ("service",))
+    counter.labels('a"b').inc()
+    counter.labels('a"b').inc(2)
+    registry.register_callback("test_dropped", "help", "counter", lambda: [({}, 4)])
+
+    lines = registry.render().splitlines()
+    assert 'test_total{service="a\\"b"} 3' in lines
+    assert "test_dropped 4" in lines
+
+
+def test_labels_must_match_labelnames():
+    # ラベルの数が異なる場合はエラーになること
+    registry = Registry()
+    counter = registry.counter("test_total", "help", ("service",))
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+    with pytest.raises(ValueError):
+        registry.histogram("test_total", "help")
+
+
+def test_instrumented_metrics_are_registered():
+    # 各モジュールで計測しているメトリクスが登録されていること
+    import clients.baseclient  # noqa: F401
+    import runner.manager  # noqa: F401
+
+    output = REGISTRY.render()
+    for name in (
+        "traininfo_source_fetch_seconds",
+        "traininfo_redis_seconds",
+        "traininfo_posts_total",
+        "traininfo_cycle_seconds",
+        "traininfo_dedup_lookups_total",
+        "traininfo_log_records_dropped_total",
+        "traininfo_outbox_delivered_total",
+    ):
+        assert f"# TYPE {name} " in output
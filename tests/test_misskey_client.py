@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from clients.dedup import PostDeduplicator
+from clients.misskeyio import MisskeyIOClient
+
+
+@pytest.fixture(autouse=True)
+def _clear_token_cache():
+    MisskeyIOClient._validated_tokens.clear()
+    yield
+    MisskeyIOClient._validated_tokens.clear()
+
+
+def _response(status: int, body: dict) -> MagicMock:
+    response = MagicMock()
+    response.status_code = status
+    response.headers = {}
+    response.content = b"{}"
+    response.json.return_value = body
+    return response
+
+
+def _make_client() -> MisskeyIOClient:
+    client = MisskeyIOClient()
+    client.session = MagicMock()
+    client.deduplicator = PostDeduplicator()
+    return client
+
+
+def test_login_missing_token():
+    # トークンが None の場合、ログインが失敗すること
+    client = _make_client()
+    assert client.login(None) is False
+    client.session.post.assert_not_called()
+
+
+def test_login_validates_token_once():
+    # 検証済みのトークンは再度 i エンドポイントを呼ばないこと
+    client = _make_client()
+    client.session.post.return_value = _response(200, {"id": "account-id"})
+    assert client.login("token") is True
+    assert client.login("token") is True
+    assert client.session.post.call_count == 1
+    assert client.session.post.call_args.args[0].endswith("/api/i")
+
+
+def test_login_invalid_token():
+    # 無効なトークンの場合、ログインが失敗すること
+    client = _make_client()
+    client.session.post.return_value = _response(
+        401, {"error": {"code": "AUTHENTICATION_FAILED", "message": "invalid"}}
+    )
+    assert client.login("token") is False
+
+
+def test_post_without_login_returns_failure():
+    # ログインせずに投稿しようとした場合、失敗が返ること
+    client = _make_client()
+    result = client.post("Hello")
+    assert result.success is False
+    assert result.error == "Client not logged in"
+
+
+def test_post_success_with_reply_and_timeout():
+    # 投稿に成功した場合、ノート ID が ref として返り、タイムアウトが指定されること
+    client = _make_client()
+    client.token = "token"
+    client.session.post.return_value = _response(200, {"createdNote": {"id": "note"}})
+
+    result = client.post("Hello", reply_to="parent")
+
+    assert result.success is True
+    assert result.ref == "note"
+    kwargs = client.session.post.call_args.kwargs
+    assert kwargs["json"] == {"i": "token", "text": "Hello", "replyId": "parent"}
+    assert kwargs["timeout"] == client.timeout
+
+
+@patch("clients.misskeyio.time.sleep")
+def test_post_does_not_retry_on_auth_error(mock_sleep):
+    # 認証エラーの場合、再試行しないこと
+    client = _make_client()
+    client.token = "token"
+    client.session.post.return_value = _response(
+        403, {"error": {"code": "PERMISSION_DENIED", "message": "denied"}}
+    )
+    result = client.post("Hello")
+    assert result.success is False
+    assert client.session.post.call_count == 1
+
+
+@patch("clients.misskeyio.time.sleep")
+def test_post_retries_on_server_error(mock_sleep):
+    # サーバーエラーの場合、指定回数まで再試行すること
+    client = _make_client()
+    client.token = "token"
+    client.session.post.return_value = _response(500, {})
+    result = client.post("Hello", max_retries=3)
+    assert result.success is False
+    assert client.session.post.call_count == 3
+
+
+def test_retry_after_timeout_finds_created_note():
+    # タイムアウト後の再試行では、作成済みのノートを確認して再投稿しないこと
+    client = _make_client()
+    client.token = "token"
+    client.account = "account-id"
+    note = {"id": "note-1", "text": "運行情報", "replyId": None}
+    client.session.post.side_effect = [
+        requests.ReadTimeout("timed out"),
+        _response(200, [note]),
+    ]
+
+    with patch("clients.misskeyio.time.sleep"):
+        result = client.post("運行情報")
+
+    assert result.success is True
+    assert result.ref == "note-1"
+    endpoints = [call.args[0] for call in client.session.post.call_args_list]
+    assert endpoints[0].endswith("/api/notes/create")
+    assert endpoints[1].endswith("/api/users/notes")
+    assert client.deduplicator.last_attempt(
+        client.service_name, "account-id", "運行情報", None
+    )
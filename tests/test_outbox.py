@@ -0,0 +1,96 @@
+from unittest.mock import patch
+
+import pytest
+
+from runner.outbox import Outbox
+
+
+@pytest.fixture(autouse=True)
+def _no_redis():
+    with patch("runner.outbox.get_redis_client", return_value=None):
+        yield
+
+
+def test_enqueue_is_idempotent():
+    # 同じ内容のスレッドを二度登録しても一件のみ保持されること
+    outbox = Outbox("kanto", "Bluesky")
+    first = outbox.enqueue(["a", "b"])
+    second = outbox.enqueue(["a", "b"])
+    assert first.key == second.key
+    assert len(outbox.due()) == 1
+
+
+def test_due_returns_oldest_first_with_limit():
+    # 配信対象は古い順に、上限件数まで返ること
+    outbox = Outbox("kanto", "Bluesky")
+    for i in range(3):
+        entry = outbox.enqueue([f"message {i}"])
+        entry.created_at = 1000.0 + i
+        outbox.save(entry)
+    due = outbox.due(limit=2, now=1000.0)
+    assert [e.messages for e in due] == [["message 0"], ["message 1"]]
+
+
+def test_schedule_retry_uses_exponential_backoff():
+    # 失敗するごとに再試行までの待機時間が倍になること
+    outbox = Outbox("kanto", "Bluesky", base_delay=10, max_delay=25)
+    entry = outbox.enqueue(["a"])
+
+    with patch("runner.outbox.time.time", return_value=1000.0):
+        outbox.schedule_retry(entry, "error")
+        assert entry.next_attempt_at == 1010.0
+        outbox.schedule_retry(entry, "error")
+        assert entry.next_attempt_at == 1020.0
+        outbox.schedule_retry(entry, "error")
+        assert entry.next_attempt_at == 1025.0  # max_delay で頭打ち
+
+    assert outbox.due(now=1024.0) == []
+    assert len(outbox.due(now=1025.0)) == 1
+
+
+def test_save_keeps_progress():
+    # 途中まで配信した進捗が保存されること
+    outbox = Outbox("kanto", "Bluesky")
+    entry = outbox.enqueue(["a", "b"])
+    entry.sent = 1
+    entry.reply_to = "ref-1"
+    outbox.save(entry)
+
+    loaded = outbox.due()[0]
+    assert loaded.sent == 1
+    assert loaded.reply_to == "ref-1"
+
+
+def test_complete_removes_entry_and_records_latency():
+    # 配信完了で送信箱から削除され、配信遅延が記録されること
+    outbox = Outbox("kanto", "Bluesky")
+    entry = outbox.enqueue(["a"])
+    outbox.complete(entry)
+    assert outbox.due() == []
+    assert outbox.stats.delivered == 1
+    assert outbox.stats.max_latency >= 0
+
+
+def test_expired_entries_are_dropped():
+    # 有効期限を過ぎた投稿は破棄されること
+    outbox = Outbox("kanto", "Bluesky", expire_after=60)
+    entry = outbox.enqueue(["a"])
+    assert outbox.due(now=entry.created_at + 61) == []
+    assert outbox.stats.expired == 1
+
+
+def test_due_does_not_overtake_entry_in_backoff():
+    # 古い投稿が再試行を待つ間は、新しい投稿も配信対象にならないこと
+    outbox = Outbox("kanto", "Bluesky", base_delay=60)
+    older = outbox.enqueue(["delayed"])
+    older.created_at = 1000.0
+    newer = outbox.enqueue(["resumed"])
+    newer.created_at = 1001.0
+    outbox.save(newer)
+
+    with patch("runner.outbox.time.time", return_value=1002.0):
+        outbox.schedule_retry(older, "error")
+
+    assert outbox.due(now=1010.0) == []
+    due = outbox.due(now=1062.0)
+    assert [e.messages for e in due] == [["delayed"], ["resumed"]]
@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from benchmarks.payloads import PayloadGenerator
+from enums import Region
+from traininfo.sources.nhk import NHKClient
+from traininfo.sources.yahoo import YahooClient
+
+
+def test_nhk_and_yahoo_payloads_parse_to_same_statuses():
+    # 同じ状態から生成したNHKとYahooの応答が、同じ運行情報として解析されること
+    generator = PayloadGenerator(lines=500, detail_length=60, seed=1)
+    nhk = NHKClient(MagicMock(), Region.KANTO)._parse(generator.nhk())
+    yahoo = YahooClient(MagicMock(), Region.KANTO)._parse(generator.yahoo())
+
+    assert sorted(nhk, key=lambda s: s.train) == sorted(yahoo, key=lambda s: s.train)
+    assert len(nhk) == len(generator.incidents())
+    assert all(len(s.detail) == 60 for s in nhk)
+    assert {s.status for s in nhk} >= {"🛑運転見合わせ", "🕒列車遅延", "🗒️運転計画"}
+
+
+def test_churn_changes_statuses_and_details():
+    # advanceでchurnの割合の路線の状態が、detail_churnの割合の路線の詳細文が変わること
+    generator = PayloadGenerator(
+        lines=1000, weights={"delay": 1, "suspended": 1}, churn=0.1, detail_churn=0.2
+    )
+    before = {train: (key, detail) for train, key, detail in generator.incidents()}
+    assert generator.advance() == 100
+    after = {train: (key, detail) for train, key, detail in generator.incidents()}
+
+    assert len(after) == 1000
+    assert sum(before[t][0] != after[t][0] for t in after) == 100
+    assert 100 < sum(before[t] != after[t] for t in after) <= 300
+
+
+def test_weights_must_be_status_keys():
+    # status.yamlにない状態を指定するとValueErrorになること
+    with pytest.raises(ValueError):
+        PayloadGenerator(weights={"unknown": 1})
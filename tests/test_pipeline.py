@@ -0,0 +1,84 @@
+from threading import Event
+
+from runner.pipeline import Stage
+from utils.log_context import add_timing, cycle, cycle_timings, log_context
+
+
+def test_stage_processes_items():
+    # 投入した項目がハンドラで処理されること
+    processed = []
+    stage = Stage("test", processed.append)
+    stage.submit("kanto", 1)
+    stage.submit("kansai", 2)
+    assert stage.join(timeout=5)
+    assert sorted(processed) == [1, 2]
+
+
+def test_stage_coalesces_pending_items_for_same_key():
+    # 同じキーの項目が処理待ちの場合、merge で合流されること
+    started = Event()
+    release = Event()
+    processed = []
+
+    def handler(item):
+        if item == "first":
+            started.set()
+            release.wait(timeout=5)
+        processed.append(item)
+
+    stage = Stage("test", handler, merge=lambda old, new: f"{old}+{new}")
+    stage.submit("kanto", "first")
+    assert started.wait(timeout=5)
+
+    stage.submit("kanto", "second")
+    stage.submit("kanto", "third")
+    release.set()
+
+    assert stage.join(timeout=5)
+    assert processed == ["first", "second+third"]
+    assert stage.coalesced == 1
+
+
+def test_stage_submit_times_out_when_full():
+    # キューが満杯の場合、タイムアウトで投入に失敗すること
+    release = Event()
+    stage = Stage("test", lambda item: release.wait(timeout=5), maxsize=1)
+    stage.submit("a", 1)
+    stage.submit("b", 2)
+    assert stage.submit("c", 3, timeout=0.05) is False
+    release.set()
+    assert stage.join(timeout=5)
+
+
+def test_stage_handler_exception_does_not_stop_worker():
+    # ハンドラで例外が発生しても後続の項目が処理されること
+    processed = []
+
+    def handler(item):
+        if item == "bad":
+            raise RuntimeError("boom")
+        processed.append(item)
+
+    stage = Stage("test", handler)
+    stage.submit("a", "bad")
+    assert stage.join(timeout=5)
+    stage.submit("a", "good")
+    assert stage.join(timeout=5)
+    assert processed == ["good"]
+
+
+def test_stage_runs_handler_in_submitter_context():
+    # ハンドラは投入時のコンテキストで実行され、計測時間がサイクルに記録されること
+    seen = []
+
+    def handler(item):
+        with log_context(service="bluesky"):
+            add_timing("post_ms", 5.0)
+            seen.append(item)
+
+    stage = Stage("test", handler)
+    with cycle("kanto") as cycle_id:
+        stage.submit("kanto", cycle_id)
+        assert stage.join(timeout=5)
+        assert cycle_timings() == {"timings": {"post_ms": 5.0}}
+    assert seen == [cycle_id]
@@ -0,0 +1,118 @@
+import base64
+import marshal
+import time
+from threading import Event, Thread
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from server.admin import admin_app
+from utils import profiling
+
+PASSWORD = "secret"
+
+
+def request(path: str, method: str = "GET", query: str = "", password: str = PASSWORD):
+    environ: dict = {}
+    setup_testing_defaults(environ)
+    environ.update(PATH_INFO=path, QUERY_STRING=query, REQUEST_METHOD=method)
+    if password:
+        token = base64.b64encode(f"admin:{password}".encode()).decode()
+        environ["HTTP_AUTHORIZATION"] = f"Basic {token}"
+
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+
+    body = b"".join(admin_app(environ, start_response))
+    return result["status"], body
+
+
+def busy_cycle(stop: Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture(autouse=True)
+def no_session(monkeypatch):
+    monkeypatch.setenv("LOG_PASSWORD", PASSWORD)
+    yield
+    session = profiling.current_session()
+    if session is not None:
+        session.finish()
+
+
+def test_cprofile_session_records_other_threads():
+    # cProfileの計測が指定したサイクル数で終わり、他のスレッドの呼び出しも記録すること
+    session = profiling.start_session("cprofile", cycles=2)
+    assert profiling.active_session() is session
+    stop = Event()
+    worker = Thread(target=busy_cycle, args=(stop,))
+    worker.start()
+    time.sleep(0.05)
+    stop.set()
+    worker.join()
+
+    session.cycle_finished()
+    assert not session.done.is_set()
+    session.cycle_finished()
+    assert session.done.is_set()
+    assert profiling.active_session() is None
+
+    assert "busy_cycle" in session.report()
+    stats = marshal.loads(session.dump())
+    assert any(func[2] == "busy_cycle" for func in stats)
+
+
+def test_sampling_session_outputs_collapsed_stacks():
+    # 採取したスタックをcollapsed stacks形式で出力すること
+    stop = Event()
+    worker = Thread(target=busy_cycle, args=(stop,), name="busy")
+    worker.start()
+    session = profiling.start_session("sampling", interval=0.001)
+    with pytest.raises(RuntimeError):
+        profiling.start_session("sampling")
+    time.sleep(0.05)
+    session.cycle_finished()
+    stop.set()
+    worker.join()
+
+    lines = session.collapsed().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any(line.startswith("busy;") and "busy_cycle" in line for line in lines)
+
+
+def test_admin_endpoints_require_auth(monkeypatch):
+    # 認証が必要で、LOG_PASSWORDが未設定の場合は使えないこと
+    assert request("/threads", password="")[0] == 401
+    assert request("/threads", password="wrong")[0] == 401
+    status, body = request("/threads")
+    assert status == 200
+    assert b'Thread "MainThread"' in body
+
+    monkeypatch.delenv("LOG_PASSWORD")
+    assert request("/threads")[0] == 403
+    assert request("/profile", "POST")[0] == 403
+
+
+def test_profile_and_tracemalloc_endpoints():
+    # 計測の開始から結果の取得、メモリ使用量の差分の取得ができること
+    assert request("/profile", "POST", "mode=unknown")[0] == 400
+    assert request("/profile", "POST", "mode=sampling&interval=0.001")[0] == 202
+    assert request("/profile", "POST")[0] == 409
+    assert request("/profile")[0] == 202
+    assert request("/profile", "DELETE")[0] == 200
+    assert request("/profile", query="format=collapsed")[0] == 200
+
+    assert request("/tracemalloc")[0] == 409
+    assert request("/tracemalloc", "POST")[0] == 201
+    try:
+        retained = [bytearray(1024) for _ in range(100)]
+        status, body = request("/tracemalloc", query="limit=5")
+        assert status == 200
+        assert body.startswith(b"Current:")
+        assert retained
+    finally:
+        assert request("/tracemalloc", "DELETE")[0] == 200
@@ -0,0 +1,62 @@
+import time
+from unittest.mock import patch
+
+from clients.baseclient import RateLimiter, get_rate_limiter
+
+
+def test_acquire_within_burst_does_not_wait():
+    # バケットの容量内であれば待機せずに取得できること
+    limiter = RateLimiter(rate=1, burst=3, max_in_flight=3)
+    with patch("clients.baseclient.time.sleep") as mock_sleep:
+        for _ in range(3):
+            with limiter.acquire():
+                pass
+    mock_sleep.assert_not_called()
+    assert limiter.waits == 0
+
+
+def test_acquire_waits_when_bucket_empty():
+    # バケットが空の場合、トークンが補充されるまで待機すること
+    limiter = RateLimiter(rate=100, burst=1, max_in_flight=1)
+    with limiter.acquire():
+        pass
+    start = time.monotonic()
+    with limiter.acquire():
+        pass
+    assert time.monotonic() - start >= 0.005
+    assert limiter.waits == 1
+    assert limiter.max_wait > 0
+
+
+def test_retry_after_blocks_acquire():
+    # Retry-After ヘッダを受け取った場合、その秒数だけ待機すること
+    limiter = RateLimiter(rate=100, burst=10, max_in_flight=1)
+    limiter.update_from_headers({"Retry-After": "5"})
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        limiter._blocked_until = 0.0
+
+    with patch("clients.baseclient.time.sleep", side_effect=fake_sleep):
+        with limiter.acquire():
+            pass
+    assert 4 < sleeps[0] <= 5
+
+
+def test_remaining_zero_blocks_until_reset():
+    # 残り回数が0の場合、リセット時刻まで払い出しが止まること
+    limiter = RateLimiter(rate=100, burst=10, max_in_flight=1)
+    reset = str(int(time.time()) + 30)
+    limiter.update_from_headers({"RateLimit-Remaining": "0", "RateLimit-Reset": reset})
+    assert limiter._blocked_until - time.monotonic() > 25
+    assert limiter._tokens == 0
+
+
+def test_get_rate_limiter_is_shared_per_account():
+    # 同じサービス・アカウントには同じインスタンスが返ること
+    a = get_rate_limiter("Test", "account-a", 1, 1, 1)
+    b = get_rate_limiter("Test", "account-a", 1, 1, 1)
+    c = get_rate_limiter("Test", "account-b", 1, 1, 1)
+    assert a is b
+    assert a is not c
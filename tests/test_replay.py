@@ -0,0 +1,57 @@
+import gzip
+import json
+from unittest.mock import MagicMock
+
+import requests
+
+from enums import Region
+from traininfo.sources.capture import CaptureWriter, read_capture
+from traininfo.sources.nhk import NHKClient
+from traininfo.sources.replay import ReplayClient, find_captures
+
+
+def _nhk_payload(status_code: str, status: str) -> dict:
+    item = {
+        "trainLine": "山手線",
+        "detailStatusCode": status_code,
+        "detailStatusName": status,
+        "textLong": "",
+    }
+    return {"channel": {"item": [item], "itemLong": []}}
+
+
+def _response(status: int, body: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body, ensure_ascii=False).encode()
+    response.encoding = "utf-8"
+    return response
+
+
+def test_fetch_is_captured_and_replayed(tmp_path):
+    # 取得した応答が記録され、ReplayClientで同じ解析結果として再生されること
+    session = MagicMock()
+    client = NHKClient(session=session, region=Region.KANTO)
+    client.capture = CaptureWriter(tmp_path, "NHKClient", "kanto")
+    for code, status in (("03", "ダイヤ乱れ"), ("01", "運転見合わせ")):
+        session.get.return_value = _response(200, _nhk_payload(code, status))
+        assert client.request().is_success
+
+    replay = ReplayClient(MagicMock(), Region.KANTO, find_captures(tmp_path))
+    statuses = [replay.request().data[0].status for _ in range(2)]
+    assert statuses == ["🕒ダイヤ乱れ", "🛑運転見合わせ"]
+    assert replay.exhausted
+    assert not replay.request().is_success
+
+
+def test_truncated_capture_is_readable(tmp_path):
+    # 書き込み中に途切れた末尾を除き、それまでの記録を読み出せること
+    writer = CaptureWriter(tmp_path, "NHKClient", "kanto")
+    writer.write(_response(200, _nhk_payload("00", "平常運転")))
+    writer.write(_response(503, {}))
+    path = find_captures(tmp_path)[0]
+    with open(path, "ab") as f:
+        f.write(gzip.compress(b'{"t": 0}\n')[:10])
+
+    records = list(read_capture([path]))
+    assert [r.status for r in records] == [200, 503]
@@ -0,0 +1,91 @@
+import json
+from unittest.mock import patch
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+from bottle import Bottle, response
+
+from runner.health import HealthRegistry
+from server import run
+from server.run import app
+from server.wsgi import EmbeddedServer
+
+WORKER_PORTS = {"worker-0": 8081, "worker-1": 8082}
+
+
+def request(path: str):
+    environ: dict = {}
+    setup_testing_defaults(environ)
+    environ.update(PATH_INFO=path, REQUEST_METHOD="GET")
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+
+    body = b"".join(app(environ, start_response))
+    return result["status"], body
+
+
+@pytest.fixture
+def supervisor():
+    with patch.dict(run._worker_ports, WORKER_PORTS):
+        yield
+
+
+@pytest.fixture
+def supervisor_health():
+    # 監視プロセス自身は地域を持たない
+    with patch.object(run, "HEALTH", HealthRegistry()):
+        yield
+
+
+def test_supervisor_lists_worker_ports_for_region_endpoints(supervisor):
+    # 監視プロセスでは、地域の状態を持つエンドポイントは各ワーカーのポートを案内すること
+    for path in ("/status/kanto", "/events/", "/metrics", "/admin/threads"):
+        code, body = request(path)
+        assert code == 503
+        assert json.loads(body)["workers"] == WORKER_PORTS
+    assert request("/")[0] == 200
+
+
+def test_worker_serves_region_endpoints():
+    # ワーカーや単一プロセスでは、エンドポイントをそのまま提供すること
+    assert request("/metrics")[0] == 200
+    assert request("/status/kanto")[0] == 404
+
+
+def _worker_server(ready: bool) -> EmbeddedServer:
+    worker = Bottle()
+
+    @worker.route("/readyz")
+    def readyz():
+        response.status = 200 if ready else 503
+        return {"status": "ok" if ready else "not ready"}
+
+    server = EmbeddedServer(worker, host="127.0.0.1", port=0, backend="threaded")
+    server.start()
+    return server
+
+
+def test_supervisor_combines_worker_health(supervisor_health):
+    # 監視プロセスのヘルスチェックは、いずれかのワーカーが異常または応答しない場合に503を返すこと
+    servers = [_worker_server(True), _worker_server(False)]
+    try:
+        ports = {"worker-0": servers[0].port, "worker-1": servers[1].port}
+        with patch.dict(run._worker_ports, ports):
+            code, body = request("/readyz")
+        assert code == 503
+        workers = json.loads(body)["workers"]
+        assert workers["worker-0"]["ok"]
+        assert workers["worker-1"] == {"ok": False, "status": "not ready"}
+
+        with patch.dict(run._worker_ports, {"worker-0": servers[0].port}):
+            assert request("/readyz")[0] == 200
+    finally:
+        for server in servers:
+            server.stop(timeout=5)
+
+    with patch.dict(run._worker_ports, ports):
+        code, body = request("/readyz")
+    assert code == 503
+    assert json.loads(body)["workers"]["worker-0"]["status"] == "unreachable"
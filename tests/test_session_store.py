@@ -0,0 +1,47 @@
+from unittest.mock import patch
+
+import pytest
+
+from clients.session_store import SessionStore
+
+
+@pytest.fixture(autouse=True)
+def _no_redis(tmp_path):
+    with (
+        patch("clients.session_store.get_redis_client", return_value=None),
+        patch("clients.session_store.SESSION_DIR", str(tmp_path)),
+    ):
+        yield
+
+
+def test_save_and_load(tmp_path):
+    # 保存したセッションが読み込めること、ファイルは平文で保存されないこと
+    store = SessionStore("Bluesky", secret="secret")
+    store.save("user", {"refreshJwt": "token-value"})
+
+    assert store.load("user") == {"refreshJwt": "token-value"}
+    for path in tmp_path.iterdir():
+        assert "token-value" not in path.read_text()
+
+
+def test_load_with_wrong_secret_returns_none():
+    # 異なる鍵では復号できず、None が返ること
+    SessionStore("Bluesky", secret="secret").save("user", {"refreshJwt": "x"})
+    assert SessionStore("Bluesky", secret="other").load("user") is None
+
+
+def test_disabled_without_secret():
+    # 鍵が未設定の場合、永続化が無効になること
+    with patch.dict("os.environ", {"SESSION_ENCRYPTION_KEY": ""}):
+        store = SessionStore("Bluesky")
+    assert store.enabled is False
+    store.save("user", {"refreshJwt": "x"})
+    assert store.load("user") is None
+
+
+def test_delete():
+    # 削除したセッションは読み込めないこと
+    store = SessionStore("Bluesky", secret="secret")
+    store.save("user", {"refreshJwt": "x"})
+    store.delete("user")
+    assert store.load("user") is None
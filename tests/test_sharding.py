@@ -0,0 +1,64 @@
+import time
+from unittest.mock import MagicMock, patch
+
+from enums import Region
+from runner.sharding import ShardCoordinator, assign_regions
+
+
+def test_assign_regions_covers_all_regions():
+    # すべての地域がいずれかのワーカーに割り当てられること
+    workers = ("worker-a", "worker-b", "worker-c")
+    assignment = assign_regions(tuple(Region), workers)
+    assert set(assignment) == set(Region)
+    assert set(assignment.values()) <= set(workers)
+
+
+def test_assign_regions_is_deterministic():
+    # ワーカーの並び順に関係なく同じ割り当てになること
+    a = assign_regions(tuple(Region), ("worker-a", "worker-b"))
+    b = assign_regions(tuple(Region), ("worker-b", "worker-a"))
+    assert a == b
+
+
+def test_assign_regions_minimal_movement_on_leave():
+    # ワーカーが離脱した場合、そのワーカー以外の担当地域は移動しないこと
+    before = assign_regions(tuple(Region), ("worker-a", "worker-b", "worker-c"))
+    after = assign_regions(tuple(Region), ("worker-a", "worker-b"))
+    for region, worker in before.items():
+        if worker != "worker-c":
+            assert after[region] == worker
+
+
+def test_assign_regions_no_workers():
+    # ワーカーが存在しない場合、空の割り当てが返ること
+    assert assign_regions(tuple(Region), ()) == {}
+
+
+@patch("runner.sharding.get_redis_client")
+def test_rebalance_without_redis_uses_peers(mock_get_redis_client):
+    # Redis が利用不可の場合、peers で与えられたワーカー集合で割り当てること
+    mock_get_redis_client.return_value = None
+    peers = ("worker-a", "worker-b")
+    owned = {
+        region
+        for worker in peers
+        for region in ShardCoordinator(worker, peers=peers).rebalance()
+    }
+    assert owned == set(Region)
+
+
+@patch("runner.sharding.get_redis_client")
+def test_rebalance_ignores_stale_workers(mock_get_redis_client):
+    # ハートビートが途絶えたワーカーは割り当て対象から除外されること
+    mock_redis = MagicMock()
+    mock_get_redis_client.return_value = mock_redis
+    mock_redis.hgetall.return_value = {
+        "worker-a": str(time.time()),
+        "worker-stale": str(time.time() - 3600),
+    }
+
+    coordinator = ShardCoordinator("worker-a", ttl=30)
+    owned = coordinator.rebalance()
+
+    assert set(owned) == set(Region)
+    mock_redis.hdel.assert_called_with("traininfo:shard:workers", "worker-stale")
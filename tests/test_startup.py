@@ -0,0 +1,37 @@
+import os
+
+from utils.startup_profile import parse_importtime, profile_imports, total_import_us
+
+# 起動時の読み込み時間の上限（ミリ秒）
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "600"))
+
+# 実際に使うまで読み込まないモジュール
+LAZY_MODULES = {"redis", "rich", "yaml", "bottle", "asyncio", "multiprocessing"}
+
+
+def test_parse_importtime():
+    # -X importtime の出力からモジュール名と読み込み時間が取得できること
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     enums\n"
+        "import time:       300 |        420 | main\n"
+    )
+    records = parse_importtime(output)
+    assert [(r.module, r.self_us, r.cumulative_us, r.depth) for r in records] == [
+        ("enums", 120, 120, 2),
+        ("main", 300, 420, 0),
+    ]
+    assert total_import_us(records) == 420
+
+
+def test_main_import_does_not_load_heavy_modules():
+    # main の読み込み時に、使うまで不要なモジュールが読み込まれないこと
+    loaded = {r.module for r in profile_imports("main")}
+    assert not LAZY_MODULES & loaded
+
+
+def test_main_import_time_within_budget():
+    # main の読み込み時間が上限を超えないこと
+    # 計測のばらつきを抑えるため、3回のうち最小値で判定する
+    best = min(total_import_us(profile_imports("main")) for _ in range(3))
+    assert best / 1000 < STARTUP_IMPORT_BUDGET_MS
@@ -0,0 +1,73 @@
+import json
+from unittest.mock import patch
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from runner.status_cache import StatusCache
+from server import status
+from server.status import status_app
+from traininfo.trainstatus import TrainStatus
+
+STATUSES = (
+    TrainStatus("山手線", "🕒列車遅延", "遅れが出ています。"),
+    TrainStatus("中央線", "🛑運転見合わせ", "運転を見合わせています。"),
+)
+
+
+def request(path: str, headers: dict[str, str] | None = None):
+    environ: dict = {}
+    setup_testing_defaults(environ)
+    # WSGIではパスをlatin-1の文字列として渡す
+    environ.update(PATH_INFO=path.encode().decode("latin1"), REQUEST_METHOD="GET")
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+        result["headers"] = dict(response_headers)
+
+    body = b"".join(status_app(environ, start_response))
+    return result["status"], result["headers"], body
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    cache = StatusCache()
+    with patch.object(status, "STATUS_CACHE", cache):
+        yield cache
+
+
+def test_region_status_is_sorted_and_revalidated(cache):
+    # 地域の運行状況を優先度順に返し、ETagが一致すれば304を返すこと
+    cache.publish("kanto", STATUSES)
+    code, headers, body = request("/kanto")
+    assert code == 200
+    assert headers["Cache-Control"].startswith("public, max-age=")
+    payload = json.loads(body)
+    assert [line["train"] for line in payload["lines"]] == ["中央線", "山手線"]
+
+    code, _, body = request("/kanto", {"If-None-Match": headers["Etag"]})
+    assert code == 304
+    assert body == b""
+
+
+def test_etag_changes_only_when_status_changes(cache):
+    # 運行状況が変化しない限り、同じ応答とETagを返し続けること
+    first = cache.publish("kanto", STATUSES)
+    assert cache.publish("kanto", STATUSES[::-1]) is first
+    changed = cache.publish("kanto", STATUSES[:1])
+    assert changed.region_response.etag != first.region_response.etag
+
+
+def test_line_status(cache):
+    # 路線ごとの運行状況を返し、一覧にない路線や地域は404を返すこと
+    cache.publish("kanto", STATUSES)
+    code, _, body = request("/kanto/山手線")
+    assert code == 200
+    assert json.loads(body)["status"] == "🕒列車遅延"
+
+    assert request("/kanto/京浜東北線")[0] == 404
+    assert request("/kansai")[0] == 404
@@ -0,0 +1,78 @@
+import http.client
+import time
+
+import pytest
+from bottle import Bottle
+
+from server.loadtest import run_load_test
+from server.wsgi import EmbeddedServer
+
+app = Bottle()
+
+
+@app.route("/ping")
+def ping():
+    return "pong"
+
+
+@app.route("/slow")
+def slow():
+    time.sleep(0.2)
+    return "done"
+
+
+@pytest.fixture
+def server():
+    server = EmbeddedServer(
+        app, host="127.0.0.1", port=0, backend="threaded", threads=8
+    )
+    server.start()
+    yield server
+    server.stop(timeout=5)
+
+
+def test_slow_requests_are_served_concurrently(server):
+    # 遅いリクエストが並行して処理されること
+    result = run_load_test(
+        f"http://127.0.0.1:{server.port}/slow", requests=16, concurrency=8
+    )
+    assert result.errors == 0
+    # 逐次処理なら3.2秒かかる
+    assert result.elapsed < 1.5
+
+
+def test_keepalive_reuses_connection(server):
+    # 1つの接続で複数のリクエストを処理できること
+    conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    for _ in range(3):
+        conn.request("GET", "/ping")
+        response = conn.getresponse()
+        assert response.read() == b"pong"
+        assert not response.will_close
+    conn.close()
+
+
+def test_load_test_reports_throughput(server):
+    # 負荷試験で並行リクエストのスループットを計測できること
+    result = run_load_test(
+        f"http://127.0.0.1:{server.port}/ping", requests=200, concurrency=8
+    )
+    assert result.errors == 0
+    assert len(result.latencies) == 200
+    assert result.throughput > 0
+    assert "req/s" in result.summary()
+
+
+def test_stop_waits_for_active_request(server):
+    # 停止時に処理中のリクエストの完了を待つこと
+    conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    conn.request("GET", "/slow")
+    time.sleep(0.05)
+    server.stop(timeout=5)
+    assert conn.getresponse().read() == b"done"
+
+
+def test_unknown_backend_is_rejected():
+    # 未知のサーバー実装は指定できないこと
+    with pytest.raises(ValueError):
+        EmbeddedServer(app, port=0, backend="gunicorn")
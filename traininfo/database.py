@@ -2,18 +2,28 @@ import json
 import os
 from dataclasses import asdict
 from functools import lru_cache
-
-from redis import Redis
+from typing import TYPE_CHECKING
 
 from utils.make_logger import make_logger
+from utils.metrics import REGISTRY
 
 from .trainstatus import TrainStatus
 
+if TYPE_CHECKING:
+    from redis import Redis
+
 logger = make_logger(__name__)
 
+REDIS_SECONDS = REGISTRY.histogram(
+    "traininfo_redis_seconds", "Latency of Redis operations", ("operation",)
+)
+REDIS_ERRORS = REGISTRY.counter(
+    "traininfo_redis_errors_total", "Failed Redis operations", ("operation",)
+)
+
 
 @lru_cache(maxsize=1)
-def _create_redis_client() -> Redis | None:
+def _create_redis_client() -> "Redis | None":
     REDIS_HOST = os.getenv("UPSTASH_HOST")
     REDIS_PORT = os.getenv("UPSTASH_PORT")
     REDIS_PASS = os.getenv("UPSTASH_PASS")
@@ -21,16 +31,20 @@ def _create_redis_client() -> Redis | None:
     if not REDIS_HOST or not REDIS_PORT or not REDIS_PASS:
         return None
 
+    # 起動時間を抑えるため、Redisを使う時点で読み込む
+    from redis import Redis
+
     return Redis(
         host=REDIS_HOST,
         port=int(REDIS_PORT),
         password=REDIS_PASS,
-        ssl=True,
+        # ローカルのRedisやベンチマーク用のスタンドインではTLSを使わない
+        ssl=os.getenv("UPSTASH_SSL", "True").lower() != "false",
         decode_responses=True,
     )
 
 
-def get_redis_client() -> Redis | None:
+def get_redis_client() -> "Redis | None":
     """
     Redisクライアントを作成。一度作成したらキャッシュする。
     Noneの場合はキャッシュクリア。
@@ -64,9 +78,11 @@ def set_latest_status(region_db: str, data: list[TrainStatus]) -> None:
 
     try:
         set_data = [asdict(s) for s in data]
-        r.set(region_db, json.dumps(set_data))
+        with REDIS_SECONDS.labels("set").time():
+            r.set(region_db, json.dumps(set_data))
         logger.info(f"Saved {len(data)} train status records to Redis ({region_db})")
     except Exception:
+        REDIS_ERRORS.labels("set").inc()
         logger.error("An error occurred while sending data to Redis", exc_info=True)
 
 
@@ -90,12 +106,14 @@ def get_previous_status(region_db: str) -> tuple[TrainStatus, ...]:
         return tuple()
 
     try:
-        data = r.get(region_db)  # type: ignore[misc]
+        with REDIS_SECONDS.labels("get").time():
+            data = r.get(region_db)  # type: ignore[misc]
         if data is None:
             return tuple()
 
         loaded_data = json.loads(data)  # type: ignore[arg-type]
         return tuple(TrainStatus(**d) for d in loaded_data)
     except Exception:
+        REDIS_ERRORS.labels("get").inc()
         logger.error("An error occurred while fetching data from Redis", exc_info=True)
         return tuple()
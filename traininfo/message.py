@@ -1,22 +1,22 @@
-from pathlib import Path
-from typing import Final
-
-import yaml
+from dataclasses import dataclass, field
+from functools import lru_cache
 
 from utils.make_logger import make_logger
 
 from .normalizer import status_normalizer
+from .statuses import load_statuses
 from .trainstatus import TrainStatus
 
 logger = make_logger("message")
 
 DEFAULT_MESSAGE = "現在、ほぼ平常通り運転しています。"
-with open(Path(__file__).parent / "status.yaml", "r") as f:
-    data = yaml.safe_load(f) or {}
-    statuses = data.get("statuses", {})
-    ORDER_PRIORITY: Final[dict[str, int]] = {
+
+
+@lru_cache(maxsize=1)
+def _order_priority() -> dict[str, int]:
+    return {
         status_normalizer(item["label"]): item.get("priority", 999)
-        for item in statuses.values()
+        for item in load_statuses().values()
         if item.get("label")
     }
 
@@ -35,7 +35,79 @@ def sort_status(trains: tuple[TrainStatus, ...]) -> tuple[TrainStatus, ...]:
     tuple[TrainStatus, ...]
         ソートされた運行状況のタプル。
     """
-    return tuple(sorted(trains, key=lambda t: ORDER_PRIORITY.get(t.status, 999)))
+    order_priority = _order_priority()
+    return tuple(sorted(trains, key=lambda t: order_priority.get(t.status, 999)))
+
+
+@dataclass(frozen=True)
+class StatusDiff:
+    """
+    前回と最新の運行状況の差分。各リストは優先度順に並ぶ
+
+    Attributes
+    ----------
+    changed : list[tuple[TrainStatus, TrainStatus]]
+        状態が変化した路線の（最新, 前回）の組
+    new : list[TrainStatus]
+        新たに一覧に加わった路線
+    resolved : list[TrainStatus]
+        一覧から外れ、平常運転に戻った路線（前回の状態）
+    unchanged : list[TrainStatus]
+        平常運転以外の状態が続いている路線
+    """
+
+    changed: list[tuple[TrainStatus, TrainStatus]] = field(default_factory=list)
+    new: list[TrainStatus] = field(default_factory=list)
+    resolved: list[TrainStatus] = field(default_factory=list)
+    unchanged: list[TrainStatus] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed or self.new or self.resolved)
+
+
+def diff_status(
+    latest: tuple[TrainStatus, ...], previous: tuple[TrainStatus, ...]
+) -> StatusDiff:
+    """
+    前回と最新の運行状況を比較し、変化した路線を分類する。
+
+    Parameters
+    ----------
+    latest : tuple[TrainStatus, ...]
+        最新の運行状況のタプル。
+    previous : tuple[TrainStatus, ...]
+        前回の運行状況のタプル。
+
+    Returns
+    -------
+    StatusDiff
+        運行状況の差分。
+    """
+    latest = sort_status(latest)
+    previous = sort_status(previous)
+
+    previous_dict = {p.train: p for p in previous}
+    latest_trains = {ts.train for ts in latest}
+    return StatusDiff(
+        changed=[
+            (ts, p)
+            for ts in latest
+            if (p := previous_dict.get(ts.train)) and ts.status != p.status
+        ],
+        new=[ts for ts in latest if ts.train not in previous_dict],
+        resolved=[
+            ts
+            for ts in previous
+            if ts.train not in latest_trains and ts.status != "🚋平常運転"
+        ],
+        unchanged=[
+            ts
+            for ts in latest
+            if (p := previous_dict.get(ts.train))
+            and ts.status == p.status != "🚋平常運転"
+        ],
+    )
 
 
 def create_message(
@@ -60,43 +132,40 @@ def create_message(
     list[str]
         作成されたメッセージのリスト。
     """
-    latest = sort_status(latest)
-    previous = sort_status(previous)
+    return render_messages(diff_status(latest, previous), width=width)
 
-    previous_dict = {p.train: p for p in previous}
-    incident_to_another = [
-        ts
-        for ts in latest
-        if (p := previous_dict.get(ts.train)) and ts.status != p.status
-    ]
-    new_incidents = [ts for ts in latest if ts.train not in previous_dict]
-    resolved_incidents = [
-        ts
-        for ts in previous
-        if ts.train not in {ts.train for ts in latest} and ts.status != "🚋平常運転"
-    ]
-    unchanged_incidents = [
-        ts
-        for ts in latest
-        if (p := previous_dict.get(ts.train)) and ts.status == p.status != "🚋平常運転"
-    ]
-
-    if not new_incidents and not incident_to_another and not resolved_incidents:
+
+def render_messages(diff: StatusDiff, width: int = 300) -> list[str]:
+    """
+    差分からメッセージを作成する。
+
+    Parameters
+    ----------
+    diff : StatusDiff
+        diff_statusで作成した差分。
+    width : int, optional
+        メッセージの最大幅。デフォルトは300。
+
+    Returns
+    -------
+    list[str]
+        作成されたメッセージのリスト。
+    """
+    if not diff.has_changes:
         return ["運行状況に変更はありません。"]
 
     messages = []
 
-    for r in incident_to_another:
-        prev = previous_dict[r.train]
+    for r, prev in diff.changed:
         messages.append(f"{r.train} : {prev.status}➡️{r.status}\n{r.detail}")
 
-    for r in new_incidents:
+    for r in diff.new:
         messages.append(f"{r.train} : 🚋平常運転➡️{r.status}\n{r.detail}")
 
-    for r in resolved_incidents:
+    for r in diff.resolved:
         messages.append(f"{r.train} : {r.status}➡️🚋平常運転\n{DEFAULT_MESSAGE}")
 
-    for r in unchanged_incidents:
+    for r in diff.unchanged:
         messages.append(f"{r.train} : {r.status}\n{r.detail}")
 
     if not messages:
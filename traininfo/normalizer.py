@@ -1,16 +1,6 @@
-from pathlib import Path
-from typing import Final
+from functools import lru_cache
 
-import yaml
-
-with open(Path(__file__).parent / "status.yaml", "r") as f:
-    data = yaml.safe_load(f) or {}
-    statuses = data.get("statuses", {})
-    STATUS_EMOJI: Final[dict[str, str]] = {
-        item["label"]: item.get("emoji", "")
-        for item in statuses.values()
-        if item.get("label")
-    }
+from .statuses import nhk_code_to_label, status_emoji
 
 
 def _nhk_status_converter(code: str) -> str:
@@ -27,10 +17,7 @@ def _nhk_status_converter(code: str) -> str:
     str
         運行状況。
     """
-    nhk_to_label = {
-        code: v["label"] for v in statuses.values() for code in v.get("NHK_code", [])
-    }
-    return nhk_to_label.get(code, "その他")
+    return nhk_code_to_label().get(code, "その他")
 
 
 def add_emoji_prefix(status: str) -> str:
@@ -48,12 +35,14 @@ def add_emoji_prefix(status: str) -> str:
     str
         絵文字を付与した運行状況。
     """
-    for key in STATUS_EMOJI.keys():
+    for key, emoji in status_emoji().items():
         if key in status:
-            return STATUS_EMOJI[key] + key
+            return emoji + key
     return "⚠️その他"
 
 
+# 情報源の運行状況の種類は少ないため、路線ごとに同じ変換を繰り返さないようにする
+@lru_cache(maxsize=256)
 def status_normalizer(status: str | None = None, NHK_code: str | None = None) -> str:
     """
     運行状況を正規化する。
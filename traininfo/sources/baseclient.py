@@ -7,9 +7,29 @@ from typing import Any
 import requests
 
 from enums import Region
+from utils.log_context import timed
 from utils.make_logger import make_logger
+from utils.metrics import REGISTRY
 
 from ..trainstatus import TrainStatus
+from .capture import get_capture_writer
+from .decoder import JSONDecoder
+
+SOURCE_FETCH_SECONDS = REGISTRY.histogram(
+    "traininfo_source_fetch_seconds",
+    "Latency of a single fetch from a train info source",
+    ("source", "region"),
+)
+SOURCE_REQUESTS = REGISTRY.counter(
+    "traininfo_source_requests_total",
+    "Requests to train info sources by result",
+    ("source", "region", "result"),
+)
+SOURCE_RETRIES = REGISTRY.counter(
+    "traininfo_source_retries_total",
+    "Retries of requests to train info sources",
+    ("source", "region"),
+)
 
 
 @dataclass
@@ -22,6 +42,8 @@ class TrainInfoResponse:
 class BaseTrainInfoClient(ABC):
     ROOT: str | None = None
     TRAININFO_ENDPOINT: str | None = None
+    # msgspecでデコードするときに使うTypedDict
+    SCHEMA: type | None = None
 
     def __init__(
         self,
@@ -37,6 +59,8 @@ class BaseTrainInfoClient(ABC):
         self.timeout = timeout
         self.retry_sleep = retry_sleep
         self.retry_times = retry_times
+        self.capture = get_capture_writer(type(self).__name__, region.label)
+        self.decoder = JSONDecoder(self.SCHEMA)
 
     @abstractmethod
     def _fetch(self) -> Any:
@@ -67,6 +91,35 @@ class BaseTrainInfoClient(ABC):
         """
         pass
 
+    def _capture(self, response: requests.Response) -> None:
+        """
+        SOURCE_CAPTURE_DIRが設定されている場合、応答を記録する。
+        _fetchで応答を受け取った直後、raise_for_statusの前に呼ぶ。
+
+        Parameters
+        ----------
+        response : requests.Response
+            情報源の応答
+        """
+        if self.capture is not None:
+            self.capture.write(response)
+
+    def _decode(self, content: bytes) -> Any:
+        """
+        応答の本文をデコードする。r.json()と異なり、文字列に変換せずにバイト列から読む。
+
+        Parameters
+        ----------
+        content : bytes
+            応答の本文
+
+        Returns
+        -------
+        Any
+            デコードした生データ
+        """
+        return self.decoder.decode(content)
+
     def request(self) -> TrainInfoResponse:
         """
         データを取得する。エラーハンドリングを行い、TrainInfoResponseを返す。
@@ -77,14 +130,15 @@ class BaseTrainInfoClient(ABC):
         TrainInfoResponse
             取得結果
         """
+        labels = (type(self).__name__, self.region.label)
         for i in range(self.retry_times):
             try:
-                raw = self._fetch()
-                return TrainInfoResponse(
-                    is_success=True,
-                    data=self._parse(raw),
-                    error=None,
-                )
+                with timed("fetch_ms"), SOURCE_FETCH_SECONDS.labels(*labels).time():
+                    raw = self._fetch()
+                with timed("parse_ms"):
+                    data = self._parse(raw)
+                SOURCE_REQUESTS.labels(*labels, "success").inc()
+                return TrainInfoResponse(is_success=True, data=data, error=None)
             except JSONDecodeError as e:
                 self.logger.error(f"JSON decode error. no retry: {e}")
                 break
@@ -106,6 +160,7 @@ class BaseTrainInfoClient(ABC):
 
                 if delay:
                     self.logger.info(f"Retrying... ({i + 1}/{self.retry_times})")
+                    SOURCE_RETRIES.labels(*labels).inc()
                     time.sleep(delay)
                     continue
             except Exception as e:
@@ -113,9 +168,11 @@ class BaseTrainInfoClient(ABC):
 
             if i < self.retry_times - 1:
                 self.logger.info(f"Retrying... ({i + 1}/{self.retry_times})")
+                SOURCE_RETRIES.labels(*labels).inc()
                 time.sleep(self.retry_sleep)
                 continue
 
+        SOURCE_REQUESTS.labels(*labels, "failure").inc()
         return TrainInfoResponse(
             is_success=False,
             data=None,
@@ -0,0 +1,174 @@
+import gzip
+import heapq
+import json
+import os
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+
+import requests
+
+from utils.make_logger import make_logger
+
+logger = make_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CapturedResponse:
+    """
+    記録した情報源の応答
+
+    Attributes
+    ----------
+    timestamp : float
+        応答を受け取った時刻（UNIX時間）
+    source : str
+        情報源のクラス名
+    region : str
+        地域
+    status : int
+        ステータスコード
+    body : str
+        応答の本文
+    """
+
+    timestamp: float
+    source: str
+    region: str
+    status: int
+    body: str
+
+    def to_response(self) -> requests.Response:
+        """
+        記録した応答をrequests.Responseに戻す。raise_for_statusやjsonは通信時と同じように動く。
+        """
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = self.body.encode()
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "application/json; charset=utf-8"
+        return response
+
+
+class CaptureWriter:
+    """
+    情報源の応答をgzip圧縮したJSON Linesのファイルに追記する
+
+    ファイルは情報源と地域、日付（UTC）ごとに分ける。1件ごとに独立したgzipのメンバーとして
+    追記するため、書き込み中にプロセスが終了しても、それまでの記録は読み出せる。
+    URLやヘッダーは記録しないため、Yahoo APIのアプリケーションIDは含まれない。
+
+    Attributes
+    ----------
+    directory : Path
+        記録を保存するディレクトリ
+    source : str
+        情報源のクラス名
+    region : str
+        地域
+    """
+
+    def __init__(self, directory: str | Path, source: str, region: str) -> None:
+        self.directory = Path(directory)
+        self.source = source
+        self.region = region
+        self._lock = Lock()
+
+    def path(self, timestamp: float) -> Path:
+        date = time.strftime("%Y%m%d", time.gmtime(timestamp))
+        return self.directory / f"{self.source}-{self.region}-{date}.jsonl.gz"
+
+    def write(self, response: requests.Response) -> None:
+        """
+        応答を記録する。記録に失敗しても取得の処理は止めない。
+
+        Parameters
+        ----------
+        response : requests.Response
+            情報源の応答
+        """
+        now = time.time()
+        record = {
+            "t": now,
+            "source": self.source,
+            "region": self.region,
+            "status": response.status_code,
+            "body": response.text,
+        }
+        line = json.dumps(record, ensure_ascii=False).encode() + b"\n"
+        try:
+            with self._lock:
+                path = self.path(now)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "ab") as f:
+                    f.write(gzip.compress(line))
+        except OSError:
+            logger.error("Failed to capture a source response", exc_info=True)
+
+
+@lru_cache(maxsize=None)
+def get_capture_writer(source: str, region: str) -> CaptureWriter | None:
+    """
+    情報源と地域ごとの記録先を取得する。SOURCE_CAPTURE_DIRが未設定の場合は記録しない。
+
+    Parameters
+    ----------
+    source : str
+        情報源のクラス名
+    region : str
+        地域
+
+    Returns
+    -------
+    CaptureWriter | None
+        記録先。記録しない場合はNone
+    """
+    directory = os.getenv("SOURCE_CAPTURE_DIR")
+    if not directory:
+        return None
+    logger.info(f"Capturing {source} responses for {region} to {directory}")
+    return CaptureWriter(directory, source, region)
+
+
+def _read_file(path: str | Path) -> Iterator[CapturedResponse]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                yield CapturedResponse(
+                    timestamp=record["t"],
+                    source=record["source"],
+                    region=record["region"],
+                    status=record["status"],
+                    body=record["body"],
+                )
+        except (EOFError, zlib.error):
+            logger.warning(f"Capture file is truncated: {path}")
+
+
+def read_capture(paths: Iterable[str | Path]) -> Iterator[CapturedResponse]:
+    """
+    記録したファイルを読み出す。
+
+    複数のファイルは記録した時刻の順に合わせて読み出すため、同じ地域の情報源ごとの
+    ファイルを渡すと、本番で取得した順に並ぶ。書き込み中に途切れた末尾は読み飛ばす。
+
+    Parameters
+    ----------
+    paths : Iterable[str | Path]
+        記録したファイル
+
+    Yields
+    ------
+    CapturedResponse
+        記録した応答
+    """
+    yield from heapq.merge(
+        *(_read_file(path) for path in paths), key=lambda r: r.timestamp
+    )
@@ -0,0 +1,152 @@
+import json
+import os
+from collections.abc import Callable
+from typing import Any, TypedDict
+
+from utils.make_logger import make_logger
+
+logger = make_logger(__name__)
+
+DECODER_BACKENDS = ("msgspec", "orjson", "json")
+
+
+# 解析に使うフィールドのみを定義する。msgspecではこれ以外のフィールドを読み飛ばす
+class NHKItem(TypedDict, total=False):
+    trainLine: str
+    detailStatusCode: str
+    detailStatusName: str
+    textLong: str
+
+
+class NHKChannel(TypedDict, total=False):
+    item: list[NHKItem]
+    itemLong: list[NHKItem]
+
+
+class NHKPayload(TypedDict, total=False):
+    channel: NHKChannel
+
+
+class YahooDiainfo(TypedDict, total=False):
+    status: str
+    message: str
+
+
+class YahooProperty(TypedDict, total=False):
+    displayName: str
+    diainfo: list[YahooDiainfo]
+
+
+class YahooRouteInfo(TypedDict, total=False):
+    property: YahooProperty
+
+
+class YahooFeature(TypedDict, total=False):
+    routeInfo: YahooRouteInfo
+
+
+class YahooPayload(TypedDict, total=False):
+    feature: list[YahooFeature]
+
+
+def _load(backend: str) -> Callable[[bytes], Any] | None:
+    try:
+        match backend:
+            case "msgspec":
+                import msgspec  # type: ignore[import-not-found]
+
+                return msgspec.json.decode
+            case "orjson":
+                import orjson  # type: ignore[import-not-found]
+
+                return orjson.loads
+    except ImportError:
+        return None
+    return json.loads
+
+
+def available_backends() -> list[str]:
+    """
+    インストールされている実装を、autoで選ぶ順に返す
+    """
+    return [name for name in DECODER_BACKENDS if _load(name) is not None]
+
+
+class JSONDecoder:
+    """
+    情報源の応答をバイト列から直接デコードする
+
+    JSON_DECODERで実装を選ぶ。"auto"（既定）の場合はmsgspec, orjson, jsonの順に
+    インストールされているものを使う。msgspecではschemaに定義したフィールドのみを
+    取り出すため、使わないフィールドの辞書を作らずに済む。
+    応答がschemaと合わない場合は警告を出し、以降はschemaを使わずにデコードする。
+
+    Attributes
+    ----------
+    backend : str
+        使用している実装。"msgspec", "orjson", "json"のいずれか
+    schema : type | None
+        msgspecで使うTypedDict
+    """
+
+    def __init__(self, schema: type | None = None, backend: str | None = None) -> None:
+        requested = (backend or os.getenv("JSON_DECODER") or "auto").lower()
+        if requested != "auto" and requested not in DECODER_BACKENDS:
+            raise ValueError(f"Unknown JSON decoder: {requested}")
+
+        candidates = DECODER_BACKENDS if requested == "auto" else (requested, "json")
+        for name in candidates:
+            decode = _load(name)
+            if decode is not None:
+                break
+            if name == requested:
+                logger.warning(f"{name} is not installed. Falling back to json")
+        assert decode is not None
+
+        self.backend = name
+        self.schema = schema
+        self._decode = decode
+        self._typed: Callable[[bytes], Any] | None = None
+        self._schema_error: type[Exception] = ValueError
+        # json.JSONDecodeErrorを継承しない実装のエラー。ValueErrorに変換して送出する
+        self._decode_errors: tuple[type[Exception], ...] = ()
+        if name == "msgspec":
+            import msgspec  # type: ignore[import-not-found]
+
+            self._decode_errors = (msgspec.DecodeError,)
+            if schema is not None:
+                self._typed = msgspec.json.Decoder(schema).decode
+                self._schema_error = msgspec.ValidationError
+
+    def decode(self, data: bytes) -> Any:
+        """
+        JSONをデコードする。
+
+        Parameters
+        ----------
+        data : bytes
+            応答の本文
+
+        Returns
+        -------
+        Any
+            デコードした値
+
+        Raises
+        ------
+        ValueError
+            JSONとして不正な場合。実装によらずValueError（jsonとorjsonではJSONDecodeError）を送出する
+        """
+        try:
+            if self._typed is not None:
+                try:
+                    return self._typed(data)
+                except self._schema_error as e:
+                    name = getattr(self.schema, "__name__", self.schema)
+                    logger.warning(
+                        f"Response does not match {name}. Decoding without the schema: {e}"
+                    )
+                    self._typed = None
+            return self._decode(data)
+        except self._decode_errors as e:
+            raise ValueError(f"Invalid JSON ({self.backend}): {e}") from e
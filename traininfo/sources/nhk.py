@@ -7,10 +7,12 @@ from enums import Region
 from ..normalizer import status_normalizer
 from ..trainstatus import TrainStatus
 from .baseclient import BaseTrainInfoClient
+from .decoder import NHKPayload
 
 
 class NHKClient(BaseTrainInfoClient):
     ROOT = "https://www.nhk.or.jp"
+    SCHEMA = NHKPayload
     TRAININFO_ENDPOINT = "/n-data/traffic/train/traininfo_area_0{}.json"
 
     def __init__(
@@ -34,9 +36,10 @@ class NHKClient(BaseTrainInfoClient):
             self.ROOT + self.TRAININFO_ENDPOINT.format(self.region.id),
             timeout=self.timeout,
         )
+        self._capture(r)
         r.raise_for_status()
 
-        return r.json()
+        return self._decode(r.content)
 
     def _parse(self, raw: Any) -> tuple[TrainStatus, ...]:
         channel = raw.get("channel", {})
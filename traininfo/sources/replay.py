@@ -0,0 +1,146 @@
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import requests
+
+from enums import Region
+
+from ..trainstatus import TrainStatus
+from .baseclient import BaseTrainInfoClient, TrainInfoResponse
+from .capture import CapturedResponse, read_capture
+from .nhk import NHKClient
+from .yahoo import YahooClient
+
+
+def find_captures(
+    directory: str | Path, source: str = "*", region: str = "*"
+) -> list[Path]:
+    """
+    記録したファイルを探す。
+
+    Parameters
+    ----------
+    directory : str | Path
+        SOURCE_CAPTURE_DIRに指定したディレクトリ
+    source : str, optional
+        情報源のクラス名, by default "*"
+    region : str, optional
+        地域, by default "*"
+
+    Returns
+    -------
+    list[Path]
+        記録したファイル
+    """
+    return sorted(Path(directory).glob(f"{source}-{region}-*.jsonl.gz"))
+
+
+class ReplayClient(BaseTrainInfoClient):
+    """
+    記録した応答を順に返す情報源
+
+    記録時の間隔を保って再生するほか、speedを指定して早送りできる。
+    デコードと解析は記録した情報源のクライアントに任せるため、通信以外は本番と同じ処理になる。
+
+    Attributes
+    ----------
+    paths : list[Path]
+        再生するファイル
+    speed : float | None
+        再生速度の倍率。Noneの場合は待たずに次の応答を返す
+    loop : bool
+        最後まで再生したら最初に戻るか
+    replayed : int
+        再生した応答の数
+    """
+
+    PARSERS: dict[str, type[BaseTrainInfoClient]] = {
+        "NHKClient": NHKClient,
+        "YahooClient": YahooClient,
+    }
+
+    def __init__(
+        self,
+        session: requests.Session,
+        region: Region,
+        paths: Iterable[str | Path],
+        speed: float | None = None,
+        loop: bool = False,
+        timeout: int = 10,
+        retry_sleep: float = 1.0,
+        retry_times: int = 3,
+    ):
+        super().__init__(
+            session=session,
+            region=region,
+            timeout=timeout,
+            retry_sleep=retry_sleep,
+            retry_times=retry_times,
+        )
+        self.paths = [Path(p) for p in paths]
+        self.speed = speed
+        self.loop = loop
+        self.replayed = 0
+        self._parsers: dict[str, BaseTrainInfoClient] = {}
+        self._records = read_capture(self.paths)
+        self._pending = next(self._records, None)
+        # 再生を始めた応答の記録時刻と、そのときの時刻
+        self._origin: tuple[float, float] | None = None
+
+    @property
+    def exhausted(self) -> bool:
+        return self._pending is None
+
+    def request(self) -> TrainInfoResponse:
+        if self.exhausted:
+            return TrainInfoResponse(
+                is_success=False, data=None, error="Capture is exhausted."
+            )
+        return super().request()
+
+    def _next_record(self) -> CapturedResponse:
+        record = self._pending
+        if record is None:
+            raise EOFError("Capture is exhausted")
+        self._pending = next(self._records, None)
+        if self._pending is None and self.loop:
+            self._records = read_capture(self.paths)
+            self._pending = next(self._records, None)
+        return record
+
+    def _wait(self, timestamp: float) -> None:
+        if not self.speed:
+            return
+        now = time.monotonic()
+        # 最初の応答と、繰り返して先頭に戻ったときは待たずに返す
+        if self._origin is None or timestamp < self._origin[0]:
+            self._origin = (timestamp, now)
+            return
+        captured_at, started_at = self._origin
+        delay = started_at + (timestamp - captured_at) / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _parser(self, source: str) -> BaseTrainInfoClient:
+        parser = self._parsers.get(source)
+        if parser is None:
+            if source not in self.PARSERS:
+                raise ValueError(f"Unknown capture source: {source}")
+            parser = self.PARSERS[source](session=self.session, region=self.region)
+            self._parsers[source] = parser
+        return parser
+
+    def _fetch(self) -> Any:
+        record = self._next_record()
+        self._wait(record.timestamp)
+        self.replayed += 1
+        r = record.to_response()
+        r.raise_for_status()
+        parser = self._parser(record.source)
+        return parser, parser._decode(r.content)
+
+    def _parse(self, raw: Any) -> tuple[TrainStatus, ...]:
+        parser, data = raw
+        return parser._parse(data)
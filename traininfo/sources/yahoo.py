@@ -7,10 +7,12 @@ from enums import Region
 from ..normalizer import status_normalizer
 from ..trainstatus import TrainStatus
 from .baseclient import BaseTrainInfoClient
+from .decoder import YahooPayload
 
 
 class YahooClient(BaseTrainInfoClient):
     ROOT = "https://cache-diainfo-transit.yahooapis.jp/"
+    SCHEMA = YahooPayload
     TRAININFO_ENDPOINT = "/v4/diainfo/train"
 
     def __init__(
@@ -53,8 +55,9 @@ class YahooClient(BaseTrainInfoClient):
             headers=headers,
         )
 
+        self._capture(r)
         r.raise_for_status()
-        return r.json()
+        return self._decode(r.content)
 
     def _parse(self, raw: Any) -> tuple[TrainStatus, ...]:
         features = raw.get("feature", [])
@@ -0,0 +1,46 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+STATUS_FILE = Path(__file__).parent / "status.yaml"
+
+
+@lru_cache(maxsize=1)
+def load_statuses() -> dict[str, dict[str, Any]]:
+    """
+    status.yamlを読み込む。初回の呼び出し時に一度だけ解析し、以降はキャッシュを返す。
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        ステータスの定義
+    """
+    import yaml
+
+    with open(STATUS_FILE, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return data.get("statuses", {})
+
+
+@lru_cache(maxsize=1)
+def status_emoji() -> dict[str, str]:
+    """
+    運行状況と絵文字の対応を取得する。
+    """
+    return {
+        item["label"]: item.get("emoji", "")
+        for item in load_statuses().values()
+        if item.get("label")
+    }
+
+
+@lru_cache(maxsize=1)
+def nhk_code_to_label() -> dict[str, str]:
+    """
+    NHKの運行状況コードと運行状況の対応を取得する。
+    """
+    return {
+        code: v["label"]
+        for v in load_statuses().values()
+        for code in v.get("NHK_code", [])
+    }
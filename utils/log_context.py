@@ -0,0 +1,106 @@
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import Filter, LogRecord
+from time import perf_counter
+from typing import Any
+
+CONTEXT_FIELDS = ("cycle_id", "region", "service")
+TIMING_FIELDS = ("fetch_ms", "parse_ms", "redis_ms", "diff_ms", "post_ms")
+
+_cycle_id: ContextVar[str | None] = ContextVar("cycle_id", default=None)
+_region: ContextVar[str | None] = ContextVar("region", default=None)
+_service: ContextVar[str | None] = ContextVar("service", default=None)
+_timings: ContextVar[dict[str, float] | None] = ContextVar("timings", default=None)
+
+_VARS = {"cycle_id": _cycle_id, "region": _region, "service": _service}
+
+
+@contextmanager
+def log_context(**fields: str | None) -> Iterator[None]:
+    """
+    ブロック内のログにcycle_id, region, serviceを付与する。
+
+    Parameters
+    ----------
+    **fields : str | None
+        付与する値。CONTEXT_FIELDSのいずれか
+    """
+    tokens = [(_VARS[name], _VARS[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+@contextmanager
+def cycle(region: str) -> Iterator[str]:
+    """
+    新しいサイクルを開始する。ブロック内のログには新しいcycle_idとregionが付与され、
+    ステージの計測時間はこのサイクルに記録される。
+
+    Parameters
+    ----------
+    region : str
+        地域
+
+    Yields
+    ------
+    str
+        サイクルID
+    """
+    cycle_id = os.urandom(6).hex()
+    token = _timings.set({})
+    try:
+        with log_context(cycle_id=cycle_id, region=region):
+            yield cycle_id
+    finally:
+        _timings.reset(token)
+
+
+def add_timing(field: str, ms: float) -> None:
+    """
+    現在のサイクルにステージの計測時間を加算する。サイクル外では何もしない。
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings[field] = timings.get(field, 0.0) + ms
+
+
+@contextmanager
+def timed(field: str) -> Iterator[None]:
+    """
+    ブロックの実行時間を計測し、現在のサイクルに加算する。
+    """
+    started_at = perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(field, (perf_counter() - started_at) * 1000)
+
+
+def cycle_timings() -> dict[str, Any]:
+    """
+    現在のサイクルの計測時間を、ログのextraに渡せる形で取得する。
+
+    Examples
+    --------
+    >>> logger.info("Processed post job", extra=cycle_timings())
+    """
+    return {"timings": dict(_timings.get() or {})}
+
+
+class LogContextFilter(Filter):
+    """
+    現在のコンテキストの値をログレコードに付与するフィルタ。
+    非同期ログでは呼び出し元のスレッドで付与した値を上書きしない。
+    """
+
+    def filter(self, record: LogRecord) -> bool:
+        if not hasattr(record, "cycle_id"):
+            record.cycle_id = _cycle_id.get()
+            record.region = _region.get()
+            record.service = _service.get()
+        return True
@@ -1,16 +1,561 @@
+import atexit
+import copy
+import gzip
+import json
 import os
-from logging import DEBUG, FileHandler, Formatter, getLogger
+import queue
+import shutil
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from logging import (
+    DEBUG,
+    ERROR,
+    FileHandler,
+    Formatter,
+    Handler,
+    Logger,
+    LogRecord,
+    getLogger,
+)
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from threading import Lock, Thread
 
-from rich.logging import RichHandler
+from utils.log_context import CONTEXT_FIELDS, LogContextFilter
+from utils.metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windowsではプロセス間の排他を行わない
+    fcntl = None  # type: ignore[assignment]
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(os.path.join(__file__, "..")))
 LOG_DIR = os.path.join(PROJECT_ROOT, "logs")
 LOG_FILE_PATH = os.path.join(LOG_DIR, "output.log")
 
+RICH_FORMAT = "[magenta]%(name)s[/magenta] %(message)s"
+FILE_FORMAT = "%(asctime)s %(levelname)s %(name)s - %(message)s"
+
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def list_log_segments(path: str | None = None) -> list[str]:
+    """
+    ローテーション済みのログファイルを新しい順に取得する。
+
+    Parameters
+    ----------
+    path : str | None, optional
+        現在のログファイルのパス, by default LOG_FILE_PATH
+
+    Returns
+    -------
+    list[str]
+        ローテーション済みのログファイルのパス。現在のログファイルは含まない
+    """
+    path = path or LOG_FILE_PATH
+    directory, base = os.path.split(path)
+    if not os.path.isdir(directory):
+        return []
+
+    segments = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(base + ".") and not name.endswith(".tmp")
+    ]
+    # ファイル名の日時部分で並べる。圧縮の有無には依存しない
+    return sorted(segments, key=lambda p: p.removesuffix(".gz"), reverse=True)
+
+
+class DeferredRichHandler(Handler):
+    """
+    最初のログ出力時にRichHandlerを作成するハンドラ。
+    richの読み込みとコンソールの初期化を、ログを出力するまで遅らせる。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._handler: Handler | None = None
+
+    def emit(self, record: LogRecord) -> None:
+        # Handler.handleがロックを保持した状態で呼ぶため、作成は一度だけ行われる
+        if self._handler is None:
+            from rich.logging import RichHandler
+
+            self._handler = RichHandler(
+                rich_tracebacks=True,
+                markup=True,
+                show_path=False,
+            )
+            self._handler.setFormatter(self.formatter)
+        self._handler.emit(record)
+
+
+class JsonFormatter(Formatter):
+    """
+    ログを1行のJSONとして出力するフォーマッタ。
+    コンテキストの値(cycle_id, region, service)と、extraで渡された計測時間を含める。
+    """
+
+    def format(self, record: LogRecord) -> str:
+        data: dict[str, object] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+
+        timings = getattr(record, "timings", None)
+        if timings:
+            data.update({name: round(ms, 1) for name, ms in timings.items()})
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BatchingFileHandler(FileHandler):
+    """
+    書き込みのたびにはflushせず、一定件数または一定時間ごとにまとめてflushするFileHandler。
+    force_flushで即座にflushできる。
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        flush_every: int = 100,
+        flush_interval: float = 1.0,
+        encoding: str = "utf-8",
+    ) -> None:
+        super().__init__(filename, mode="a", encoding=encoding)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        self._pending += 1
+        if (
+            self._pending >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.force_flush()
+
+    def force_flush(self) -> None:
+        if self._pending:
+            super().flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            self.force_flush()
+        finally:
+            self.release()
+        super().close()
+
+
+class RotatingLogHandler(BatchingFileHandler):
+    """
+    サイズまたは経過時間でログファイルをローテーションするハンドラ。
+    ローテーションしたファイルはバックグラウンドでgzip圧縮し、古いものから削除する。
+    WORKER_PROCESSESで複数のプロセスが同じファイルに書き込むため、
+    ローテーションはロックファイルでプロセス間で排他し、他のプロセスが済ませていれば開き直すのみとする。
+
+    Attributes
+    ----------
+    max_bytes : int
+        ローテーションするファイルサイズ。0の場合はサイズでローテーションしない
+    interval : float
+        ローテーションする間隔（秒）。0の場合は時間でローテーションしない
+    backup_count : int
+        保持するローテーション済みファイルの数
+    rotations : int
+        ローテーションした回数
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        interval: float = 86400,
+        backup_count: int = 7,
+        flush_every: int = 1,
+        flush_interval: float = 1.0,
+    ) -> None:
+        super().__init__(filename, flush_every, flush_interval)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.rotations = 0
+        self._opened_at = time.time()
+        self._checked_at = time.monotonic()
+        self._compressor: Thread | None = None
+        directory, base = os.path.split(self.baseFilename)
+        # ローテーション済みのファイルとして扱われないよう、ファイル名を"."で始める
+        self._lock_path = os.path.join(directory, f".{base}.lock")
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            self._reopen_if_moved()
+            if self.should_rollover():
+                self.do_rollover()
+        except Exception:
+            self.handleError(record)
+        super().emit(record)
+
+    def should_rollover(self) -> bool:
+        if self.interval and time.time() - self._opened_at >= self.interval:
+            return self._size() > 0
+        return bool(self.max_bytes) and self._size() >= self.max_bytes
+
+    def _reopen_if_moved(self) -> None:
+        # 他のワーカープロセスがローテーションした場合に、新しいファイルを開き直す。
+        # statの負荷を抑えるため、確認は1秒に1回までとする
+        now = time.monotonic()
+        if self.stream is None or now - self._checked_at < 1:
+            return
+        self._checked_at = now
+        try:
+            moved = not os.path.samestat(
+                os.stat(self.baseFilename), os.fstat(self.stream.fileno())
+            )
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.force_flush()
+            self.stream.close()
+            self.stream = self._open()
+            self._opened_at = time.time()
+
+    def _size(self) -> int:
+        if self.stream is None:
+            return 0
+        return self.stream.tell()
+
+    @contextmanager
+    def _rotation_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def do_rollover(self) -> None:
+        with self._rotation_lock():
+            current = None
+            if self.stream is not None:
+                self.force_flush()
+                current = os.fstat(self.stream.fileno())
+                self.stream.close()
+                self.stream = None  # type: ignore[assignment]
+
+            try:
+                latest = os.stat(self.baseFilename)
+            except FileNotFoundError:
+                latest = None
+            # ロックを待つ間に他のプロセスがローテーションしていれば、新しいファイルを開くのみ
+            rotated = (
+                latest is not None
+                and current is not None
+                and not os.path.samestat(latest, current)
+            )
+            if latest is not None and not rotated:
+                os.rename(self.baseFilename, self._segment_path())
+                self.rotations += 1
+            self.stream = self._open()
+            self._opened_at = time.time()
+        self._start_compressor()
+
+    def _segment_path(self) -> str:
+        path = f"{self.baseFilename}.{datetime.now().strftime(SEGMENT_TIME_FORMAT)}"
+        candidate, i = path, 1
+        while os.path.exists(candidate) or os.path.exists(candidate + ".gz"):
+            candidate = f"{path}-{i}"
+            i += 1
+        return candidate
+
+    def _start_compressor(self) -> None:
+        # 前回の圧縮が終わっていなければ、その完了後に残りもまとめて処理される
+        if self._compressor is not None and self._compressor.is_alive():
+            return
+        self._compressor = Thread(target=self.compress_segments, daemon=True)
+        self._compressor.start()
+
+    def compress_segments(self) -> None:
+        """
+        未圧縮のローテーション済みファイルを圧縮し、保持数を超えたものを削除する。
+        """
+        for path in list_log_segments(self.baseFilename):
+            if path.endswith(".gz"):
+                continue
+            # 他のプロセスが同じファイルを圧縮していても壊れないよう、一時ファイルは固有の名前にする
+            directory, name = os.path.split(path)
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(
+                    suffix=".gz.tmp", prefix=name + ".", dir=directory
+                )
+                os.close(fd)
+                with open(path, "rb") as src, gzip.open(tmp, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp, path + ".gz")
+                os.remove(path)
+            except OSError:
+                pass
+            finally:
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+
+        for path in list_log_segments(self.baseFilename)[self.backup_count :]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def join_compressor(self, timeout: float | None = None) -> None:
+        if self._compressor is not None:
+            self._compressor.join(timeout)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    有界キューにログを積むハンドラ。キューが満杯の場合はログを破棄して件数を数える。
+    ERROR以上のログは破棄する前に一定時間だけ空きを待つ。
+    """
 
-def clear_log_file():
-    if os.path.exists(LOG_FILE_PATH):
-        os.remove(LOG_FILE_PATH)
+    queue: "Queue[LogRecord]"
+
+    def __init__(self, q: Queue, error_timeout: float = 0.5) -> None:
+        super().__init__(q)
+        self.error_timeout = error_timeout
+        self.dropped = 0
+        self._dropped_lock = Lock()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # 整形はリスナー側で行う。引数のみ展開し、例外情報はrichで表示するため残す
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            if record.levelno >= ERROR:
+                self.queue.put(record, timeout=self.error_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    キューが空になった時点で、バッファされたファイル書き込みをflushするリスナー
+    """
+
+    queue: "Queue[LogRecord]"
+
+    def dequeue(self, block: bool) -> LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                if isinstance(handler, BatchingFileHandler):
+                    handler.acquire()
+                    try:
+                        handler.force_flush()
+                    finally:
+                        handler.release()
+            return self.queue.get(block)
+
+    def enqueue_sentinel(self) -> None:
+        # キューが満杯でも確実に停止できるよう、空きを待って積む
+        self.queue.put(self._sentinel)  # type: ignore[attr-defined]
+
+
+def _create_rich_handler() -> Handler:
+    handler = DeferredRichHandler()
+    handler.setFormatter(Formatter(RICH_FORMAT))
+    return handler
+
+
+_loggers: set[str] = set()
+_file_handler: RotatingLogHandler | None = None
+_file_handler_lock = Lock()
+_queue_handler: DroppingQueueHandler | None = None
+_listener: BatchingQueueListener | None = None
+_async_lock = Lock()
+
+
+def _get_file_handler() -> RotatingLogHandler:
+    # ローテーションを正しく行うため、ファイルハンドラはプロセス内で共有する
+    global _file_handler
+    with _file_handler_lock:
+        if _file_handler is None:
+            os.makedirs(os.path.dirname(LOG_FILE_PATH), exist_ok=True)
+            _file_handler = RotatingLogHandler(LOG_FILE_PATH)
+            _file_handler.setFormatter(Formatter(FILE_FORMAT))
+            _file_handler.addFilter(LogContextFilter())
+        return _file_handler
+
+
+def configure_log_format(log_format: str | None = None) -> None:
+    """
+    ファイルに出力するログの形式を変更する。
+
+    Parameters
+    ----------
+    log_format : str | None, optional
+        "text"または"json"。指定しない場合は環境変数LOG_FORMATから読み込む, by default "text"
+    """
+    log_format = (log_format or os.getenv("LOG_FORMAT") or "text").lower()
+    if log_format not in ("text", "json"):
+        raise ValueError(f"Unknown log format: {log_format}")
+
+    handler = _get_file_handler()
+    handler.setFormatter(
+        JsonFormatter() if log_format == "json" else Formatter(FILE_FORMAT)
+    )
+
+
+def configure_log_rotation(
+    max_bytes: int | None = None,
+    interval: float | None = None,
+    backup_count: int | None = None,
+) -> None:
+    """
+    ログのローテーション設定を変更する。
+    指定しなかった値は環境変数LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNTから読み込む。
+
+    Parameters
+    ----------
+    max_bytes : int | None, optional
+        ローテーションするファイルサイズ, by default 10MiB
+    interval : float | None, optional
+        ローテーションする間隔（秒）, by default 86400
+    backup_count : int | None, optional
+        保持するローテーション済みファイルの数, by default 7
+    """
+    handler = _get_file_handler()
+    handler.max_bytes = (
+        max_bytes
+        if max_bytes is not None
+        else int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    )
+    handler.interval = (
+        interval
+        if interval is not None
+        else float(os.getenv("LOG_ROTATE_INTERVAL", "86400"))
+    )
+    handler.backup_count = (
+        backup_count
+        if backup_count is not None
+        else int(os.getenv("LOG_BACKUP_COUNT", "7"))
+    )
+
+
+def enable_async_logging(maxsize: int = 10000) -> None:
+    """
+    非同期ログを有効にする。
+    すべてのロガーはログを有界キューに積むだけになり、richとファイルへの出力は
+    バックグラウンドの単一のリスナーが行う。作成済みのロガーも切り替える。
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        キューの最大件数。超えた分のログは破棄される, by default 10000
+    """
+    global _queue_handler, _listener
+    with _async_lock:
+        if _queue_handler is not None:
+            return
+
+        file_handler = _get_file_handler()
+        file_handler.flush_every = 100
+
+        q: queue.Queue = queue.Queue(maxsize=maxsize)
+        _queue_handler = DroppingQueueHandler(q)
+        # コンテキストは呼び出し元のスレッドで付与する必要がある
+        _queue_handler.addFilter(LogContextFilter())
+        _listener = BatchingQueueListener(
+            q,
+            _create_rich_handler(),
+            file_handler,
+            respect_handler_level=True,
+        )
+        _listener.start()
+        atexit.register(disable_async_logging)
+
+        for name in _loggers:
+            _attach_handlers(getLogger(name))
+
+
+def disable_async_logging() -> None:
+    """
+    非同期ログを無効にする。キューに残ったログを出力してからリスナーを停止する。
+    """
+    global _queue_handler, _listener
+    with _async_lock:
+        if _queue_handler is None or _listener is None:
+            return
+
+        _listener.stop()
+        file_handler = _get_file_handler()
+        with file_handler.lock:  # type: ignore[union-attr]
+            file_handler.force_flush()
+        file_handler.flush_every = 1
+        _queue_handler = None
+        _listener = None
+
+        for name in _loggers:
+            _attach_handlers(getLogger(name))
+
+
+def get_dropped_records() -> int:
+    """
+    キューが満杯で破棄されたログの件数を取得する。
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+REGISTRY.register_callback(
+    "traininfo_log_records_dropped_total",
+    "Log records dropped because the async logging queue was full",
+    "counter",
+    lambda: [({}, get_dropped_records())],
+)
+
+
+def _attach_handlers(logger: Logger) -> None:
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    if _queue_handler is not None:
+        logger.addHandler(_queue_handler)
+        return
+
+    logger.addHandler(_create_rich_handler())
+    logger.addHandler(_get_file_handler())
 
 
 def make_logger(name: str, context: str | None = None):
@@ -21,20 +566,8 @@ def make_logger(name: str, context: str | None = None):
     logger.setLevel(DEBUG)
 
     if not logger.handlers:
-        os.makedirs(os.path.dirname(LOG_FILE_PATH), exist_ok=True)
-        rich_handler = RichHandler(
-            rich_tracebacks=True,
-            markup=True,
-            show_path=False,
-        )
-        rich_formatter = Formatter("[magenta]%(name)s[/magenta] %(message)s")
-        rich_handler.setFormatter(rich_formatter)
-        logger.addHandler(rich_handler)
-
-        file_handler = FileHandler(LOG_FILE_PATH, mode="a", encoding="utf-8")
-        file_formatter = Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s")
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        _loggers.add(name)
+        _attach_handlers(logger)
 
     return logger
 
@@ -0,0 +1,270 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (ラベル, 値)の組を返す関数。出力時にのみ呼ばれる
+Sample = tuple[dict[str, str], float]
+Callback = Callable[[], Iterable[Sample]]
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = Lock()
+
+    def labels(self, *values: str):
+        """
+        ラベルの値に対応する系列を取得する。一度作成した系列はキャッシュする。
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {values}"
+                )
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> object:
+        """
+        ラベルの値ごとの系列を作成する
+        """
+        pass
+
+    def _items(self) -> list[tuple[dict[str, str], object]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.labelnames, k)), child) for k, child in children]
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self._render_samples()
+
+    def _render_samples(self) -> Iterator[str]:
+        for labels, child in self._items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"  # type: ignore[attr-defined]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    """
+    単調増加する値。labels(...).inc()で加算する
+    """
+
+    type_name = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+
+class Gauge(_Metric):
+    """
+    増減する値。labels(...).set()で設定する
+    """
+
+    type_name = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """
+        ブロックの実行時間（秒）を記録する
+        """
+        started_at = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started_at)
+
+
+class Histogram(_Metric):
+    """
+    値の分布。labels(...).observe()で記録する
+
+    Attributes
+    ----------
+    buckets : tuple[float, ...]
+        バケットの上限値（昇順）
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _render_samples(self) -> Iterator[str]:
+        for labels, child in self._items():
+            assert isinstance(child, _HistogramValue)
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+class _CallbackMetric:
+    def __init__(self, name: str, help: str, type_name: str, callback: Callback):
+        self.name = name
+        self.help = help
+        self.type_name = type_name
+        self.callback = callback
+
+    def render(self) -> Iterator[str]:
+        # 値の取得に失敗しても、他のメトリクスの出力は続ける
+        try:
+            samples = list(self.callback())
+        except Exception:
+            samples = []
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        for labels, value in samples:
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Registry:
+    """
+    メトリクスを登録し、Prometheusのテキスト形式で出力する
+
+    Methods
+    -------
+    counter(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter
+        カウンタを取得する。未登録の場合は作成する
+    gauge(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge
+        ゲージを取得する。未登録の場合は作成する
+    histogram(name: str, help: str, labelnames: tuple[str, ...] = (), buckets=...) -> Histogram
+        ヒストグラムを取得する。未登録の場合は作成する
+    register_callback(name: str, help: str, type_name: str, callback: Callback) -> None
+        出力時に値を取得するメトリクスを登録する。既存の統計値を公開するのに使う
+    render() -> str
+        すべてのメトリクスをPrometheusのテキスト形式で出力する
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric | _CallbackMetric] = {}
+        self._lock = Lock()
+
+    def _get_or_create(self, cls: type[_Metric], name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered")
+            return metric
+
+    def counter(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def register_callback(
+        self, name: str, help: str, type_name: str, callback: Callback
+    ) -> None:
+        with self._lock:
+            self._metrics[name] = _CallbackMetric(name, help, type_name, callback)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
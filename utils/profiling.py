@@ -0,0 +1,317 @@
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import traceback
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections import Counter
+from threading import Event, Lock, Thread, Timer
+from time import monotonic
+from types import FrameType
+from typing import Any
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+
+class ProfileSession(ABC):
+    """
+    次のNサイクルを計測するセッション
+
+    計測はセッションの開始から、cycle_finishedがcycles回呼ばれるかtimeout秒が経過するまで行う。
+    セッションがない間は何も計測しないため、オーバーヘッドはない。
+
+    Attributes
+    ----------
+    mode : str
+        計測方法
+    cycles : int
+        計測するサイクル数
+    completed : int
+        計測を終えたサイクル数
+    done : Event
+        計測が終了したときにセットされる
+    """
+
+    mode = ""
+
+    def __init__(self, cycles: int, timeout: float) -> None:
+        self.cycles = cycles
+        self.completed = 0
+        self.started_at = monotonic()
+        self.finished_at: float | None = None
+        self.done = Event()
+        self._lock = Lock()
+        self._timer = Timer(timeout, self.finish)
+        self._timer.daemon = True
+
+    def start(self) -> None:
+        self._start()
+        self._timer.start()
+
+    def cycle_finished(self) -> None:
+        with self._lock:
+            self.completed += 1
+            if self.completed < self.cycles:
+                return
+        self.finish()
+
+    def finish(self) -> None:
+        with self._lock:
+            if self.done.is_set():
+                return
+            self._stop()
+            self.finished_at = monotonic()
+            self.done.set()
+        self._timer.cancel()
+
+    def status(self) -> dict[str, Any]:
+        end = self.finished_at or monotonic()
+        return {
+            "mode": self.mode,
+            "running": not self.done.is_set(),
+            "cycles": self.cycles,
+            "completed": self.completed,
+            "elapsed": round(end - self.started_at, 3),
+        }
+
+    @abstractmethod
+    def _start(self) -> None:
+        """
+        計測を開始する
+        """
+        pass
+
+    @abstractmethod
+    def _stop(self) -> None:
+        """
+        計測を終了する。セッションのロックを保持した状態で呼ばれる
+        """
+        pass
+
+
+class CProfileSession(ProfileSession):
+    """
+    cProfileで全スレッドの関数呼び出しを計測する
+
+    Python 3.12以降のcProfileはsys.monitoringを使うため、1つのプロファイラで
+    すべてのスレッドの呼び出しが記録される。
+    """
+
+    mode = "cprofile"
+
+    def __init__(self, cycles: int, timeout: float) -> None:
+        super().__init__(cycles, timeout)
+        self._profile = cProfile.Profile()
+
+    def _start(self) -> None:
+        self._profile.enable()
+
+    def _stop(self) -> None:
+        self._profile.disable()
+
+    def report(self, sort: str = "cumulative", limit: int = 50) -> str:
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self) -> bytes:
+        """
+        pstats.Stats.dump_statsと同じ形式で出力する。snakevizやflameprofで読み込める。
+        """
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)  # type: ignore[attr-defined]
+
+
+def _collapse(thread_name: str, frame: FrameType | None) -> str:
+    # 行番号ごとに分かれないよう、関数の定義位置で集計する
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class SamplingSession(ProfileSession):
+    """
+    一定間隔で全スレッドのスタックを採取する
+
+    結果はflamegraph.plやspeedscopeで読み込めるcollapsed stacks形式で出力する。
+    採取中のスレッド以外の実行は止めないため、cProfileより計測の影響が小さい。
+    """
+
+    mode = "sampling"
+
+    def __init__(self, cycles: int, timeout: float, interval: float = 0.005) -> None:
+        super().__init__(cycles, timeout)
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stopped = Event()
+        self._thread = Thread(target=self._sample, name="profiler", daemon=True)
+
+    def _start(self) -> None:
+        self._thread.start()
+
+    def _stop(self) -> None:
+        self._stopped.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self.samples[_collapse(names.get(ident, str(ident)), frame)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+
+_session: ProfileSession | None = None
+_session_lock = Lock()
+
+
+def start_session(
+    mode: str, cycles: int = 1, timeout: float = 3600.0, interval: float = 0.005
+) -> ProfileSession:
+    """
+    計測を開始する。
+
+    Parameters
+    ----------
+    mode : str
+        "cprofile"または"sampling"
+    cycles : int, optional
+        計測するサイクル数, by default 1
+    timeout : float, optional
+        サイクルが終わらない場合に計測を打ち切るまでの秒数, by default 3600.0
+    interval : float, optional
+        samplingでスタックを採取する間隔（秒）, by default 0.005
+
+    Returns
+    -------
+    ProfileSession
+        開始したセッション
+
+    Raises
+    ------
+    ValueError
+        未知の計測方法を指定した場合
+    RuntimeError
+        計測中のセッションがある場合
+    """
+    global _session
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    with _session_lock:
+        if _session is not None and not _session.done.is_set():
+            raise RuntimeError("A profile session is already running")
+        session: ProfileSession = (
+            CProfileSession(cycles, timeout)
+            if mode == "cprofile"
+            else SamplingSession(cycles, timeout, interval)
+        )
+        try:
+            session.start()
+        except ValueError as e:
+            # 他のプロファイラが有効な場合はcProfileを開始できない
+            raise RuntimeError(str(e)) from e
+        _session = session
+        return session
+
+
+def current_session() -> ProfileSession | None:
+    """
+    計測中または最後に終了したセッションを取得する
+    """
+    return _session
+
+
+def active_session() -> ProfileSession | None:
+    """
+    計測中のセッションを取得する
+    """
+    session = _session
+    if session is None or session.done.is_set():
+        return None
+    return session
+
+
+def thread_dump() -> str:
+    """
+    すべてのスレッドのスタックを文字列にする
+    """
+    threads = {t.ident: t for t in threading.enumerate()}
+    lines = []
+    for ident, frame in sys._current_frames().items():
+        thread = threads.get(ident)
+        name = thread.name if thread else "unknown"
+        daemon = " daemon" if thread is not None and thread.daemon else ""
+        lines.append(f'Thread "{name}" ({ident}){daemon}\n')
+        lines.extend(traceback.format_stack(frame))
+        lines.append("\n")
+    return "".join(lines)
+
+
+_baseline: tracemalloc.Snapshot | None = None
+
+
+def start_tracemalloc(frames: int = 1) -> None:
+    """
+    メモリ確保の追跡を開始し、比較の基準となるスナップショットを取る。
+    追跡中はメモリ確保ごとにオーバーヘッドがあるため、必要な間だけ有効にする。
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline = tracemalloc.take_snapshot()
+
+
+def stop_tracemalloc() -> None:
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+
+
+def tracemalloc_diff(limit: int = 20, key_type: str = "lineno") -> str:
+    """
+    基準のスナップショットからのメモリ使用量の差分を、増加量の大きい順に返す。
+
+    Parameters
+    ----------
+    limit : int, optional
+        出力する件数, by default 20
+    key_type : str, optional
+        集計の単位。"lineno", "filename", "traceback"のいずれか, by default "lineno"
+
+    Returns
+    -------
+    str
+        差分の一覧
+
+    Raises
+    ------
+    RuntimeError
+        追跡を開始していない場合
+    """
+    if _baseline is None or not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running")
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Current: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n"]
+    for stat in snapshot.compare_to(_baseline, key_type)[:limit]:
+        lines.append(f"{stat}\n")
+        if key_type == "traceback":
+            lines.extend(f"    {line}\n" for line in stat.traceback.format())
+    return "".join(lines)
@@ -0,0 +1,110 @@
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+
+from utils.make_logger import PROJECT_ROOT
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+@dataclass(frozen=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> list[ImportRecord]:
+    """
+    `python -X importtime`の出力を解析する。
+
+    Parameters
+    ----------
+    output : str
+        標準エラー出力の内容
+
+    Returns
+    -------
+    list[ImportRecord]
+        モジュールごとの読み込み時間
+    """
+    records = []
+    for line in output.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m is None:
+            continue
+        self_us, cumulative_us, indent, module = m.groups()
+        records.append(
+            ImportRecord(
+                module=module,
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+                depth=(len(indent) - 1) // 2,
+            )
+        )
+    return records
+
+
+def profile_imports(module: str = "main") -> list[ImportRecord]:
+    """
+    新しいインタプリタでモジュールを読み込み、各モジュールの読み込み時間を計測する。
+
+    Parameters
+    ----------
+    module : str, optional
+        計測するモジュール, by default "main"
+
+    Returns
+    -------
+    list[ImportRecord]
+        モジュールごとの読み込み時間
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def total_import_us(records: list[ImportRecord], module: str = "main") -> int:
+    """
+    指定したモジュールの累計読み込み時間（マイクロ秒）を取得する。
+    """
+    return next((r.cumulative_us for r in records if r.module == module), 0)
+
+
+def format_report(
+    records: list[ImportRecord], module: str = "main", top: int = 20
+) -> str:
+    """
+    読み込み時間の上位を表形式で整形する。
+
+    Parameters
+    ----------
+    records : list[ImportRecord]
+        モジュールごとの読み込み時間
+    module : str, optional
+        計測したモジュール, by default "main"
+    top : int, optional
+        表示する件数, by default 20
+
+    Returns
+    -------
+    str
+        整形したレポート
+    """
+    lines = [
+        f"Startup import time of '{module}': {total_import_us(records, module) / 1000:.1f} ms",
+        f"{'self [ms]':>10} {'cumulative [ms]':>16}  module",
+    ]
+    for r in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        lines.append(
+            f"{r.self_us / 1000:>10.1f} {r.cumulative_us / 1000:>16.1f}  "
+            f"{'  ' * r.depth}{r.module}"
+        )
+    return "\n".join(lines)